@@ -1,31 +1,133 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file, Response, g
+from flask import before_render_template, get_flashed_messages, has_request_context, message_flashed
+from flask import send_from_directory, template_rendered
 import os
-import json
+import hmac
+import time
+import asyncio
 from datetime import datetime, timedelta
-import requests
-import io
-import xlsxwriter
 from werkzeug.middleware.proxy_fix import ProxyFix
-from functools import lru_cache
-import threading
+
+from assets import StaticAssets
+from backends import create_backend
+from draw import DrawRecords, run_draw, seed_commitment
+from export import build_xlsx, export_rows, stream_csv
+from export_jobs import ExportJobs
+from geocache import GeoCache, quantize_coordinates
+from geofence import Geofence, parse_coordinates
+from geolocate import AsyncGeoClient, ThreadedGeoClient, first_conclusive
+from ingest import IngestQueue
+from ipdb import IPDatabase
+from metrics import Metrics
+from pagecache import PageCache
+from profiler import SlowRequestProfiler
+from providers import Provider, SharedRateLimiter
+from ratelimit import Limit, TokenBuckets, client_key, phone_prefix
+from storage import SORT_FIELDS, create_store, participant_city
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', os.urandom(24))
-app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 31536000  # 1 год для статических файлов
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = None  # срок кэширования статических файлов задаёт static_file
 
 # Настройка для работы за прокси-сервером
 app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1)
 
-# Путь к файлу данных
+# Статические файлы с отпечатками содержимого (собираются командой python assets.py в static/dist):
+# url_for('static', ...) возвращает адрес файла сборки, если он есть в манифесте.
+# Манифест читается в create_app(), а не при импорте модуля
+static_assets = None
+
+@app.url_defaults
+def static_url_defaults(endpoint, values):
+    if static_assets is not None:
+        static_assets.url_defaults(endpoint, values)
+
+@app.template_global('image_sources')
+def image_sources(filename):
+    return static_assets.sources(filename)
+
+# Срок кэширования файлов сборки: их адрес меняется вместе с содержимым
+STATIC_IMMUTABLE_MAX_AGE = 31536000
+
+def static_file(filename):
+    """Статический файл: из сборки - в варианте по Accept-Encoding/Accept и с кэшированием навсегда,
+    остальные - с проверкой актуальности при каждом использовании"""
+    selected = static_assets.select(filename, request.headers.get('Accept-Encoding'), request.headers.get('Accept'))
+    if selected is None:
+        response = send_from_directory(app.static_folder, filename)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    name, mimetype, encoding, vary = selected
+    response = send_from_directory(static_assets.dist_dir, name, mimetype=mimetype)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    if vary is not None:
+        response.vary.add(vary)
+    response.headers['Cache-Control'] = f'public, max-age={STATIC_IMMUTABLE_MAX_AGE}, immutable'
+    return response
+
+app.view_functions['static'] = static_file
+
+# Путь к файлу данных (старый формат, импортируется в журнал при первом запуске)
 DATA_FILE = os.environ.get('DATA_FILE', os.path.join(os.path.dirname(__file__), 'participants.json'))
 
-# Добавляем блокировку для безопасной работы с файлом данных при конкурентном доступе
-data_lock = threading.Lock()
+# Движок хранилища участников: 'log' - журнал с дозаписью, 'sqlite' - база SQLite с индексами
+STORAGE_ENGINE = os.environ.get('STORAGE_ENGINE', 'log')
+
+# Журнал участников с дозаписью (JSON Lines)
+PARTICIPANTS_LOG = os.environ.get('PARTICIPANTS_LOG', os.path.splitext(DATA_FILE)[0] + '.jsonl')
+
+# База SQLite с участниками
+PARTICIPANTS_DB = os.environ.get('PARTICIPANTS_DB', os.path.splitext(DATA_FILE)[0] + '.sqlite3')
+
+# Общий для всех воркеров gunicorn бэкенд: блокировки, счётчики версий и кэш геолокации.
+# 'sqlite' - база SQLite в режиме WAL, 'shm' - файл, отображённый в память
+SHARED_BACKEND = os.environ.get('SHARED_BACKEND', 'sqlite')
+SHARED_STATE_PATH = os.environ.get(
+    'SHARED_STATE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(DATA_FILE)),
+                 'shared_state.sqlite3' if SHARED_BACKEND == 'sqlite' else 'shared_state.bin')
+)
 
-# Создаем файл, если он не существует
-if not os.path.exists(DATA_FILE):
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump([], f)
+# Групповая запись регистраций: не больше INGEST_BATCH_SIZE записей в пачке; INGEST_MAX_DELAY_MS -
+# сколько миллисекунд дополнительно ждать наполнения пачки (0 - писать сразу всё накопившееся)
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', 64))
+INGEST_MAX_DELAY_MS = float(os.environ.get('INGEST_MAX_DELAY_MS', 0))
+
+# Метрики запросов (/metrics): каждый воркер сохраняет свои метрики в METRICS_DIR, ответ суммирует всех.
+# /metrics доступен администратору (сессия админ-панели) и по токену METRICS_TOKEN в заголовке
+# Authorization: Bearer <токен>; без METRICS_TOKEN сборщик метрик доступа не получает
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(os.path.dirname(os.path.abspath(DATA_FILE)), 'metrics'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Профилирование запросов дольше PROFILE_SLOW_REQUESTS_MS миллисекунд (0 - выключено);
+# профили сохраняются в PROFILE_DIR в свёрнутом формате для flamegraph
+PROFILE_SLOW_REQUESTS_MS = float(os.environ.get('PROFILE_SLOW_REQUESTS_MS', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(DATA_FILE)), 'profiles'))
+
+def current_route():
+    """Имя маршрута для меток метрик (имя представления, а не путь - чтобы не плодить метки)"""
+    if not has_request_context():
+        return 'background'
+    return request.endpoint or 'not_found'
+
+def stage(name):
+    """Замер этапа обработки запроса: app_stage_duration_seconds{route, stage}"""
+    return metrics.timer('app_stage_duration_seconds', route=current_route(), stage=name)
+
+# Ограничение частоты запросов: корзины токенов в общей для воркеров памяти (RATE_LIMIT_PATH).
+# Лимиты задаются строкой 'запросов в минуту/пачка подряд' ('0' - без ограничения) отдельно для
+# проверок (/check-*) и для /register: по IP клиента и по префиксу номера из RATE_LIMIT_PHONE_PREFIX цифр.
+# Лимиты по IP по умолчанию выключены: мобильные операторы выводят многих абонентов через один
+# публичный адрес (CGNAT), и во время розыгрыша такие пользователи получали бы 429 раньше любых злоупотреблений
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true') == 'true'
+RATE_LIMIT_PATH = os.environ.get('RATE_LIMIT_PATH', SHARED_STATE_PATH + '.ratelimit')
+RATE_LIMIT_PHONE_PREFIX = int(os.environ.get('RATE_LIMIT_PHONE_PREFIX', 6))
+CHECK_IP_LIMIT = Limit.parse('check-ip', os.environ.get('RATE_LIMIT_CHECK_IP', '0'))
+CHECK_PHONE_PREFIX_LIMIT = Limit.parse('check-phone-prefix', os.environ.get('RATE_LIMIT_CHECK_PHONE_PREFIX', '120/60'))
+REGISTER_IP_LIMIT = Limit.parse('register-ip', os.environ.get('RATE_LIMIT_REGISTER_IP', '0'))
+REGISTER_PHONE_PREFIX_LIMIT = Limit.parse('register-phone-prefix',
+                                          os.environ.get('RATE_LIMIT_REGISTER_PHONE_PREFIX', '30/20'))
 
 # Список допустимых городов и районов
 ALLOWED_CITIES = [
@@ -59,135 +161,163 @@ ALLOWED_CITIES = [
 ]
 
 # Для тестирования на хостинге - разрешаем все города, если установлена переменная окружения
-if os.environ.get('ALLOW_ALL_LOCATIONS') == 'true':
-    def check_location_allowed(city):
-        return True
-else:
-    def check_location_allowed(city):
-        return city in ALLOWED_CITIES
+ALLOW_ALL_LOCATIONS = os.environ.get('ALLOW_ALL_LOCATIONS') == 'true'
 
-# Кэш для данных о местоположении по IP
-ip_location_cache = {}
+def check_location_allowed(city):
+    return ALLOW_ALL_LOCATIONS or city in ALLOWED_CITIES
 
-# Время жизни кэша местоположения (1 час)
+# Время жизни кэша местоположения по IP (1 час)
 IP_CACHE_TTL = 3600
 
-@lru_cache(maxsize=128)
-def get_location_from_ip(ip_address):
-    """Получение информации о местоположении по IP-адресу"""
-    # Проверяем кэш
-    current_time = datetime.now().timestamp()
-    if ip_address in ip_location_cache:
-        cache_entry = ip_location_cache[ip_address]
-        if current_time - cache_entry['timestamp'] < IP_CACHE_TTL:
-            return cache_entry['data']
-    
-    try:
-        response = requests.get(f"http://ip-api.com/json/{ip_address}", timeout=3)
-        data = response.json()
-        if data.get('status') == 'success':
-            result = {
-                'city': data.get('city', '').lower(),
-                'region': data.get('regionName', ''),
-                'country': data.get('country', '')
-            }
-            # Сохраняем в кэш
-            ip_location_cache[ip_address] = {
-                'data': result,
-                'timestamp': current_time
-            }
-            return result
-        return None
-    except Exception as e:
-        print(f"Ошибка при определении местоположения: {e}")
-        return None
+# Время жизни кэша местоположения по координатам (1 сутки)
+COORDINATES_CACHE_TTL = 86400
 
-@lru_cache(maxsize=128)
-def get_location_from_coordinates(lat, lng):
-    """Получение информации о местоположении по координатам"""
-    try:
-        response = requests.get(
-            f"https://nominatim.openstreetmap.org/reverse?format=json&lat={lat}&lon={lng}&zoom=18&addressdetails=1",
-            headers={'User-Agent': 'CarRaffle/1.0'},
-            timeout=3
-        )
-        data = response.json()
-        if 'address' in data:
-            city = data['address'].get('city', '').lower()
-            if not city:
-                city = data['address'].get('town', '').lower()
-            if not city:
-                city = data['address'].get('village', '').lower()
-            
-            return {
-                'city': city,
-                'region': data['address'].get('state', ''),
-                'country': data['address'].get('country', '')
-            }
-        return None
-    except Exception as e:
-        print(f"Ошибка при определении местоположения по координатам: {e}")
-        return None
+# Время жизни отрицательных результатов (сервис не нашёл местоположение)
+GEO_NEGATIVE_CACHE_TTL = int(os.environ.get('GEO_NEGATIVE_CACHE_TTL', 300))
 
-# Кэш для участников с временем жизни
-participants_cache = {
-    'data': None,
-    'timestamp': 0
-}
-PARTICIPANTS_CACHE_TTL = 60  # 60 секунд
+# Максимальное число записей в кэше каждого воркера
+GEO_CACHE_SIZE = int(os.environ.get('GEO_CACHE_SIZE', 10000))
+
+# Шаг сетки, до которого округляются координаты (0.001° - около 100 м)
+COORDINATES_CACHE_GRID = float(os.environ.get('COORDINATES_CACHE_GRID', 0.001))
+
+# HTTP-клиент сервисов геолокации: 'async' - пул соединений httpx в цикле событий воркера,
+# 'threads' - requests в пуле потоков (для воркеров gevent)
+GEO_HTTP_CLIENT = os.environ.get('GEO_HTTP_CLIENT', 'async')
+
+# Общий срок ожидания проверок местоположения в одном запросе (секунды)
+GEO_DEADLINE = float(os.environ.get('GEO_DEADLINE', 3))
+
+# Лимиты провайдеров: число одновременных запросов из каждого воркера и частота в секунду - общая
+# для всех воркеров (0 - без ограничения). Корзины частоты хранятся в файле общей памяти
+# GEO_RATE_LIMIT_PATH, поэтому ip-api.com (бесплатно - 45 запросов в минуту) и Nominatim (1 в секунду)
+# получают не больше запросов, чем разрешено, при любом WEB_CONCURRENCY
+GEO_PROVIDER_CONCURRENCY = int(os.environ.get('GEO_PROVIDER_CONCURRENCY', 10))
+GEO_IP_RATE = float(os.environ.get('GEO_IP_RATE', 0.75))
+GEO_NOMINATIM_RATE = float(os.environ.get('GEO_NOMINATIM_RATE', 1))
+GEO_RATE_LIMIT_PATH = os.environ.get('GEO_RATE_LIMIT_PATH', SHARED_STATE_PATH + '.geo-ratelimit')
+
+# Выключатель провайдера: после скольких ошибок подряд и на сколько секунд прекращать запросы
+GEO_BREAKER_THRESHOLD = int(os.environ.get('GEO_BREAKER_THRESHOLD', 5))
+GEO_BREAKER_RESET = float(os.environ.get('GEO_BREAKER_RESET', 30))
+
+def create_provider(name, rate, buckets):
+    """Клиент провайдера с общей для воркеров корзиной частоты запросов"""
+    return Provider(name, max_concurrency=GEO_PROVIDER_CONCURRENCY,
+                    limiter=SharedRateLimiter(buckets, name, rate) if rate > 0 else None,
+                    failure_threshold=GEO_BREAKER_THRESHOLD, reset_timeout=GEO_BREAKER_RESET)
+
+async def get_location_from_ip(ip_address):
+    """Получение информации о местоположении по IP-адресу (через кэш)"""
+    with stage('geo_provider'):
+        return await geo_client.ip_location(ip_address)
+
+async def get_location_from_coordinates(lat, lng):
+    """Получение информации о местоположении по координатам (через кэш).
+
+    Координаты округляются до узла сетки, поэтому соседние пользователи
+    получают одну запись кэша.
+    """
+    lat, lng = quantize_coordinates(float(lat), float(lng), COORDINATES_CACHE_GRID)
+    with stage('geo_provider'):
+        return await geo_client.coordinates_location(lat, lng)
+
+# Файл с границами населённых пунктов для офлайн-проверки координат
+GEOFENCE_FILE = os.environ.get('GEOFENCE_FILE', os.path.join(os.path.dirname(__file__), 'data', 'allowed_areas.geojson'))
+
+# Обращаться к Nominatim, если точка не попала ни в один населённый пункт геозоны (по умолчанию включено).
+# Границы в файле геозоны приблизительные, поэтому точка вне них - не отказ, а повод спросить Nominatim
+GEO_REMOTE_FALLBACK = os.environ.get('GEO_REMOTE_FALLBACK', 'true') == 'true'
+
+async def locate_coordinates(lat, lng):
+    """Местоположение по координатам: офлайн-геозона, затем (по настройке) Nominatim.
+
+    Возвращает None, если точка вне геозоны и удалённая проверка отключена
+    или не дала результата.
+    """
+    with stage('geo_offline'):
+        location = geofence.locate(lat, lng)
+    if location is None and GEO_REMOTE_FALLBACK:
+        location = await get_location_from_coordinates(lat, lng)
+    return location
+
+# Офлайн-база диапазонов IP-адресов (собирается командой python ipdb.py build ...)
+IP_DB_FILE = os.environ.get('IP_DB_FILE', os.path.join(os.path.dirname(__file__), 'data', 'ip_ranges.bin'))
+
+# Обращаться к ip-api.com, если адреса нет в офлайн-базе
+IP_REMOTE_FALLBACK = os.environ.get('IP_REMOTE_FALLBACK') == 'true'
+
+async def locate_ip(ip_address):
+    """Местоположение по IP: офлайн-база, затем ip-api.com.
+
+    Без офлайн-базы используется только ip-api.com; с базой - только если
+    адрес в ней не найден и удалённая проверка разрешена.
+    """
+    if ip_database is not None:
+        with stage('geo_offline'):
+            location = ip_database.lookup(ip_address)
+        if location is not None or not IP_REMOTE_FALLBACK:
+            return location
+    return await get_location_from_ip(ip_address)
+
+def is_allowed_location(location):
+    """Окончательный ответ проверки: местоположение в разрешённом городе"""
+    return check_location_allowed(location.get('city', '').lower())
 
 def load_participants():
-    """Загрузка данных участников из файла с кэшированием"""
-    global participants_cache
-    current_time = datetime.now().timestamp()
-    
-    # Если есть актуальные данные в кэше, возвращаем их
-    if participants_cache['data'] is not None and current_time - participants_cache['timestamp'] < PARTICIPANTS_CACHE_TTL:
-        return participants_cache['data']
-    
-    # Иначе загружаем из файла
-    with data_lock:
-        try:
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                participants = json.load(f)
-                # Обновляем кэш
-                participants_cache['data'] = participants
-                participants_cache['timestamp'] = current_time
-                return participants
-        except:
-            return []
-
-def save_participant(participant_data):
-    """Сохранение данных участника в файл"""
-    with data_lock:
-        participants = load_participants()
-        participants.append(participant_data)
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(participants, f, ensure_ascii=False, indent=4)
-        
-        # Обновляем кэш
-        participants_cache['data'] = participants
-        participants_cache['timestamp'] = datetime.now().timestamp()
+    """Загрузка данных участников из журнала"""
+    return participant_store.all()
+
+async def save_participant(participant_data):
+    """Сохранение данных участника через очередь групповой записи; возвращает номер участника.
+
+    Ответ приходит после записи пачки на диск. Проверка телефона выполняется
+    атомарно с записью: если номер уже зарегистрирован, участник не
+    сохраняется и возвращается None.
+    """
+    with stage('storage_save'):
+        return await asyncio.wrap_future(ingest_queue.submit(participant_data))
 
 def is_phone_registered(phone):
     """Проверка, зарегистрирован ли уже данный номер телефона"""
-    participants = load_participants()
-    # Нормализуем телефон для сравнения (удаляем все, кроме цифр)
-    normalized_phone = ''.join(filter(str.isdigit, phone))
-    
-    for participant in participants:
-        normalized_participant_phone = ''.join(filter(str.isdigit, participant['phone']))
-        if normalized_participant_phone == normalized_phone:
-            return True
-    return False
+    with stage('phone_lookup'):
+        return participant_store.has_phone(phone)
+
+# Публичные страницы отрисовываются один раз на воркер и отдаются с ETag; flash-сообщения
+# в них не попадают, а загружаются отдельным запросом, если установлена кука FLASH_COOKIE
+page_cache = PageCache()
+FLASH_COOKIE = 'has_flash'
+
+def cached_page(template, **context):
+    """Публичная страница из кэша отрисовки: 304 на условный запрос, иначе готовые (сжатые) байты"""
+    render = lambda: render_template(template, defer_flash=True, flash_cookie=FLASH_COOKIE, **context)
+    if app.jinja_env.auto_reload:
+        # Режим разработки: шаблоны могут меняться
+        page_cache.clear()
+    page, hit = page_cache.get((template, request.script_root, tuple(sorted(context.items()))), render)
+    body, etag, encoding = page.select(request.headers.get('Accept-Encoding'))
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        result = 'not_modified'
+    else:
+        response = Response(body, mimetype='text/html')
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        result = 'hit' if hit else 'miss'
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    # Кэшировать можно, но перед использованием - проверять ETag
+    response.headers['Cache-Control'] = 'no-cache'
+    metrics.inc('app_page_cache_total', route=current_route(), result=result)
+    return response
 
 @app.route('/')
 def index():
     """Главная страница с формой регистрации"""
-    return render_template('index.html')
+    return cached_page('index.html')
 
 @app.route('/check-coordinates')
-def check_coordinates():
+async def check_coordinates():
     """Проверка местоположения пользователя по координатам"""
     lat = request.args.get('lat')
     lng = request.args.get('lng')
@@ -195,8 +325,14 @@ def check_coordinates():
     if not lat or not lng:
         return jsonify({"status": "error", "message": "Не указаны координаты"})
     
-    location = get_location_from_coordinates(lat, lng)
+    point = parse_coordinates(lat, lng)
+    if point is None:
+        return jsonify({"status": "error", "message": "Некорректные координаты"})
+    
+    location = await first_conclusive([locate_coordinates(*point)], is_allowed_location, GEO_DEADLINE)
     if not location:
+        # Точка вне геозоны без ответа Nominatim - результат неизвестен, а не отказ:
+        # при регистрации остаётся проверка по IP
         return jsonify({"status": "error", "message": "Не удалось определить местоположение по координатам"})
     
     city = location.get('city', '').lower()
@@ -209,7 +345,7 @@ def check_coordinates():
     })
 
 @app.route('/check-location')
-def check_location():
+async def check_location():
     """Проверка местоположения пользователя по IP"""
     ip_address = request.remote_addr
     
@@ -219,7 +355,7 @@ def check_location():
         # Это только для разработки
         return jsonify({"status": "success", "allowed": True, "city": "махачкала (тестовый режим)"})
     
-    location = get_location_from_ip(ip_address)
+    location = await first_conclusive([locate_ip(ip_address)], is_allowed_location, GEO_DEADLINE)
     if not location:
         return jsonify({"status": "error", "message": "Не удалось определить местоположение"})
     
@@ -250,7 +386,7 @@ def check_phone():
     return jsonify({"exists": False})
 
 @app.route('/register', methods=['POST'])
-def register():
+async def register():
     """Регистрация участника"""
     # Проверка на AJAX-запрос
     is_ajax_request = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
@@ -287,22 +423,21 @@ def register():
     if os.environ.get('ALLOW_ALL_LOCATIONS') == 'true':
         is_allowed = True
     else:
-        if latitude and longitude:
-            location = get_location_from_coordinates(latitude, longitude)
-            if location and check_location_allowed(location.get('city', '').lower()):
-                is_allowed = True
+        # Проверки по координатам и по IP выполняются одновременно с общим сроком
+        # ожидания; используется первый ответ из разрешённого города
+        lookups = []
+        point = parse_coordinates(latitude, longitude) if latitude and longitude else None
+        if point is not None:
+            lookups.append(locate_coordinates(*point))
+        ip_address = request.remote_addr
+        if ip_address != '127.0.0.1':
+            lookups.append(locate_ip(ip_address))
         
-        # Если координаты не предоставлены или не удалось определить местоположение,
-        # пробуем определить по IP
-        if not is_allowed:
-            ip_address = request.remote_addr
-            if ip_address == '127.0.0.1':  # Для локальной разработки
-                is_allowed = True
-            else:
-                ip_location = get_location_from_ip(ip_address)
-                if ip_location and check_location_allowed(ip_location.get('city', '').lower()):
-                    is_allowed = True
-                    location = ip_location
+        location = await first_conclusive(lookups, is_allowed_location, GEO_DEADLINE)
+        if location and is_allowed_location(location):
+            is_allowed = True
+        elif ip_address == '127.0.0.1':  # Для локальной разработки
+            is_allowed = True
     
     # Если пользователь не из разрешенного города
     if not is_allowed:
@@ -326,12 +461,15 @@ def register():
         'registration_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     }
     
-    # Сохранение данных участника
-    save_participant(participant)
+    # Сохранение данных участника и получение его номера
+    participant_number = await save_participant(participant)
     
-    # Получаем общее количество участников для определения номера
-    participants = load_participants()
-    participant_number = len(participants)
+    # Номер мог быть зарегистрирован параллельным запросом, пока шла проверка местоположения
+    if participant_number is None:
+        if is_ajax_request:
+            return jsonify({'success': False, 'message': 'Этот номер телефона уже зарегистрирован в розыгрыше. Регистрация возможна только один раз.'}), 400
+        flash('Этот номер телефона уже зарегистрирован в розыгрыше. Регистрация возможна только один раз.', 'danger')
+        return redirect(url_for('index'))
     
     # Возвращаем разные ответы в зависимости от типа запроса
     if is_ajax_request:
@@ -348,7 +486,26 @@ def register():
 @app.route('/success')
 def success():
     """Страница успешной регистрации"""
-    return render_template('success.html')
+    return cached_page('success.html')
+
+@app.route('/flash-messages')
+def flash_messages():
+    """Flash-сообщения пользователя для страниц из кэша (снимает куку FLASH_COOKIE)"""
+    messages = get_flashed_messages(with_categories=True)
+    response = jsonify([{'category': category, 'message': message} for category, message in messages])
+    response.delete_cookie(FLASH_COOKIE)
+    return response
+
+@message_flashed.connect_via(app)
+def mark_flashed(sender, message, category, **extra):
+    g.flashed = True
+
+@app.after_request
+def set_flash_cookie(response):
+    """Кука-признак для страниц из кэша: есть сообщения, которые нужно загрузить"""
+    if g.get('flashed'):
+        response.set_cookie(FLASH_COOKIE, '1', samesite='Lax', secure=request.is_secure)
+    return response
 
 @app.route('/admin', methods=['GET', 'POST'])
 def admin():
@@ -363,11 +520,74 @@ def admin():
             flash('Неверный пароль!', 'danger')
     
     if session.get('admin'):
-        participants = load_participants()
-        return render_template('admin.html', participants=participants)
+        # Таблица участников загружается страницами через /admin/participants
+        with stage('storage_load'):
+            total = participant_store.count()
+            gender_counts = participant_store.gender_counts()
+        return render_template('admin.html', total=total, gender_counts=gender_counts)
     else:
         return render_template('admin_login.html')
 
+# Допустимые размеры страницы в списке участников
+ADMIN_PAGE_SIZES = (25, 50, 100, 500)
+
+@app.route('/admin/participants')
+def admin_participants():
+    """Страница списка участников в JSON: пагинация, сортировка и поиск"""
+    if not session.get('admin'):
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+    
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = request.args.get('per_page', 50, type=int)
+    if per_page not in ADMIN_PAGE_SIZES:
+        per_page = 50
+    sort = request.args.get('sort', 'id')
+    if sort not in SORT_FIELDS:
+        sort = 'id'
+    descending = request.args.get('order', 'desc') != 'asc'
+    query = request.args.get('q', '').strip()
+    
+    with stage('storage_load'):
+        participants, found = participant_store.page(
+            offset=(page - 1) * per_page,
+            limit=per_page,
+            sort=sort,
+            descending=descending,
+            query=query or None
+        )
+    for participant in participants:
+        participant['city'] = participant_city(participant)
+    
+    return jsonify({
+        'success': True,
+        'participants': participants,
+        'page': page,
+        'per_page': per_page,
+        'found': found,
+        'pages': max((found + per_page - 1) // per_page, 1),
+        'stats': {
+            'total': participant_store.count(),
+            'genders': participant_store.gender_counts()
+        }
+    })
+
+@app.route('/admin/stats')
+def admin_stats():
+    """Статистика участников в JSON: всего, по полу, по часам регистрации, городам и возрасту"""
+    if not session.get('admin'):
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+
+    with stage('storage_load'):
+        stats = participant_store.statistics()
+    return jsonify({'success': True, 'stats': stats})
+
+@app.route('/admin/dashboard')
+def admin_dashboard():
+    """Дашборд со статистикой участников (обновляется автоматически)"""
+    if not session.get('admin'):
+        return redirect(url_for('admin'))
+    return render_template('admin_dashboard.html')
+
 @app.route('/delete-participants', methods=['POST'])
 def delete_participants():
     # Проверка, что пользователь является администратором
@@ -375,203 +595,357 @@ def delete_participants():
         return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
     
     try:
-        # Очистка файла participants.json
-        with data_lock:
-            with open(DATA_FILE, 'w') as f:
-                json.dump([], f)
-            
-            # Обновляем кэш
-            participants_cache['data'] = []
-            participants_cache['timestamp'] = datetime.now().timestamp()
-            
+        # Очистка журнала участников
+        participant_store.clear()
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
-@app.route('/delete-participant/<int:index>', methods=['POST'])
-def delete_participant(index):
-    # Проверка, что пользователь является администратором
+@app.route('/admin/participants/<int:participant_id>/delete', methods=['POST'])
+def delete_participant_by_id(participant_id):
+    """Удаление участника по постоянному идентификатору"""
     if not session.get('admin'):
         return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
     
     try:
-        # Загрузка списка участников
-        with data_lock:
-            participants = load_participants()
-            
-            # Проверка валидности индекса
-            if index < 0 or index >= len(participants):
-                return jsonify({'success': False, 'message': 'Участник не найден'}), 404
-            
-            # Удаление участника
-            del participants[index]
-            
-            # Сохранение обновленного списка
-            with open(DATA_FILE, 'w', encoding='utf-8') as f:
-                json.dump(participants, f, ensure_ascii=False, indent=4)
-            
-            # Обновляем кэш
-            participants_cache['data'] = participants
-            participants_cache['timestamp'] = datetime.now().timestamp()
-                
+        if not participant_store.delete(participant_id):
+            return jsonify({'success': False, 'message': 'Участник не найден'}), 404
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/admin/geo-cache')
+def geo_cache_stats():
+    """Счётчики кэша геолокации и провайдеров текущего воркера"""
+    if not session.get('admin'):
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'ip': ip_cache.stats(),
+        'coordinates': coordinates_cache.stats(),
+        'providers': {provider.name: provider.stats() for provider in (ip_provider, nominatim_provider)}
+    })
+
+@app.route('/admin/ingest')
+def ingest_stats():
+    """Глубина очереди регистраций и задержки групповой записи текущего воркера"""
+    if not session.get('admin'):
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+
+    return jsonify({'success': True, 'pid': os.getpid(), 'ingest': ingest_queue.stats()})
+
+# Форматы выгрузки: расширение файла, MIME-тип и разделитель для CSV/TSV
+EXPORT_FORMATS = {
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', None),
+    'csv': ('csv', 'text/csv; charset=utf-8', ','),
+    'tsv': ('tsv', 'text/tab-separated-values; charset=utf-8', '\t'),
+}
+
+# Каталог для файлов фоновых выгрузок (общий для всех воркеров)
+EXPORT_DIR = os.environ.get('EXPORT_DIR', os.path.join(os.path.dirname(os.path.abspath(DATA_FILE)), 'exports'))
+
+def parse_export_range(date_from, date_to):
+    """Границы времени регистрации [since, until) из дат ГГГГ-ММ-ДД (обе включительно)"""
+    since = datetime.strptime(date_from, '%Y-%m-%d').strftime('%Y-%m-%d') if date_from else None
+    until = None
+    if date_to:
+        until = (datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    return since, until
+
 @app.route('/export-to-excel', methods=['GET'])
 def export_to_excel():
-    """Генерация Excel-файла с данными участников"""
+    """Выгрузка участников в Excel, CSV или TSV (с фильтром по дате регистрации)"""
     # Проверка, что пользователь является администратором
     if not session.get('admin'):
         flash('Доступ запрещен. Пожалуйста, войдите как администратор.', 'danger')
         return redirect(url_for('admin'))
     
+    export_format = request.args.get('format', 'xlsx')
+    if export_format not in EXPORT_FORMATS:
+        flash('Неизвестный формат выгрузки', 'danger')
+        return redirect(url_for('admin'))
+    extension, mimetype, delimiter = EXPORT_FORMATS[export_format]
+    
     try:
-        # Загрузка данных участников
-        participants = load_participants()
-        
-        # Создание объекта для записи Excel-файла
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output)
-        worksheet = workbook.add_worksheet('Участники')
-        
-        # Форматирование
-        header_format = workbook.add_format({
-            'bold': True,
-            'bg_color': '#007bff',
-            'font_color': 'white',
-            'border': 1
-        })
-        
-        cell_format = workbook.add_format({
-            'border': 1
-        })
-        
-        # Установка ширины столбцов
-        worksheet.set_column('A:A', 25)  # Имя
-        worksheet.set_column('B:B', 20)  # Телефон
-        worksheet.set_column('C:C', 10)  # Возраст
-        worksheet.set_column('D:D', 15)  # Пол
-        worksheet.set_column('E:E', 20)  # Город
-        worksheet.set_column('F:F', 20)  # Регион
-        worksheet.set_column('G:G', 20)  # Страна
-        worksheet.set_column('H:H', 25)  # Время регистрации
-        worksheet.set_column('I:I', 30)  # Координаты
-        worksheet.set_column('J:J', 20)  # IP-адрес
-        
-        # Заголовки столбцов
-        headers = [
-            'Имя', 'Телефон', 'Возраст', 'Пол', 'Город', 'Регион', 'Страна', 
-            'Время регистрации', 'Координаты', 'IP-адрес'
-        ]
-        
-        for col, header in enumerate(headers):
-            worksheet.write(0, col, header, header_format)
-        
-        # Заполнение данными
-        for i, participant in enumerate(participants):
-            row = i + 1
-            
-            # Безопасное извлечение данных
-            full_name = str(participant.get('full_name', ''))
-            phone = str(participant.get('phone', ''))
-            age = str(participant.get('age', ''))
-            gender = 'Мужской' if str(participant.get('gender', '')) == 'male' else 'Женский'
-            
-            # Безопасное извлечение данных о местоположении
-            city = ''
-            region = ''
-            country = ''
-            
-            # Получение города из координат (если они есть)
-            coordinates = participant.get('coordinates', {})
-            if coordinates and isinstance(coordinates, dict):
-                city_from_coords = coordinates.get('city', '')
-                if city_from_coords:
-                    city = city_from_coords
-            
-            # Если город не определен из координат, пробуем получить его из location
-            if not city:
-                location = participant.get('location', {})
-                if location and isinstance(location, dict):
-                    city = location.get('city', '')
-                    region = location.get('region', '')
-                    country = location.get('country', '')
-            
-            # Форматирование координат
-            coords = ''
-            if coordinates and isinstance(coordinates, dict):
-                lat = coordinates.get('latitude', '')
-                lng = coordinates.get('longitude', '')
-                if lat and lng:
-                    coords = f"{lat}, {lng}"
-            
-            # IP-адрес
-            ip_address = str(participant.get('ip_address', ''))
-            
-            # Время регистрации
-            reg_time = str(participant.get('registration_time', ''))
-            
-            # Капитализация строк
-            if city:
-                city = city.capitalize()
-            if region:
-                region = region.capitalize()
-            if country:
-                country = country.capitalize()
-            
-            # Данные для записи
-            data = [
-                full_name,
-                phone,
-                age,
-                gender,
-                city,
-                region,
-                country,
-                reg_time,
-                coords,
-                ip_address
-            ]
-            
-            # Запись данных в Excel
-            for col, value in enumerate(data):
-                worksheet.write(row, col, value, cell_format)
-        
-        # Закрытие и возврат Excel-файла
-        workbook.close()
-        output.seek(0)
+        since, until = parse_export_range(request.args.get('date_from'), request.args.get('date_to'))
+    except ValueError:
+        flash('Неверный формат даты', 'danger')
+        return redirect(url_for('admin'))
+    
+    # Формирование имени файла с текущей датой
+    current_date = datetime.now().strftime('%Y-%m-%d')
+    filename = f'participants_{current_date}.{extension}'
+    
+    try:
+        # Участники читаются из хранилища по одному
+        rows = export_rows(participant_store.iter_all(since=since, until=until))
         
-        # Формирование имени файла с текущей датой
-        current_date = datetime.now().strftime('%Y-%m-%d')
-        filename = f'participants_{current_date}.xlsx'
+        if delimiter is not None:
+            # CSV/TSV отдаётся потоком: первые байты уходят клиенту сразу
+            return Response(
+                stream_csv(rows, delimiter),
+                mimetype=mimetype,
+                headers={'Content-Disposition': f'attachment; filename={filename}'}
+            )
         
-        return send_file(
-            output, 
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 
-            as_attachment=True, 
-            download_name=filename
-        )
+        # Excel-файл собирается во временном файле и удаляется после отправки
+        return send_file(build_xlsx(rows), mimetype=mimetype, as_attachment=True, download_name=filename)
     except Exception as e:
-        import traceback
-        print(traceback.format_exc())  # Печать полного трейсбека ошибки в консоль
+        app.logger.exception("Ошибка при выгрузке участников")
         flash(f'Ошибка при создании Excel-файла: {str(e)}', 'danger')
         return redirect(url_for('admin'))
 
-# Добавляем настройку для сжатия ответов
+@app.route('/export-jobs', methods=['POST'])
+def start_export_job():
+    """Запуск фоновой выгрузки; если данные не менялись, возвращается готовый файл"""
+    if not session.get('admin'):
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+    
+    export_format = request.form.get('format', 'xlsx')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'message': 'Неизвестный формат выгрузки'}), 400
+    try:
+        since, until = parse_export_range(request.form.get('date_from'), request.form.get('date_to'))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Неверный формат даты'}), 400
+    
+    job = export_jobs.start(export_format, since, until)
+    return jsonify(export_job_response(job))
+
+@app.route('/export-jobs/<job_id>')
+def export_job_status(job_id):
+    """Состояние фоновой выгрузки"""
+    if not session.get('admin'):
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+    
+    job = export_jobs.status(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Задание не найдено'}), 404
+    return jsonify(export_job_response(job))
+
+@app.route('/export-jobs/<job_id>/download')
+def download_export_job(job_id):
+    """Скачивание готового файла фоновой выгрузки"""
+    if not session.get('admin'):
+        flash('Доступ запрещен. Пожалуйста, войдите как администратор.', 'danger')
+        return redirect(url_for('admin'))
+    
+    job = export_jobs.status(job_id)
+    if job is None or job['status'] != 'done':
+        flash('Файл выгрузки не найден или ещё не готов', 'danger')
+        return redirect(url_for('admin'))
+    
+    extension, mimetype, _ = EXPORT_FORMATS[job['format']]
+    current_date = datetime.now().strftime('%Y-%m-%d')
+    return send_file(
+        export_jobs.artifact_path(job_id, job['format']),
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=f'participants_{current_date}.{extension}'
+    )
+
+# Каталог с результатами розыгрышей (общий для всех воркеров)
+DRAWS_DIR = os.environ.get('DRAWS_DIR', os.path.join(os.path.dirname(os.path.abspath(DATA_FILE)), 'draws'))
+
+# Максимальное число победителей в одном розыгрыше
+MAX_WINNERS = 100
+
+@app.route('/admin/draws', methods=['GET', 'POST'])
+def admin_draws():
+    """Розыгрыш победителей (POST) и список проведённых розыгрышей и обязательств (GET).
+
+    Розыгрыш проводится только с зерном, SHA-256 которого записан как
+    обязательство раньше границы регистрации: иначе зерно можно было бы
+    подбирать, пока не выпадет нужный результат.
+    """
+    if not session.get('admin'):
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+    
+    if request.method == 'GET':
+        return jsonify({'success': True, 'draws': draw_records.list(), 'commitments': draw_records.commitments()})
+    
+    seed = request.form.get('seed', '').strip()
+    if not seed:
+        return jsonify({'success': False, 'message': 'Укажите зерно розыгрыша'}), 400
+    winners = request.form.get('winners', 1, type=int)
+    if not winners or not 1 <= winners <= MAX_WINNERS:
+        return jsonify({'success': False, 'message': f'Число победителей - от 1 до {MAX_WINNERS}'}), 400
+    if not request.form.get('date_to'):
+        return jsonify({'success': False, 'message': 'Укажите последний день регистрации'}), 400
+    try:
+        _, until = parse_export_range(None, request.form.get('date_to'))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Неверный формат даты'}), 400
+    commitment = draw_records.commitment(seed_commitment(seed))
+    if commitment is None:
+        return jsonify({'success': False, 'message': 'Для этого зерна нет опубликованного обязательства'}), 400
+    if commitment['committed_at'] >= until:
+        return jsonify({'success': False, 'message': 'Обязательство записано после окончания регистрации'}), 400
+    
+    draw = run_draw(participant_store.iter_all(until=until), winners, seed, until)
+    draw['commitment'] = commitment
+    draw['data_version'] = participant_store.data_version()
+    draw['data_identity'] = participant_store.data_identity()
+    return jsonify({'success': True, 'draw': draw_records.save(draw)})
+
+@app.route('/admin/draws/commitments', methods=['POST'])
+def admin_draw_commitments():
+    """Запись обязательства: SHA-256 зерна будущего розыгрыша (само зерно серверу не передаётся)"""
+    if not session.get('admin'):
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+    commitment = draw_records.commit(request.form.get('seed_sha256', ''))
+    if commitment is None:
+        return jsonify({'success': False, 'message': 'Укажите SHA-256 зерна (64 шестнадцатеричных символа)'}), 400
+    return jsonify({'success': True, 'commitment': commitment})
+
+def export_job_response(job):
+    """Ответ API с состоянием задания выгрузки"""
+    return {
+        'success': job['status'] != 'error',
+        'job_id': job['id'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'total': job['total'],
+        'message': job['error'],
+        'download_url': url_for('download_export_job', job_id=job['id']) if job['status'] == 'done' else None
+    }
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Метрики всех воркеров в формате Prometheus"""
+    if not session.get('admin'):
+        if not METRICS_TOKEN:
+            return Response('Метрики выключены: задайте METRICS_TOKEN\n', status=404, mimetype='text/plain')
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                   f'Bearer {METRICS_TOKEN}'.encode()):
+            return Response('Доступ запрещен\n', status=403, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.before_request
+def start_request_timer():
+    """Начало замера времени запроса (и профилирования, если оно включено)"""
+    g.request_started = time.perf_counter()
+    if profiler is not None:
+        profiler.start()
+
+@app.before_request
+def admit_request():
+    """Ранний отказ по лимитам частоты - до обращений к хранилищу и сервисам геолокации"""
+    if rate_limiter is None:
+        return None
+    if request.endpoint == 'register':
+        ip_limit, prefix_limit, phone = REGISTER_IP_LIMIT, REGISTER_PHONE_PREFIX_LIMIT, request.form.get('phone')
+    elif request.endpoint in ('check_phone', 'check_location', 'check_coordinates'):
+        ip_limit, prefix_limit, phone = CHECK_IP_LIMIT, CHECK_PHONE_PREFIX_LIMIT, request.args.get('phone')
+    else:
+        return None
+    limit = ip_limit
+    retry_after = rate_limiter.take(ip_limit, client_key(request.remote_addr))
+    prefix = phone_prefix(phone, RATE_LIMIT_PHONE_PREFIX) if phone else None
+    if not retry_after and prefix:
+        limit = prefix_limit
+        retry_after = rate_limiter.take(prefix_limit, prefix)
+    if not retry_after:
+        return None
+    metrics.inc('app_rate_limited_total', route=current_route(), limit=limit.name)
+    message = 'Слишком много запросов. Пожалуйста, повторите попытку позже.'
+    if request.endpoint == 'register' and request.headers.get('X-Requested-With') != 'XMLHttpRequest':
+        flash(message, 'danger')
+        return redirect(url_for('index'))
+    response = jsonify({'success': False, 'status': 'error', 'message': message})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+@app.after_request
+def record_request_metrics(response):
+    """Время и счётчик запросов по маршруту (потоковые ответы - до начала отправки тела)"""
+    route = current_route()
+    metrics.observe('app_request_duration_seconds', time.perf_counter() - g.request_started, route=route)
+    metrics.inc('app_requests_total', route=route, method=request.method, status=response.status_code)
+    return response
+
+@app.teardown_request
+def finish_request(exc):
+    """Учёт исключений и сохранение профиля медленного запроса"""
+    if exc is not None:
+        metrics.inc('app_request_exceptions_total', route=current_route())
+    if profiler is not None and 'request_started' in g:
+        path = profiler.stop(current_route(), time.perf_counter() - g.request_started)
+        if path is not None:
+            metrics.inc('app_slow_requests_profiled_total', route=current_route())
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def record_render_time(sender, template, context, **extra):
+    if 'render_started' in g:
+        metrics.observe('app_stage_duration_seconds', time.perf_counter() - g.pop('render_started'),
+                        route=current_route(), stage='render')
+
 @app.after_request
 def add_header(response):
-    # Кэширование статических файлов
+    # Кэширование статических файлов задаёт static_file; HTML-страницы не кэшируются
     if 'Cache-Control' not in response.headers:
-        if request.path.startswith('/static/'):
-            # Кэшировать статические файлы на 1 год
-            response.headers['Cache-Control'] = 'public, max-age=31536000'
-        else:
-            # Не кэшировать HTML-страницы
-            response.headers['Cache-Control'] = 'no-store'
+        response.headers['Cache-Control'] = 'no-store'
     return response
 
+def create_app():
+    """Фабрика приложения: открывает хранилище и общие ресурсы процесса и возвращает app.
+
+    Импорт модуля только объявляет настройки и маршруты: файлы и каталоги
+    данных, снимки участников и фоновые пулы создаются здесь. С preload_app
+    (gunicorn.conf.py) фабрика выполняется один раз в главном процессе, и
+    воркеры получают загруженные снимки при fork, деля их страницы памяти
+    (копирование при записи). Повторный вызов возвращает то же приложение.
+    """
+    global shared_backend, participant_store, metrics, profiler, rate_limiter, ingest_queue
+    global ip_provider, nominatim_provider, ip_cache, coordinates_cache, geo_client, geofence, ip_database
+    global export_jobs, draw_records, static_assets
+    if app.extensions.get('services_ready'):
+        return app
+
+    static_assets = StaticAssets(app.static_folder)
+
+    shared_backend = create_backend(SHARED_BACKEND, SHARED_STATE_PATH)
+    participant_store = create_store(STORAGE_ENGINE, DATA_FILE, PARTICIPANTS_LOG, PARTICIPANTS_DB,
+                                     backend=shared_backend)
+    ingest_queue = IngestQueue(participant_store, max_batch=INGEST_BATCH_SIZE, max_delay=INGEST_MAX_DELAY_MS / 1000)
+
+    metrics = Metrics(METRICS_DIR, backend=shared_backend)
+    profiler = SlowRequestProfiler(PROFILE_DIR, PROFILE_SLOW_REQUESTS_MS / 1000) if PROFILE_SLOW_REQUESTS_MS > 0 else None
+    rate_limiter = TokenBuckets(RATE_LIMIT_PATH) if RATE_LIMIT_ENABLED else None
+
+    ip_cache = GeoCache('ip', maxsize=GEO_CACHE_SIZE, ttl=IP_CACHE_TTL,
+                        negative_ttl=GEO_NEGATIVE_CACHE_TTL, shared=shared_backend)
+    coordinates_cache = GeoCache('coordinates', maxsize=GEO_CACHE_SIZE, ttl=COORDINATES_CACHE_TTL,
+                                 negative_ttl=GEO_NEGATIVE_CACHE_TTL, shared=shared_backend)
+    geo_rate_buckets = TokenBuckets(GEO_RATE_LIMIT_PATH, stripes=1, slots_per_stripe=64)
+    ip_provider = create_provider('ip-api', GEO_IP_RATE, geo_rate_buckets)
+    nominatim_provider = create_provider('nominatim', GEO_NOMINATIM_RATE, geo_rate_buckets)
+    if GEO_HTTP_CLIENT == 'async':
+        geo_client = AsyncGeoClient(ip_cache, coordinates_cache, ip_provider, nominatim_provider)
+    else:
+        geo_client = ThreadedGeoClient(ip_cache, coordinates_cache, ip_provider, nominatim_provider)
+    geofence = Geofence.load(GEOFENCE_FILE)
+    ip_database = IPDatabase(IP_DB_FILE) if os.path.exists(IP_DB_FILE) else None
+
+    export_jobs = ExportJobs(EXPORT_DIR, participant_store, EXPORT_FORMATS)
+    draw_records = DrawRecords(DRAWS_DIR)
+
+    # Соединения SQLite, открытые при загрузке, не должны переходить в воркеры gunicorn при fork:
+    # каждый процесс откроет свои при первом обращении
+    participant_store.close_connections()
+    shared_backend.close_connections()
+
+    app.extensions['services_ready'] = True
+    return app
+
 if __name__ == '__main__':
     # Для продакшена используйте WSGI-сервер (gunicorn или uwsgi)
-    # gunicorn -w 4 -b 0.0.0.0:5000 app:app
-    app.run(debug=False, host='0.0.0.0') 
\ No newline at end of file
+    # gunicorn wsgi:app (настройки - в gunicorn.conf.py)
+    create_app().run(debug=False, host='0.0.0.0') 
\ No newline at end of file
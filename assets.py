@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Статические файлы с отпечатками содержимого, предварительным сжатием и
+адаптивными изображениями.
+
+Сборка копирует файлы из static/ в static/dist/ под именами с хешем
+содержимого (custom.3f9a1c0b7d2e.css) и пишет manifest.json:
+
+- CSS, JS и SVG дополнительно сохраняются сжатыми (.br - если установлен
+  модуль Brotli, и .gz), если сжатие уменьшает файл; ссылки url() внутри
+  CSS переписываются на имена с отпечатками;
+- для изображений PNG/JPEG (если установлен Pillow) создаются варианты
+  WebP и AVIF шириной IMAGE_WIDTHS, но не шире оригинала;
+- файлы с одинаковым содержимым записываются один раз.
+
+Приложение переписывает url_for('static', filename=...) по манифесту,
+поэтому такие адреса можно кэшировать навсегда: новое содержимое - новый
+адрес. Сжатый вариант или формат изображения выбирается по заголовкам
+Accept-Encoding и Accept запроса. Без манифеста файлы раздаются как есть
+с обязательной проверкой актуальности (ETag).
+
+Модули Brotli и Pillow импортируются при первом сжатии и при сборке, а
+не при запуске приложения: воркеру, раздающему готовую сборку, они не нужны.
+
+Сборка: python assets.py [--static static]
+"""
+
+import os
+import io
+import re
+import gzip
+import json
+import hashlib
+import argparse
+import posixpath
+from urllib.parse import urljoin
+
+# Каталог результатов сборки внутри каталога статических файлов
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+
+# Какие файлы собирать и какие из них сжимать
+ASSET_TYPES = ('.css', '.js', '.svg', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico', '.woff', '.woff2')
+COMPRESSIBLE = ('.css', '.js', '.svg')
+RESPONSIVE = ('.png', '.jpg', '.jpeg')
+
+# Ширины вариантов изображений, пиксели
+IMAGE_WIDTHS = (480, 768, 1080, 1600)
+
+# Форматы вариантов в порядке предпочтения: (формат, тип MIME, параметры сохранения Pillow)
+IMAGE_FORMATS = (
+    ('avif', 'image/avif', {'quality': 55}),
+    ('webp', 'image/webp', {'quality': 80, 'method': 6}),
+)
+
+# Сжатые варианты в порядке предпочтения: (Content-Encoding, расширение)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+MIME_TYPES = {
+    '.css': 'text/css; charset=utf-8', '.js': 'text/javascript; charset=utf-8', '.svg': 'image/svg+xml',
+    '.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.gif': 'image/gif',
+    '.webp': 'image/webp', '.avif': 'image/avif', '.ico': 'image/x-icon',
+    '.woff': 'font/woff', '.woff2': 'font/woff2',
+}
+
+_CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def accepts(header, value):
+    """Указано ли значение в заголовке Accept/Accept-Encoding явно и с q > 0 (без учёта * и image/*)"""
+    for item in (header or '').split(','):
+        name, _, params = item.strip().partition(';')
+        if name.strip().lower() != value:
+            continue
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                return float(quality[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+def _brotli():
+    """Модуль brotli или None, если не установлен"""
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def _pillow():
+    """Модули Pillow (Image, features) или None, если Pillow не установлен"""
+    try:
+        from PIL import Image, features
+    except ImportError:
+        return None
+    return Image, features
+
+
+def compress(data):
+    """Сжатые варианты данных, которые меньше исходных: {Content-Encoding: байты}"""
+    variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    brotli = _brotli()
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    return {encoding: compressed for encoding, compressed in variants.items() if len(compressed) < len(data)}
+
+
+# ----------------------------------------------------------------------
+# Сборка
+# ----------------------------------------------------------------------
+
+class _Builder:
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self.dist_dir = os.path.join(static_dir, DIST)
+        self.assets = {}
+        self.written = {}  # хеш содержимого -> имя файла в dist
+        self.files = set()  # все файлы сборки (для удаления устаревших)
+        self.pillow = _pillow() is not None
+
+    def _write(self, name, data):
+        path = os.path.join(self.dist_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.files.add(name)
+
+    def _store(self, logical, data, suffix=None):
+        """Запись содержимого под именем с отпечатком; одинаковое содержимое - один файл"""
+        digest = _digest(data)
+        if digest in self.written:
+            return self.written[digest]
+        stem, ext = os.path.splitext(logical)
+        name = f"{stem}{suffix or ''}.{digest}{ext}"
+        self._write(name, data)
+        self.written[digest] = name
+        return name
+
+    def _compress(self, name, data):
+        """Сжатые варианты файла; возвращает список кодировок, которые уменьшили файл"""
+        variants = compress(data)
+        encodings = []
+        for encoding, ext in ENCODINGS:
+            if encoding in variants:
+                self._write(name + ext, variants[encoding])
+                encodings.append(encoding)
+        return encodings
+
+    def _image_variants(self, logical, data):
+        """Варианты изображения в форматах IMAGE_FORMATS: {формат: [[ширина, файл, байт], ...]}"""
+        Image, features = _pillow()
+        with Image.open(io.BytesIO(data)) as image:
+            image.load()
+            width, height = image.size
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+            widths = [w for w in IMAGE_WIDTHS if w < width] + [width]
+            variants = {}
+            for fmt, _, options in IMAGE_FORMATS:
+                if not features.check(fmt):
+                    continue
+                stem = os.path.splitext(logical)[0]
+                for w in widths:
+                    resized = image if w == width else image.resize((w, round(height * w / width)), Image.LANCZOS)
+                    buffer = io.BytesIO()
+                    resized.save(buffer, fmt.upper(), **options)
+                    name = self._store(f"{stem}.{fmt}", buffer.getvalue(), suffix=f".{w}w")
+                    variants.setdefault(fmt, []).append([w, name, len(buffer.getvalue())])
+            return {'width': width, 'height': height, 'variants': variants}
+
+    def _rewrite_css(self, logical, text):
+        """Ссылки url() на собранные файлы -> относительные адреса файлов с отпечатками"""
+        def replace(match):
+            quote, target = match.groups()
+            if re.match(r'^(?:[a-z]+:|//|#)', target, re.I):
+                return match.group(0)
+            # Адрес относительно исходного CSS: /static/<logical>
+            resolved = urljoin('/static/' + logical, target.split('?')[0].split('#')[0])
+            entry = self.assets.get(resolved[len('/static/'):]) if resolved.startswith('/static/') else None
+            if entry is None:
+                return match.group(0)
+            # CSS с отпечатком лежит в том же подкаталоге dist, что и исходный в static
+            return f"url({quote}{posixpath.relpath(entry['file'], posixpath.dirname(logical) or '.')}{quote})"
+        return _CSS_URL.sub(replace, text)
+
+    def build(self):
+        sources = []
+        for root, dirs, files in os.walk(self.static_dir):
+            if os.path.abspath(root) == os.path.abspath(self.static_dir):
+                dirs[:] = [d for d in dirs if d != DIST]
+            for filename in files:
+                if filename.lower().endswith(ASSET_TYPES):
+                    path = os.path.join(root, filename)
+                    sources.append(os.path.relpath(path, self.static_dir).replace(os.sep, '/'))
+        # CSS - последним: к этому моменту известны отпечатки изображений и шрифтов
+        sources.sort(key=lambda name: (name.endswith('.css'), name))
+
+        for logical in sources:
+            with open(os.path.join(self.static_dir, logical), 'rb') as f:
+                data = f.read()
+            ext = os.path.splitext(logical)[1].lower()
+            if ext == '.css':
+                data = self._rewrite_css(logical, data.decode('utf-8')).encode('utf-8')
+            entry = {'file': self._store(logical, data)}
+            if ext in COMPRESSIBLE:
+                entry['encodings'] = self._compress(entry['file'], data)
+            if ext in RESPONSIVE and self.pillow:
+                entry.update(self._image_variants(logical, data))
+            self.assets[logical] = entry
+
+        self._write(MANIFEST, json.dumps({'assets': self.assets}, ensure_ascii=False, indent=1).encode('utf-8'))
+        self._prune()
+        return self.assets
+
+    def _prune(self):
+        """Удаление файлов предыдущих сборок"""
+        for root, _, files in os.walk(self.dist_dir):
+            for filename in files:
+                name = os.path.relpath(os.path.join(root, filename), self.dist_dir).replace(os.sep, '/')
+                if name not in self.files:
+                    os.remove(os.path.join(root, filename))
+
+
+def build(static_dir):
+    """Сборка static_dir/dist и манифеста; возвращает записи манифеста"""
+    return _Builder(static_dir).build()
+
+
+# ----------------------------------------------------------------------
+# Раздача
+# ----------------------------------------------------------------------
+
+class StaticAssets:
+    """Манифест собранных статических файлов и выбор варианта для запроса"""
+
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self.dist_dir = os.path.join(static_dir, DIST)
+        self.assets = {}
+        self._files = {}  # файл в dist -> запись манифеста
+        try:
+            with open(os.path.join(self.dist_dir, MANIFEST), 'r', encoding='utf-8') as f:
+                self.assets = json.load(f)['assets']
+        except (OSError, ValueError, KeyError):
+            return
+        for entry in self.assets.values():
+            self._files.setdefault(entry['file'], entry)
+            for variants in entry.get('variants', {}).values():
+                for _, name, _ in variants:
+                    self._files.setdefault(name, {'file': name})
+
+    def url_defaults(self, endpoint, values):
+        """Для app.url_defaults: url_for('static', filename=...) -> файл с отпечатком"""
+        if endpoint == 'static':
+            entry = self.assets.get(values.get('filename'))
+            if entry is not None:
+                values['filename'] = f"{DIST}/{entry['file']}"
+
+    def sources(self, filename):
+        """Адаптивные варианты изображения: [(тип MIME, [(ширина, файл в static), ...]), ...]"""
+        entry = self.assets.get(filename) or {}
+        result = []
+        for fmt, mime, _ in IMAGE_FORMATS:
+            variants = entry.get('variants', {}).get(fmt)
+            if variants:
+                result.append((mime, [(width, f"{DIST}/{name}") for width, name, _ in variants]))
+        return result
+
+    def select(self, filename, accept_encoding, accept):
+        """Файл для ответа на запрос filename (путь внутри static).
+
+        Возвращает (файл в dist, тип MIME, Content-Encoding или None, Vary или None)
+        или None, если filename - не файл сборки.
+        """
+        if not filename.startswith(DIST + '/'):
+            return None
+        name = filename[len(DIST) + 1:]
+        entry = self._files.get(name)
+        if entry is None:
+            return None
+        mime = MIME_TYPES.get(os.path.splitext(name)[1].lower())
+        if entry.get('encodings'):
+            for encoding, ext in ENCODINGS:
+                if encoding in entry['encodings'] and accepts(accept_encoding, encoding):
+                    return name + ext, mime, encoding, 'Accept-Encoding'
+            return name, mime, None, 'Accept-Encoding'
+        if entry.get('variants'):
+            # Изображение по исходному адресу (например, фон в CSS): вариант полной ширины,
+            # если клиент явно поддерживает формат и вариант меньше оригинала
+            size = os.path.getsize(os.path.join(self.dist_dir, name))
+            for fmt, variant_mime, _ in IMAGE_FORMATS:
+                variants = entry['variants'].get(fmt)
+                if variants and accepts(accept, variant_mime) and variants[-1][2] < size:
+                    return variants[-1][1], variant_mime, None, 'Accept'
+            return name, mime, None, 'Accept'
+        return name, mime, None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--static', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+    args = parser.parse_args()
+
+    if _brotli() is None:
+        print("Модуль Brotli не установлен: создаются только варианты .gz")
+    if _pillow() is None:
+        print("Pillow не установлен: варианты изображений WebP/AVIF не создаются")
+    assets = build(args.static)
+    for logical, entry in sorted(assets.items()):
+        original = os.path.getsize(os.path.join(args.static, logical))
+        details = []
+        if entry.get('encodings'):
+            details.append('сжатие: ' + ', '.join(entry['encodings']))
+        for fmt, variants in entry.get('variants', {}).items():
+            details.append(f"{fmt}: " + ', '.join(f"{w}w {size // 1024} КБ" for w, _, size in variants))
+        print(f"{logical} ({original // 1024} КБ) -> {DIST}/{entry['file']}" + (f" [{'; '.join(details)}]" if details else ''))
+
+
+if __name__ == '__main__':
+    main()
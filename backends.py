@@ -0,0 +1,328 @@
+"""
+Общие для всех воркеров gunicorn механизмы координации.
+
+Каждый воркер - отдельный процесс, поэтому блокировки threading и словари
+в памяти между ними не разделяются. Бэкенд даёт:
+
+- межпроцессную блокировку (fcntl.flock на файле блокировки);
+- счётчики версий, по которым воркеры понимают, что данные изменились;
+- общий кэш «ключ - значение» со временем жизни (для геолокации).
+
+Реализации:
+
+- SQLiteBackend - база SQLite в режиме WAL;
+- SharedMemoryBackend - файл, отображённый в память (mmap), доступ к которому
+  координируется блокировкой файла.
+"""
+
+import os
+import json
+import time
+import struct
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: остаётся только блокировка внутри процесса
+    fcntl = None
+
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
+
+class SharedBackend:
+    """Базовый класс бэкенда: межпроцессные блокировки на файлах"""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_locks = {}
+        self._lock_files = {}
+        self._registry_lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            # Дескрипторы flock, унаследованные при fork, разделяют блокировку с родителем
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        """Сброс состояния, которое нельзя разделять с родительским процессом"""
+        self._thread_locks = {}
+        self._lock_files = {}
+        self._registry_lock = threading.Lock()
+
+    def _lock_objects(self, name):
+        """Блокировка потоков и файл блокировки для заданного имени"""
+        with self._registry_lock:
+            if name not in self._thread_locks:
+                self._thread_locks[name] = threading.Lock()
+                self._lock_files[name] = open(f"{self.path}.{name}.lock", 'a+b')
+            return self._thread_locks[name], self._lock_files[name]
+
+    @contextmanager
+    def lock(self, name):
+        """Эксклюзивная блокировка, общая для всех потоков и процессов"""
+        thread_lock, lock_file = self._lock_objects(name)
+        with thread_lock:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def get_version(self, name):
+        """Текущее значение счётчика версий"""
+        raise NotImplementedError
+
+    def bump_version(self, name):
+        """Увеличение счётчика версий; возвращает новое значение"""
+        raise NotImplementedError
+
+    def cache_get(self, namespace, key):
+        """Значение из общего кэша или None, если его нет или оно устарело"""
+        raise NotImplementedError
+
+    def cache_set(self, namespace, key, value, ttl):
+        """Сохранение значения в общий кэш на ttl секунд"""
+        raise NotImplementedError
+
+    def close_connections(self):
+        """Закрытие соединений, открытых процессом, - например, главным процессом gunicorn перед
+        запуском воркеров; при следующем обращении они откроются заново. Вызывается, когда
+        бэкендом не пользуются другие потоки"""
+
+
+class SQLiteBackend(SharedBackend):
+    """Бэкенд на SQLite в режиме WAL: читатели не блокируют писателей"""
+
+    # Как часто (в операциях записи) удалять устаревшие записи кэша
+    CLEANUP_EVERY = 1000
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._local = threading.local()
+        self._connections = []
+        self._inherited = []
+        self._writes = 0
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS versions (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires REAL NOT NULL, '
+            'PRIMARY KEY (namespace, key))'
+        )
+
+    def _after_fork(self):
+        super()._after_fork()
+        # Соединения SQLite нельзя ни использовать, ни закрывать после fork: закрытие в дочернем
+        # процессе может выполнить контрольную точку WAL, которым пользуется родитель. Ссылки
+        # сохраняются, чтобы сборщик мусора не закрыл их вместе с потоками родителя
+        self._inherited.extend(self._connections)
+        self._connections = []
+        self._local = threading.local()
+
+    def _conn(self):
+        """Соединение с базой для текущего потока (открывается при первом обращении)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # check_same_thread=False только для close_connections: соединением пользуется один поток
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            with self._registry_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close_connections(self):
+        with self._registry_lock:
+            connections, self._connections = self._connections, []
+        self._local = threading.local()
+        for conn in connections:
+            conn.close()
+
+    def get_version(self, name):
+        row = self._conn().execute('SELECT value FROM versions WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else 0
+
+    def bump_version(self, name):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT INTO versions (name, value) VALUES (?, 1) '
+                'ON CONFLICT(name) DO UPDATE SET value = value + 1',
+                (name,)
+            )
+            value = conn.execute('SELECT value FROM versions WHERE name = ?', (name,)).fetchone()[0]
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return value
+
+    def cache_get(self, namespace, key):
+        row = self._conn().execute(
+            'SELECT value FROM cache WHERE namespace = ? AND key = ? AND expires > ?',
+            (namespace, key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def cache_set(self, namespace, key, value, ttl):
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO cache (namespace, key, value, expires) VALUES (?, ?, ?, ?)',
+            (namespace, key, json.dumps(value, ensure_ascii=False), time.time() + ttl)
+        )
+        self._writes += 1
+        if self._writes % self.CLEANUP_EVERY == 0:
+            conn.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+
+
+class SharedMemoryBackend(SharedBackend):
+    """Бэкенд на файле, отображённом в память; доступ координируется flock"""
+
+    MAGIC = b'CGSH'
+    HEADER = struct.Struct('<4sII')  # сигнатура, число слотов кэша, размер слота
+    VERSION_SLOTS = 32
+    VERSION_SLOT = struct.Struct('<32sQ')  # имя счётчика, значение
+    CACHE_SLOT = struct.Struct('<QdH')  # хэш ключа, время истечения, длина данных
+    PROBES = 8  # длина поиска свободного слота (открытая адресация)
+
+    def __init__(self, path, cache_slots=8192, slot_size=256):
+        super().__init__(path)
+        if mmap is None:
+            raise RuntimeError('mmap недоступен на этой платформе')
+        self.cache_slots = cache_slots
+        self.slot_size = slot_size
+        self._versions_offset = self.HEADER.size
+        self._cache_offset = self._versions_offset + self.VERSION_SLOTS * self.VERSION_SLOT.size
+        self._size = self._cache_offset + cache_slots * slot_size
+        self._open()
+
+    def _open(self):
+        """Открытие (и при необходимости инициализация) файла общей памяти"""
+        self._file = open(self.path, 'a+b')
+        self._flock(True)
+        try:
+            if os.path.getsize(self.path) != self._size:
+                self._file.truncate(0)
+                self._file.truncate(self._size)
+                self._file.seek(0)
+                self._file.write(self.HEADER.pack(self.MAGIC, self.cache_slots, self.slot_size))
+                self._file.flush()
+            self._mm = mmap.mmap(self._file.fileno(), self._size)
+        finally:
+            self._unflock()
+        self._mm_lock = threading.Lock()
+
+    def _after_fork(self):
+        super()._after_fork()
+        # Открываем файл заново, чтобы flock дочернего процесса был независимым
+        self._open()
+
+    def _flock(self, exclusive):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    def _unflock(self):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    @contextmanager
+    def _locked(self, exclusive):
+        """Доступ к общей памяти под блокировкой потоков и файла"""
+        with self._mm_lock:
+            self._flock(exclusive)
+            try:
+                yield self._mm
+            finally:
+                self._unflock()
+
+    def _version_slot(self, mm, name, create):
+        """Смещение слота счётчика с заданным именем"""
+        encoded = name.encode('utf-8')[:32].ljust(32, b'\0')
+        for i in range(self.VERSION_SLOTS):
+            offset = self._versions_offset + i * self.VERSION_SLOT.size
+            slot_name, _ = self.VERSION_SLOT.unpack_from(mm, offset)
+            if slot_name == encoded:
+                return offset
+            if slot_name == b'\0' * 32:
+                if not create:
+                    return None
+                self.VERSION_SLOT.pack_into(mm, offset, encoded, 0)
+                return offset
+        raise RuntimeError('Закончились слоты для счётчиков версий')
+
+    def get_version(self, name):
+        with self._locked(False) as mm:
+            offset = self._version_slot(mm, name, create=False)
+            return self.VERSION_SLOT.unpack_from(mm, offset)[1] if offset is not None else 0
+
+    def bump_version(self, name):
+        with self._locked(True) as mm:
+            offset = self._version_slot(mm, name, create=True)
+            slot_name, value = self.VERSION_SLOT.unpack_from(mm, offset)
+            self.VERSION_SLOT.pack_into(mm, offset, slot_name, value + 1)
+            return value + 1
+
+    @staticmethod
+    def _hash(namespace, key):
+        """Стабильный между процессами 64-битный хэш ключа (hash() рандомизирован)"""
+        digest = hashlib.blake2b(f"{namespace}\0{key}".encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') or 1  # 0 означает пустой слот
+
+    def _slot_offsets(self, key_hash):
+        start = key_hash % self.cache_slots
+        for i in range(self.PROBES):
+            yield self._cache_offset + ((start + i) % self.cache_slots) * self.slot_size
+
+    def cache_get(self, namespace, key):
+        key_hash = self._hash(namespace, key)
+        now = time.time()
+        with self._locked(False) as mm:
+            for offset in self._slot_offsets(key_hash):
+                slot_hash, expires, length = self.CACHE_SLOT.unpack_from(mm, offset)
+                if slot_hash != key_hash or expires <= now:
+                    continue
+                start = offset + self.CACHE_SLOT.size
+                stored_namespace, stored_key, value = json.loads(mm[start:start + length])
+                if stored_namespace == namespace and stored_key == key:
+                    return value
+        return None
+
+    def cache_set(self, namespace, key, value, ttl):
+        payload = json.dumps([namespace, key, value], ensure_ascii=False).encode('utf-8')
+        if len(payload) > self.slot_size - self.CACHE_SLOT.size:
+            return  # Слишком большое значение в общий кэш не помещается
+        key_hash = self._hash(namespace, key)
+        now = time.time()
+        with self._locked(True) as mm:
+            target = None
+            oldest = None
+            for offset in self._slot_offsets(key_hash):
+                slot_hash, expires, _ = self.CACHE_SLOT.unpack_from(mm, offset)
+                if slot_hash == key_hash or slot_hash == 0 or expires <= now:
+                    target = offset
+                    break
+                if oldest is None or expires < oldest[0]:
+                    oldest = (expires, offset)
+            if target is None:
+                # Все слоты цепочки заняты - вытесняем запись, которая истекает раньше всех
+                target = oldest[1]
+            self.CACHE_SLOT.pack_into(mm, target, key_hash, now + ttl, len(payload))
+            start = target + self.CACHE_SLOT.size
+            mm[start:start + len(payload)] = payload
+
+
+def create_backend(kind, path):
+    """Создание бэкенда по названию из конфигурации ('sqlite' или 'shm')"""
+    if kind == 'sqlite':
+        return SQLiteBackend(path)
+    if kind == 'shm':
+        return SharedMemoryBackend(path)
+    raise ValueError(f"Неизвестный тип бэкенда: {kind}")
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Скорость и точность поиска повторов (dedupe.py).
+
+Создаётся журнал из --rows синтетических участников, среди которых доля
+--duplicates - подложенные повторы более ранних записей: номер в другом
+формате (8..., без кода страны, со скобками), фамилия и имя в обратном
+порядке, опечатка в имени вместе с опечаткой в одной цифре номера, а у
+части повторов - координаты с городом, которых не было в исходной записи.
+
+Измеряются время построения временной базы, поиска групп и записи отчёта,
+пиковая память процесса; затем проверяется, что найдены все подложенные
+повторы и нет лишних. С ключом --apply журнал объединяется и открывается
+заново (ParticipantLog) для проверки числа участников. Скрипт завершается
+с ошибкой, если найдены не все повторы или есть ложные.
+
+Использование: python benchmarks/bench_dedupe.py [--rows 1000000] [--duplicates 0.05] [--apply]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import resource
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dedupe import apply_log, build_index, find_duplicates, read_log, write_report
+from storage import ParticipantLog
+
+SURNAMES = ('Магомедов', 'Алиев', 'Гаджиев', 'Абдуллаев', 'Омаров', 'Рамазанов', 'Исмаилов', 'Курбанов',
+            'Сулейманов', 'Гасанов', 'Ибрагимов', 'Мусаев', 'Нурмагомедов', 'Ахмедов', 'Шамилов', 'Юсупов')
+NAMES = ('Магомед', 'Али', 'Рамазан', 'Шамиль', 'Ахмед', 'Руслан', 'Гаджи', 'Курбан', 'Мурад', 'Арсен',
+         'Рустам', 'Ислам', 'Тимур', 'Камиль', 'Саид', 'Умар', 'Хабиб', 'Заур', 'Эльдар', 'Расул')
+CITY = 'махачкала'
+
+
+def national_number(i):
+    """Уникальный номер 9XXXXXXXXX; соседние участники не делят половины номера"""
+    return f"9{(i * 387420489 + 12345) % 10 ** 9:09d}"
+
+
+def formatted(number, style):
+    if style == 0:
+        return f"+7 ({number[:3]}) {number[3:6]}-{number[6:8]}-{number[8:]}"
+    if style == 1:
+        return '8' + number
+    return number
+
+
+def typo(text, rng):
+    """Замена одной буквы после третьей (первые буквы входят в ключ блока)"""
+    position = rng.randrange(3, len(text))
+    return text[:position] + ('а' if text[position] != 'а' else 'о') + text[position + 1:]
+
+
+def synthetic(rows, share, planted, seed=1):
+    """(id, участник); id подложенных повторов добавляются в planted"""
+    rng = random.Random(seed)
+    originals = []
+    for record_id in range(1, rows + 1):
+        if originals and rng.random() < share:
+            source_id, surname, name, number, age = rng.choice(originals)
+            kind = rng.randrange(3)
+            if kind == 0:
+                full_name, phone = f"{surname} {name}", formatted(number, rng.choice((1, 2)))
+            elif kind == 1:
+                full_name, phone = f"{name.lower()} {surname.lower()}", formatted(number, 1)
+            else:
+                digits = list(number)
+                position = rng.randrange(1, 10)
+                digits[position] = str((int(digits[position]) + 1) % 10)
+                full_name, phone = f"{typo(surname, rng)} {name}", formatted(''.join(digits), 0)
+            planted.add(record_id)
+            coordinates = {'latitude': '42.98', 'longitude': '47.50', 'city': CITY}
+        else:
+            surname, name = rng.choice(SURNAMES), rng.choice(NAMES)
+            number = national_number(record_id)
+            age = str(18 + rng.randrange(50))
+            full_name, phone = f"{surname} {name}", formatted(number, 0)
+            if len(originals) < 100000:
+                originals.append((record_id, surname, name, number, age))
+            coordinates = {'latitude': '42.98', 'longitude': '47.50'}
+        yield record_id, {
+            'full_name': full_name,
+            'phone': phone,
+            'age': age,
+            'gender': 'male',
+            'ip_address': '127.0.0.1',
+            'location': None,
+            'coordinates': coordinates,
+            'registration_time': '2025-04-11 18:00:00',
+        }
+
+
+def write_log(path, rows, share):
+    planted = set()
+    with open(path, 'w', encoding='utf-8') as f:
+        for record_id, participant in synthetic(rows, share, planted):
+            f.write(json.dumps({'op': 'add', 'id': record_id, 'data': participant},
+                               ensure_ascii=False, separators=(',', ':')) + '\n')
+    return planted
+
+
+def peak_rss_mb():
+    # ru_maxrss в килобайтах на Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--duplicates', type=float, default=0.05)
+    parser.add_argument('--apply', action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'participants.jsonl')
+        planted = write_log(path, args.rows, args.duplicates)
+        print(f"Участников: {args.rows}, подложено повторов: {len(planted)}, "
+              f"журнал: {os.path.getsize(path) / 2 ** 20:.0f} МБ")
+        rss_before = peak_rss_mb()
+
+        conn = sqlite3.connect(os.path.join(tmp, 'dedupe.sqlite3'), isolation_level=None)
+        conn.execute('PRAGMA journal_mode=OFF')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute('BEGIN')
+        started = time.perf_counter()
+        build_index(conn, read_log(path))
+        indexed = time.perf_counter()
+        groups, skipped = find_duplicates(conn)
+        found = time.perf_counter()
+        merged, dropped = write_report(conn, groups, os.path.join(tmp, 'report.jsonl'))
+        reported = time.perf_counter()
+        conn.execute('COMMIT')
+        conn.close()
+
+        print(f"Временная база: {indexed - started:.1f} с, поиск групп: {found - indexed:.1f} с, "
+              f"отчёт: {reported - found:.1f} с, всего: {reported - started:.1f} с")
+        print(f"Пиковая память: {peak_rss_mb():.0f} МБ (до поиска {rss_before:.0f} МБ)")
+        missed = planted - set(dropped)
+        false = set(dropped) - planted
+        print(f"Групп: {len(merged)}, найдено повторов: {len(dropped)}, пропущено: {len(missed)}, "
+              f"ложных: {len(false)}, пропущено блоков: {skipped}")
+        with_city = sum(1 for data in merged.values() if data['coordinates'].get('city'))
+        print(f"Групп, где координаты дополнены городом: {with_city} из {len(merged)}")
+
+        if args.apply:
+            started = time.perf_counter()
+            apply_log(path, merged, dropped)
+            applied = time.perf_counter() - started
+            count = ParticipantLog(path).count()
+            print(f"Объединение журнала: {applied:.1f} с, участников после: {count} "
+                  f"(ожидалось {args.rows - len(dropped)})")
+            if count != args.rows - len(dropped):
+                sys.exit(1)
+
+    if missed or false:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
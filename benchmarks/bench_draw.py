@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Скорость и равномерность розыгрыша (draw.py).
+
+Скорость: создаётся журнал участников из --rows синтетических записей
+(каждая двадцатая повторяет телефон другой записи в другом формате),
+измеряется время открытия журнала и розыгрыша по нему, а также
+розыгрыша по списку в памяти и пиковый объём памяти процесса.
+
+Равномерность: --trials розыгрышей с разными зёрнами среди --population
+участников, где у части участников есть повторные записи. Число побед
+каждого телефона сравнивается с ожидаемым критерием хи-квадрат; скрипт
+завершается с ошибкой, если статистика превышает критическое значение
+(уровень значимости 0.001) или повторы выигрывают чаще остальных.
+
+Использование: python benchmarks/bench_draw.py [--rows 1000000] [--winners 10]
+                                               [--population 200] [--trials 20000]
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import resource
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from draw import draw_winners
+from storage import ParticipantLog, normalize_phone
+
+
+def synthetic(rows):
+    """Синтетические участники; каждая двадцатая запись - повтор телефона в другом формате"""
+    for i in range(rows):
+        number = i // 2 if i % 20 == 19 else i
+        phone = f"7{number:010d}" if i % 20 == 19 else f"+7 ({number // 10000000:03d}) {number % 10000000:07d}"
+        yield {
+            'full_name': f"Участник {i}",
+            'phone': phone,
+            'age': str(18 + i % 50),
+            'gender': 'male' if i % 2 else 'female',
+            'ip_address': '10.0.0.1',
+            'location': {'city': 'махачкала', 'region': 'Дагестан', 'country': 'Россия'},
+            'coordinates': None,
+            'registration_time': '2026-10-01 12:00:00',
+        }
+
+
+def write_log(path, rows):
+    """Журнал участников в формате ParticipantLog без затрат на добавление по одной записи"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for record_id, participant in enumerate(synthetic(rows), 1):
+            f.write(json.dumps({'op': 'add', 'id': record_id, 'data': participant},
+                               ensure_ascii=False, separators=(',', ':')) + '\n')
+
+
+def peak_rss_mb():
+    # ru_maxrss в килобайтах на Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench_speed(rows, winners):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'participants.jsonl')
+        write_log(path, rows)
+
+        started = time.perf_counter()
+        store = ParticipantLog(path)
+        open_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        result, entries = draw_winners(store.iter_all(), winners, 'benchmark')
+        draw_time = time.perf_counter() - started
+        assert len(result) == winners and entries == rows
+        assert len({phone for _, phone, _ in result}) == winners
+
+    participants = list(synthetic(rows))
+    started = time.perf_counter()
+    draw_winners(participants, winners, 'benchmark')
+    memory_time = time.perf_counter() - started
+
+    print(f"Записей: {rows}, победителей: {winners}")
+    print(f"  открытие журнала:          {open_time:8.2f} с")
+    print(f"  розыгрыш по журналу:       {draw_time:8.2f} с ({rows / draw_time:,.0f} записей/с)")
+    print(f"  розыгрыш по списку:        {memory_time:8.2f} с ({rows / memory_time:,.0f} записей/с)")
+    print(f"  пиковая память процесса:   {peak_rss_mb():8.0f} МБ")
+
+
+def chi_square_critical(df, z=3.09):
+    """Критическое значение хи-квадрат (аппроксимация Уилсона-Хилферти, z=3.09 - уровень 0.001)"""
+    return df * (1 - 2 / (9 * df) + z * math.sqrt(2 / (9 * df))) ** 3
+
+
+def check_uniformity(population, winners, trials):
+    """Проверка равномерности; возвращает True, если проверка пройдена"""
+    # У каждого пятого участника есть повторная запись с тем же телефоном в другом формате
+    participants = []
+    for i in range(population):
+        participants.append({'phone': f"+7 900 {i:07d}"})
+        if i % 5 == 0:
+            participants.append({'phone': f"7(900){i:07d}"})
+
+    wins = {}
+    for trial in range(trials):
+        result, _ = draw_winners(participants, winners, f"trial-{trial}")
+        for _, phone, _ in result:
+            wins[phone] = wins.get(phone, 0) + 1
+
+    expected = trials * winners / population
+    observed = [wins.get(normalize_phone(f"7900{i:07d}"), 0) for i in range(population)]
+    chi2 = sum((n - expected) ** 2 / expected for n in observed)
+    critical = chi_square_critical(population - 1)
+    duplicated = sum(observed[::5]) / len(observed[::5])
+    single = sum(n for i, n in enumerate(observed) if i % 5) / (population - len(observed[::5]))
+
+    print(f"Равномерность: {trials} розыгрышей, {population} телефонов, {winners} победителей")
+    print(f"  хи-квадрат: {chi2:.1f} (критическое значение {critical:.1f})")
+    print(f"  побед в среднем: с повтором {duplicated:.1f}, без повтора {single:.1f}, ожидается {expected:.1f}")
+    ok = chi2 <= critical and abs(duplicated - single) < 4 * math.sqrt(expected)
+    print('  проверка пройдена' if ok else '  ПРОВЕРКА НЕ ПРОЙДЕНА')
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--winners', type=int, default=10)
+    parser.add_argument('--population', type=int, default=200)
+    parser.add_argument('--trials', type=int, default=20000)
+    args = parser.parse_args()
+
+    ok = check_uniformity(args.population, args.winners, args.trials)
+    bench_speed(args.rows, args.winners)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк HTTP-эндпоинтов приложения с сохранением базовых результатов.
+
+Для каждого размера данных (--sizes) создаётся журнал из синтетических
+участников, а ip-api.com и Nominatim заменяются локальной заглушкой
+(stub_upstream.py). Затем по очереди нагружаются эндпоинты:
+
+    /register, /check-phone, /check-location, /check-coordinates,
+    /admin, /export-to-excel (CSV и Excel)
+
+в одном или двух режимах (--mode):
+
+- client   - тестовый клиент Flask в отдельном процессе, запросы идут
+             последовательно: чистое время обработки без сети;
+- gunicorn - настоящий процесс gunicorn (настройки из gunicorn.conf.py),
+             запросы по HTTP из --concurrency потоков.
+
+Для каждого эндпоинта выводятся p50/p99 задержки, пропускная способность и
+пиковая память (RSS процесса с тестовым клиентом или наибольший RSS
+воркера gunicorn после нагрузки на эндпоинт).
+
+Результаты сравниваются с сохранёнными базовыми (--baseline); скрипт
+завершается с ошибкой, если p99 выросла или пропускная способность упала
+больше чем на --tolerance. С ключом --save текущие результаты становятся
+новыми базовыми; вместе с ними в поле machine записываются процессор, число
+ядер, память, версия Python и параметры запуска - базовые результаты
+сравнимы только с прогонами на такой же машине.
+
+Использование:
+    python benchmarks/bench_endpoints.py [--mode client|gunicorn|both] [--sizes 1000,100000,1000000]
+        [--requests 200] [--concurrency 16] [--baseline benchmarks/baselines/endpoints.json]
+        [--tolerance 0.25] [--save]
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import tempfile
+import resource
+import subprocess
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_draw import write_log
+from stub_upstream import StubUpstream
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baselines', 'endpoints.json')
+
+# Пароль администратора (см. app.admin)
+ADMIN_PASSWORD = 'kvdarit_avto35'
+
+# Доля от --requests для эндпоинтов, стоимость которых растёт с числом участников
+EXPENSIVE_SHARE = 0.02
+
+
+def endpoint_request(name, n):
+    """Запрос номер n к эндпоинту: (метод, путь, данные формы, заголовки)"""
+    # Уникальный адрес клиента: каждый запрос по IP - промах кэша и обращение к заглушке
+    headers = {'X-Forwarded-For': f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}"}
+    if name == 'register':
+        headers['X-Requested-With'] = 'XMLHttpRequest'
+        return 'POST', '/register', {
+            'full_name': f"Нагрузка {n}",
+            'phone': f"+7 (950) {n:07d}",
+            'age': '30',
+            'gender': 'male',
+            # Центр Махачкалы - внутри офлайн-геозоны
+            'latitude': '42.9849',
+            'longitude': '47.5047',
+        }, headers
+    if name == 'check-phone':
+        # Чередуются зарегистрированные (из синтетических данных) и новые номера
+        phone = f"+7 (000) {n:07d}" if n % 2 else f"+7 (951) {n:07d}"
+        return 'GET', '/check-phone?' + urllib.parse.urlencode({'phone': phone}), None, headers
+    if name == 'check-location':
+        return 'GET', '/check-location', None, headers
+    if name == 'check-coordinates':
+        # Чётные точки внутри геозоны, нечётные - в Москве (проверяются через заглушку Nominatim)
+        lat, lng = (42.98 + n % 100 / 10000, 47.50) if n % 2 == 0 else (55.5 + n % 1000 / 1000, 37.5)
+        return 'GET', '/check-coordinates?' + urllib.parse.urlencode({'lat': f"{lat:.5f}", 'lng': f"{lng:.5f}"}), \
+            None, headers
+    if name == 'index':
+        headers['Accept-Encoding'] = 'gzip, deflate, br'
+        return 'GET', '/', None, headers
+    if name == 'index-304':
+        # Повторный визит: браузер проверяет сохранённую страницу (* совпадает с любым текущим ETag)
+        headers['If-None-Match'] = '*'
+        return 'GET', '/', None, headers
+    if name == 'admin':
+        return 'GET', '/admin', None, headers
+    if name == 'export-csv':
+        return 'GET', '/export-to-excel?format=csv', None, headers
+    if name == 'export-xlsx':
+        return 'GET', '/export-to-excel?format=xlsx', None, headers
+    raise ValueError(name)
+
+
+# Эндпоинты в порядке запуска и признак «дорогого» эндпоинта (O(N) на запрос)
+ENDPOINTS = (
+    ('register', False),
+    ('check-phone', False),
+    ('check-location', False),
+    ('check-coordinates', False),
+    ('index', False),
+    ('index-304', False),
+    ('admin', False),
+    ('export-csv', True),
+    ('export-xlsx', True),
+)
+
+
+def requests_for(expensive, requests, size):
+    """Число запросов к эндпоинту: выгрузки на больших данных запускаются лишь несколько раз"""
+    if not expensive:
+        return requests
+    return max(3, min(requests, int(requests * EXPENSIVE_SHARE * 100000 / max(size, 1))))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(latencies, elapsed, errors, peak_rss_mb):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'rps': round(len(latencies) / elapsed, 1),
+        'peak_rss_mb': round(peak_rss_mb, 1),
+    }
+
+
+def app_env(data_dir, stub_url):
+    """Переменные окружения приложения: данные во временном каталоге, геосервисы - заглушка"""
+    return dict(
+        os.environ,
+        DATA_FILE=os.path.join(data_dir, 'participants.json'),
+        SECRET_KEY='benchmark',
+        GEO_REMOTE_FALLBACK='true',
+        IP_DB_FILE=os.path.join(data_dir, 'missing.bin'),
+        GEO_IP_API_URL=stub_url + '/json/{}',
+        GEO_NOMINATIM_URL=stub_url + '/reverse',
+        # Лимиты провайдеров не должны ограничивать сам бенчмарк
+        GEO_IP_RATE='0',
+        GEO_NOMINATIM_RATE='0',
+        GEO_PROVIDER_CONCURRENCY='64',
+        # Все запросы идут с одного адреса и из одного блока номеров
+        RATE_LIMIT_ENABLED='false',
+    )
+
+
+# ----------------------------------------------------------------------
+# Тестовый клиент Flask (выполняется в дочернем процессе)
+# ----------------------------------------------------------------------
+
+def run_client_child(requests, size):
+    """Нагрузка через тестовый клиент; результат печатается одной строкой JSON"""
+    from app import create_app
+
+    client = create_app().test_client()
+    client.post('/admin', data={'password': ADMIN_PASSWORD})
+    results = {}
+    for name, expensive in ENDPOINTS:
+        latencies = []
+        errors = 0
+        started = time.perf_counter()
+        for n in range(requests_for(expensive, requests, size)):
+            method, path, data, headers = endpoint_request(name, n)
+            request_started = time.perf_counter()
+            response = client.open(path, method=method, data=data, headers=headers)
+            response.get_data()  # потоковые ответы читаются целиком
+            response.close()
+            latencies.append(time.perf_counter() - request_started)
+            if response.status_code >= 400:
+                errors += 1
+        elapsed = time.perf_counter() - started
+        # ru_maxrss в килобайтах на Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        results[name] = summarize(latencies, elapsed, errors, peak)
+    print(json.dumps(results))
+
+
+def bench_client(data_dir, stub_url, requests, size):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', '--requests', str(requests), '--sizes', str(size)],
+        cwd=ROOT, env=app_env(data_dir, stub_url), check=True, stdout=subprocess.PIPE, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+# ----------------------------------------------------------------------
+# gunicorn
+# ----------------------------------------------------------------------
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url, timeout=600):
+    # Открытие журнала с миллионом записей занимает заметное время
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1)
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError("Приложение не запустилось")
+
+
+def worker_peak_rss_mb(master_pid):
+    """Наибольший пиковый RSS (VmHWM) среди воркеров gunicorn, МБ (только Linux)"""
+    peak = 0
+    try:
+        with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+            children = f.read().split()
+    except OSError:
+        return 0
+    for pid in children:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        peak = max(peak, int(line.split()[1]) / 1024)
+        except OSError:
+            continue
+    return peak
+
+
+def http_request(base_url, cookie, name, n):
+    """Один HTTP-запрос; возвращает (время ответа, ошибка ли)"""
+    method, path, data, headers = endpoint_request(name, n)
+    headers = dict(headers, Cookie=cookie)
+    body = urllib.parse.urlencode(data).encode('utf-8') if data is not None else None
+    req = urllib.request.Request(base_url + path, data=body, headers=headers, method=method)
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=300) as response:
+            while response.read(65536):
+                pass
+            failed = False
+    except urllib.error.HTTPError as e:
+        failed = e.code >= 400
+    except Exception:
+        failed = True
+    return time.perf_counter() - started, failed
+
+
+def admin_cookie(base_url):
+    """Cookie сессии администратора"""
+    req = urllib.request.Request(base_url + '/admin', data=urllib.parse.urlencode({'password': ADMIN_PASSWORD}).encode())
+    with urllib.request.urlopen(req, timeout=60) as response:
+        response.read()
+        return response.headers['Set-Cookie'].split(';', 1)[0]
+
+
+def bench_gunicorn(data_dir, stub_url, requests, size, concurrency):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'wsgi:app', '--bind', f"127.0.0.1:{port}",
+         '--timeout', '600', '--log-level', 'warning'],
+        cwd=ROOT, env=app_env(data_dir, stub_url)
+    )
+    results = {}
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        wait_ready(f"{base_url}/check-phone")
+        cookie = admin_cookie(base_url)
+        for name, expensive in ENDPOINTS:
+            count = requests_for(expensive, requests, size)
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=1 if expensive else concurrency) as pool:
+                outcomes = list(pool.map(lambda n: http_request(base_url, cookie, name, n), range(count)))
+            elapsed = time.perf_counter() - started
+            results[name] = summarize([latency for latency, _ in outcomes], elapsed,
+                                      sum(1 for _, failed in outcomes if failed), worker_peak_rss_mb(server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+    return results
+
+
+# ----------------------------------------------------------------------
+# Базовые результаты
+# ----------------------------------------------------------------------
+
+def machine_info(args):
+    """Машина и параметры прогона для сохранения вместе с базовыми результатами"""
+    cpu = platform.processor()
+    try:
+        with open('/proc/cpuinfo') as f:
+            cpu = next((line.split(':', 1)[1].strip() for line in f if line.startswith('model name')), cpu)
+    except OSError:
+        pass
+    try:
+        memory_gb = round(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 2 ** 30, 1)
+    except (ValueError, OSError, AttributeError):
+        memory_gb = None
+    return {
+        'cpu': cpu,
+        'cpu_count': os.cpu_count(),
+        'memory_gb': memory_gb,
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'date': time.strftime('%Y-%m-%d'),
+        'mode': args.mode,
+        'sizes': args.sizes,
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'workers': int(os.environ.get('WEB_CONCURRENCY', 4)),  # по умолчанию как в gunicorn.conf.py
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Сравнение с базовыми результатами; возвращает список регрессий"""
+    regressions = []
+    for key, endpoints in results.items():
+        for name, current in endpoints.items():
+            base = baseline.get(key, {}).get(name)
+            if base is None:
+                continue
+            if current['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+                regressions.append(f"{key} {name}: p99 {base['p99_ms']} -> {current['p99_ms']} мс")
+            if current['rps'] < base['rps'] / (1 + tolerance):
+                regressions.append(f"{key} {name}: {base['rps']} -> {current['rps']} запросов/с")
+    return regressions
+
+
+def print_results(key, endpoints, baseline):
+    print(f"\n{key}")
+    print(f"{'эндпоинт':<18} {'запросов':>8} {'ошибок':>7} {'p50, мс':>9} {'p99, мс':>9} "
+          f"{'запросов/с':>11} {'RSS, МБ':>8} {'p99 базовый':>12}")
+    for name, r in endpoints.items():
+        base = baseline.get(key, {}).get(name)
+        print(f"{name:<18} {r['requests']:>8} {r['errors']:>7} {r['p50_ms']:>9} {r['p99_ms']:>9} "
+              f"{r['rps']:>11} {r['peak_rss_mb']:>8} {base['p99_ms'] if base else '-':>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=('client', 'gunicorn', 'both'), default='both')
+    parser.add_argument('--sizes', default='1000,100000,1000000')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--save', action='store_true')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    if args.child:
+        run_client_child(args.requests, sizes[0])
+        return
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        machine = baseline.pop('machine', None)
+        if machine and not args.save:
+            print(f"Базовые результаты: {machine['cpu']}, ядер {machine['cpu_count']}, "
+                  f"память {machine['memory_gb']} ГБ, Python {machine['python']}, {machine['date']}, "
+                  f"--requests {machine['requests']} --concurrency {machine['concurrency']}")
+
+    modes = ('client', 'gunicorn') if args.mode == 'both' else (args.mode,)
+    stub = StubUpstream()
+    results = {}
+    try:
+        for size in sizes:
+            for mode in modes:
+                # Для каждого прогона свежие данные: /register дописывает участников
+                with tempfile.TemporaryDirectory() as tmp:
+                    write_log(os.path.join(tmp, 'participants.jsonl'), size)
+                    if mode == 'client':
+                        endpoints = bench_client(tmp, stub.url, args.requests, size)
+                    else:
+                        endpoints = bench_gunicorn(tmp, stub.url, args.requests, size, args.concurrency)
+                key = f"{mode}/{size}"
+                results[key] = endpoints
+                print_results(key, endpoints, baseline)
+    finally:
+        stub.shutdown()
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(dict(baseline, machine=machine_info(args), **results), f, ensure_ascii=False, indent=1, sort_keys=True)
+        print(f"\nБазовые результаты сохранены: {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\nРегрессии относительно базовых результатов:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    if baseline:
+        print("\nРегрессий относительно базовых результатов нет")
+
+
+if __name__ == '__main__':
+    main()
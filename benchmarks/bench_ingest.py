@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Сравнение надёжной записи регистраций по одной и через очередь групповой записи.
+
+Для каждого размера всплеска (числа одновременных регистраций) запускается
+столько же потоков. Каждая регистрация считается принятой только после
+записи на диск:
+
+- по одной: append_unique и немедленный sync (свой fsync на каждую запись);
+- очередь: IngestQueue, один fsync на пачку.
+
+Часть телефонов в каждом всплеске повторяется, чтобы проверить отсев
+дублей внутри пачки. В конце сверяется число участников в хранилище.
+
+Использование: python benchmarks/bench_ingest.py [--engine log|sqlite] [--bursts 1,8,64,256] [--per-thread 20]
+                                                [--max-delay-ms 0]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import IngestQueue
+from storage import ParticipantLog, SQLiteParticipantStore
+
+
+def open_store(engine, directory):
+    if engine == 'sqlite':
+        return SQLiteParticipantStore(os.path.join(directory, 'participants.sqlite3'))
+    return ParticipantLog(os.path.join(directory, 'participants.jsonl'))
+
+
+def run_burst(register, threads, per_thread):
+    """Запуск всплеска; возвращает (время, принятых регистраций)"""
+    accepted = []
+    barrier = threading.Barrier(threads)
+
+    def worker(worker_id):
+        barrier.wait()
+        count = 0
+        for i in range(per_thread):
+            # Каждая десятая регистрация повторяет телефон соседнего потока
+            number = (worker_id + 1) % threads if i % 10 == 9 else worker_id
+            phone = f"+7 (9{number:02d}) {i:07d}" if i % 10 == 9 else f"+7 (8{worker_id:02d}) {i:07d}"
+            if register({'full_name': f"Участник {worker_id}-{i}", 'phone': phone, 'gender': 'male'}) is not None:
+                count += 1
+        accepted.append(count)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - started, sum(accepted)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--engine', choices=('log', 'sqlite'), default='log')
+    parser.add_argument('--bursts', default='1,8,64,256')
+    parser.add_argument('--per-thread', type=int, default=20)
+    parser.add_argument('--max-delay-ms', type=float, default=0)
+    args = parser.parse_args()
+
+    print(f"Хранилище: {args.engine}, регистраций на поток: {args.per_thread}")
+    print(f"{'всплеск':>8} {'по одной, рег/с':>16} {'очередь, рег/с':>15} {'пачка':>6} "
+          f"{'запись p50/p99, мс':>19} {'ответ p99, мс':>14}")
+    for threads in (int(n) for n in args.bursts.split(',')):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = open_store(args.engine, tmp)
+
+            def register_single(participant):
+                if args.engine == 'sqlite':
+                    # Как и групповая запись, фиксируем транзакцию на диске до ответа
+                    store._conn().execute('PRAGMA synchronous=FULL')
+                number = store.append_unique(participant)
+                store.sync()
+                return number
+
+            single_time, single_accepted = run_burst(register_single, threads, args.per_thread)
+            assert store.count() == single_accepted
+
+        with tempfile.TemporaryDirectory() as tmp:
+            store = open_store(args.engine, tmp)
+            ingest = IngestQueue(store, max_delay=args.max_delay_ms / 1000)
+            queued_time, queued_accepted = run_burst(lambda p: ingest.submit(p).result(), threads, args.per_thread)
+            assert store.count() == queued_accepted == single_accepted
+            stats = ingest.stats()
+
+        total = threads * args.per_thread
+        print(f"{threads:>8} {total / single_time:>16.0f} {total / queued_time:>15.0f} {stats['avg_batch']:>6} "
+              f"{stats['commit_p50_ms']:>9} / {stats['commit_p99_ms']:<7} {stats['wait_p99_ms']:>14}")
+
+
+if __name__ == '__main__':
+    main()
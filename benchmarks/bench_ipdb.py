@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Замер скорости офлайн-базы IP-адресов (ipdb.py).
+
+Генерирует случайные непересекающиеся диапазоны (по умолчанию 1 млн),
+собирает из них двоичный файл и измеряет время сборки, время открытия
+файла и скорость поиска.
+
+Использование: python benchmarks/bench_ipdb.py [--ranges 1000000] [--lookups 200000]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import ipaddress
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ipdb import IPDatabase, build
+
+CITIES = ['махачкала', 'каспийск', 'дербент', 'буйнакск', 'хасавюрт', 'москва']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ranges', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    # Делим адресное пространство на равные блоки и берём в каждом случайный поддиапазон
+    step = (2 ** 32) // args.ranges
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'ranges.csv')
+        bin_path = os.path.join(tmp, 'ranges.bin')
+        with open(csv_path, 'w', encoding='utf-8') as f:
+            for i in range(args.ranges):
+                start = i * step + rng.randrange(step // 2)
+                end = start + rng.randrange(1, step // 2)
+                city = rng.choice(CITIES)
+                f.write(f"{ipaddress.IPv4Address(start)}-{ipaddress.IPv4Address(end)},{city},Регион,Россия\n")
+
+        started = time.perf_counter()
+        build(csv_path, bin_path)
+        build_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        database = IPDatabase(bin_path)
+        open_time = time.perf_counter() - started
+
+        addresses = [str(ipaddress.IPv4Address(rng.randrange(2 ** 32))) for _ in range(args.lookups)]
+        found = 0
+        started = time.perf_counter()
+        for address in addresses:
+            if database.lookup(address) is not None:
+                found += 1
+        lookup_time = time.perf_counter() - started
+
+        print(f"Диапазонов: {args.ranges}, размер файла: {os.path.getsize(bin_path) / 1024 / 1024:.1f} МБ")
+        print(f"Сборка: {build_time:.2f} с, открытие: {open_time * 1000:.2f} мс")
+        print(f"Поиск: {lookup_time / args.lookups * 1e6:.2f} мкс на адрес "
+              f"({args.lookups / lookup_time:.0f} запросов/с), найдено: {found}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Память на участника: словари (прежний формат) и компактные записи (records.py).
+
+Синтетические участники кодируются в строки журнала и разбираются обратно
+json.loads, как при открытии журнала, поэтому строки не разделяются между
+записями так, как в исходном генераторе. Для каждого формата tracemalloc
+измеряет объём памяти, который занимает список участников, и время
+построения. Затем открывается журнал ParticipantLog с теми же участниками
+и сравнивается прирост RSS процесса.
+
+Использование: python benchmarks/bench_memory.py [--rows 200000]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_draw import synthetic, write_log
+from records import Participant
+from storage import ParticipantLog
+
+
+def rss_mb():
+    """Текущий RSS процесса, МБ (только Linux)"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0
+
+
+def measure(build, lines):
+    """(байт на участника, секунд) для построения списка участников"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    participants = [build(json.loads(line)) for line in lines]
+    elapsed = time.perf_counter() - started
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del participants
+    return size / len(lines), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    lines = [json.dumps(p, ensure_ascii=False) for p in synthetic(args.rows)]
+    dict_bytes, dict_time = measure(lambda data: data, lines)
+    compact_bytes, compact_time = measure(Participant, lines)
+    del lines
+
+    print(f"Участников: {args.rows}")
+    print(f"{'формат':<12} {'байт на участника':>18} {'построение, с':>14}")
+    print(f"{'словари':<12} {dict_bytes:>18.0f} {dict_time:>14.2f}")
+    print(f"{'компактный':<12} {compact_bytes:>18.0f} {compact_time:>14.2f}")
+    print(f"Экономия: {1 - compact_bytes / dict_bytes:.0%}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'participants.jsonl')
+        write_log(path, args.rows)
+        before = rss_mb()
+        started = time.perf_counter()
+        store = ParticipantLog(path)
+        elapsed = time.perf_counter() - started
+        print(f"ParticipantLog: открытие {elapsed:.2f} с, прирост RSS {rss_mb() - before:.0f} МБ "
+              f"({(rss_mb() - before) * 1024 * 1024 / store.count():.0f} байт на участника с индексами)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Время запуска приложения и память воркеров gunicorn.
+
+Создаётся журнал из --rows синтетических участников (см. bench_draw.py),
+после чего измеряется:
+
+- холодный запуск в отдельных процессах (медиана из --repeat): время
+  import app и create_app() (открытие хранилища и загрузка снимков) за
+  вычетом запуска самого интерпретатора, а также какие тяжёлые модули
+  (xlsxwriter, requests, httpx, PIL, brotli) загружены после запуска - они
+  должны импортироваться только при выгрузке, при промахе кэша геолокации,
+  при сборке статических файлов и при первом сжатии страницы;
+- gunicorn с --workers воркерами с preload_app и без него: время до
+  первого ответа и память (PSS всех процессов и частная память воркера
+  по /proc/<pid>/smaps_rollup, только Linux). Без preload каждый воркер,
+  в том числе перезапущенный после --max-requests, сам выполняет
+  create_app(); с preload воркер получает готовые снимки при fork;
+- открытые файлы SQLite (база участников при --storage sqlite и общее
+  состояние SHARED_BACKEND=sqlite) после create_app() и в главном процессе
+  gunicorn с preload: соединения, унаследованные воркерами при fork,
+  повреждают базу, поэтому их быть не должно - каждый процесс открывает
+  свои при первом обращении.
+
+Использование: python benchmarks/bench_startup.py [--rows 100000] [--workers 4] [--repeat 5] [--storage log]
+
+Код выхода 1, если после запуска загружены тяжёлые модули или остались
+открытыми файлы SQLite.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_draw import write_log
+from bench_endpoints import ROOT, app_env, free_port, wait_ready
+
+HEAVY_MODULES = ('xlsxwriter', 'requests', 'httpx', 'PIL', 'brotli')
+
+
+def sqlite_files(pid='self'):
+    """Файлы SQLite (база, -wal, -shm), открытые процессом"""
+    fd_dir = f"/proc/{pid}/fd"
+    if not os.path.isdir(fd_dir):
+        return []
+    paths = []
+    for fd in os.listdir(fd_dir):
+        try:
+            path = os.readlink(os.path.join(fd_dir, fd))
+        except OSError:
+            continue
+        if path.endswith(('.sqlite3', '.sqlite3-wal', '.sqlite3-shm')):
+            paths.append(path)
+    return sorted(paths)
+
+
+# Выполняется в дочернем процессе: время импорта и фабрики, загруженные тяжёлые модули,
+# открытые файлы SQLite
+CHILD = f"""
+import sys, time, json
+sys.path.insert(0, 'benchmarks')
+from bench_startup import sqlite_files
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+loaded_on_import = [name for name in {HEAVY_MODULES!r} if name in sys.modules]
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({{
+    'import': imported - started,
+    'create_app': created - imported,
+    'loaded_on_import': loaded_on_import,
+    'loaded_after_create': [name for name in {HEAVY_MODULES!r} if name in sys.modules],
+    'sqlite_after_create': sqlite_files(),
+}}))
+"""
+
+
+def run_python(code, env):
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return time.perf_counter() - started, output
+
+
+def bench_cold_start(env, repeat):
+    interpreter = statistics.median(run_python('pass', env)[0] for _ in range(repeat))
+    runs = [json.loads(run_python(CHILD, env)[1].strip().splitlines()[-1]) for _ in range(repeat)]
+    print(f"Запуск интерпретатора: {interpreter * 1000:.0f} мс")
+    print(f"import app:            {statistics.median(run['import'] for run in runs) * 1000:.0f} мс")
+    print(f"create_app():          {statistics.median(run['create_app'] for run in runs) * 1000:.0f} мс")
+    print(f"Тяжёлые модули после импорта: {', '.join(runs[0]['loaded_on_import']) or 'нет'}; "
+          f"после create_app(): {', '.join(runs[0]['loaded_after_create']) or 'нет'}")
+    print(f"Открытые файлы SQLite после create_app(): {', '.join(runs[0]['sqlite_after_create']) or 'нет'}")
+    return runs[0]['loaded_after_create'], runs[0]['sqlite_after_create']
+
+
+def smaps_kb(pid):
+    """Pss и Private_* процесса из smaps_rollup, КБ"""
+    values = {'Pss': 0, 'Private': 0}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            field, _, rest = line.partition(':')
+            if field == 'Pss':
+                values['Pss'] = int(rest.split()[0])
+            elif field.startswith('Private_'):
+                values['Private'] += int(rest.split()[0])
+    return values
+
+
+def worker_pids(master_pid):
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def bench_gunicorn(env, workers, preload):
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'wsgi:app', '--bind', f"127.0.0.1:{port}", '--workers', str(workers),
+         '--timeout', '600', '--log-level', 'warning'],
+        cwd=ROOT, env=dict(env, GUNICORN_PRELOAD='true' if preload else 'false')
+    )
+    try:
+        wait_ready(f"http://127.0.0.1:{port}/check-phone")
+        ready = time.perf_counter() - started
+        # Ждём, пока ответят все воркеры, а не только первый
+        deadline = time.time() + 600
+        while len(worker_pids(server.pid)) < workers and time.time() < deadline:
+            time.sleep(0.2)
+        time.sleep(1)
+        pids = worker_pids(server.pid)
+        memory = [smaps_kb(pid) for pid in pids]
+        total_pss = smaps_kb(server.pid)['Pss'] + sum(m['Pss'] for m in memory)
+        private = statistics.mean(m['Private'] for m in memory)
+        master_sqlite = sqlite_files(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+    label = 'preload' if preload else 'без preload'
+    print(f"gunicorn {label:12} первый ответ: {ready:6.2f} с, PSS всех процессов: {total_pss / 1024:7.1f} МБ, "
+          f"частная память воркера: {private / 1024:7.1f} МБ")
+    if master_sqlite:
+        print(f"  главный процесс держит открытыми: {', '.join(master_sqlite)}")
+    return master_sqlite
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--storage', choices=('log', 'sqlite'), default='log')
+    parser.add_argument('--skip-gunicorn', action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_log(os.path.join(tmp, 'participants.jsonl'), args.rows)
+        # Заглушка геосервисов не нужна: при запуске запросов к ним нет
+        env = dict(app_env(tmp, 'http://127.0.0.1:9'), STORAGE_ENGINE=args.storage)
+        print(f"Участников: {args.rows}, хранилище: {args.storage}")
+        loaded, open_sqlite = bench_cold_start(env, args.repeat)
+        if not args.skip_gunicorn:
+            for preload in (False, True):
+                master_sqlite = bench_gunicorn(env, args.workers, preload)
+                if preload:
+                    open_sqlite = open_sqlite or master_sqlite
+
+    if loaded or open_sqlite:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
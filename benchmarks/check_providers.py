@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Проверка клиентов провайдеров геолокации на локальной заглушке.
+
+Проверяются переиспользование соединений, ограничения числа одновременных
+запросов и частоты (в том числе общий для нескольких процессов лимит), а также автоматический выключатель: после ошибок и
+ответа 429 запросы отклоняются сразу, без ожидания таймаута, а после паузы
+провайдер снова становится доступен.
+
+Использование: python benchmarks/check_providers.py
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+from multiprocessing import Process, Queue
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from providers import Provider, ProviderUnavailable, SharedRateLimiter
+from ratelimit import TokenBuckets
+from stub_upstream import StubUpstream
+
+failures = []
+
+
+def check(name, condition, details=''):
+    print(f"{'OK  ' if condition else 'FAIL'} {name}{f' ({details})' if details else ''}")
+    if not condition:
+        failures.append(name)
+
+
+def call(provider, url):
+    """Запрос; возвращает (успех, время)"""
+    started = time.perf_counter()
+    try:
+        provider.get_json(url)
+        ok = True
+    except ProviderUnavailable:
+        ok = False
+    return ok, time.perf_counter() - started
+
+
+def check_connection_reuse(stub):
+    stub.reset_counters()
+    provider = Provider('reuse')
+    for i in range(50):
+        provider.get_json(f"{stub.url}/json/10.0.0.{i}")
+    check("синхронные запросы используют одно соединение", stub.connections == 1,
+          f"запросов {stub.requests}, соединений {stub.connections}")
+
+    stub.reset_counters()
+
+    async def run():
+        for i in range(50):
+            await provider.aget_json(f"{stub.url}/json/10.0.1.{i}")
+
+    asyncio.run(run())
+    check("асинхронные запросы используют одно соединение", stub.connections == 1,
+          f"запросов {stub.requests}, соединений {stub.connections}")
+
+
+def check_concurrency_limit(stub):
+    stub.reset_counters()
+    stub.delay = 0.1
+    provider = Provider('concurrency', max_concurrency=5, acquire_timeout=10)
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        results = list(pool.map(lambda i: call(provider, f"{stub.url}/json/10.0.2.{i}"), range(40)))
+    stub.delay = 0
+    check("не больше 5 одновременных запросов", stub.max_active <= 5 and all(ok for ok, _ in results),
+          f"максимум одновременно {stub.max_active}")
+
+
+def check_rate_limit(stub):
+    stub.reset_counters()
+    provider = Provider('rate', rate=2, burst=5)
+    results = [call(provider, f"{stub.url}/json/10.0.3.{i}") for i in range(20)]
+    passed = sum(1 for ok, _ in results if ok)
+    check("лимит частоты: проходит только запас корзины", passed == 5 and stub.requests == 5,
+          f"прошло {passed} из 20")
+    time.sleep(0.6)
+    check("лимит частоты: корзина пополняется", call(provider, f"{stub.url}/json/10.0.3.99")[0])
+
+
+def shared_rate_worker(buckets, url, results):
+    provider = Provider('shared', limiter=SharedRateLimiter(buckets, 'shared', rate=0.01, burst=5))
+    results.put(sum(1 for i in range(10) if call(provider, f"{url}/json/10.0.7.{i}")[0]))
+
+
+def check_shared_rate_limit(stub):
+    stub.reset_counters()
+    with tempfile.TemporaryDirectory() as tmp:
+        buckets = TokenBuckets(os.path.join(tmp, 'geo-ratelimit.bin'), stripes=1, slots_per_stripe=64)
+        results = Queue()
+        processes = [Process(target=shared_rate_worker, args=(buckets, stub.url, results)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        passed = sum(results.get() for _ in processes)
+        for process in processes:
+            process.join()
+    check("общий лимит частоты: 4 процесса получают одну корзину", passed == 5 and stub.requests == 5,
+          f"прошло {passed} из 40")
+
+
+def check_breaker_on_errors(stub):
+    stub.reset_counters()
+    stub.mode = 'error'
+    provider = Provider('errors', failure_threshold=3, reset_timeout=0.5)
+    results = [call(provider, f"{stub.url}/json/10.0.4.{i}") for i in range(10)]
+    fast = max(elapsed for _, elapsed in results[3:])
+    check("выключатель размыкается после 3 ошибок", stub.requests == 3 and provider.breaker.state == 'open',
+          f"дошло до сервиса {stub.requests}")
+    check("при разомкнутом выключателе отказ без ожидания", fast < 0.01, f"{fast * 1000:.2f} мс")
+
+    stub.mode = 'ok'
+    time.sleep(0.6)
+    ok, _ = call(provider, f"{stub.url}/json/10.0.4.100")
+    check("после паузы пробный запрос замыкает выключатель", ok and provider.breaker.state == 'closed')
+
+
+def check_breaker_on_timeouts(stub):
+    stub.reset_counters()
+    stub.delay = 1.0
+    provider = Provider('timeouts', timeout=0.2, failure_threshold=2, reset_timeout=30)
+    results = [call(provider, f"{stub.url}/json/10.0.5.{i}") for i in range(6)]
+    stub.delay = 0
+    slow = sum(elapsed for _, elapsed in results)
+    check("медленный сервис: ждём таймаут только до размыкания", stub.requests == 2 and slow < 0.6,
+          f"дошло до сервиса {stub.requests}, общее время {slow:.2f} с")
+
+
+def check_rate_limited_by_service(stub):
+    stub.reset_counters()
+    stub.mode = '429'
+    stub.rate_limit_ttl = 1
+    provider = Provider('429', failure_threshold=5, reset_timeout=30)
+    results = [call(provider, f"{stub.url}/json/10.0.6.{i}") for i in range(5)]
+    check("ответ 429 сразу размыкает выключатель", stub.requests == 1 and not any(ok for ok, _ in results),
+          f"дошло до сервиса {stub.requests}")
+    stub.mode = 'ok'
+    time.sleep(1.1)
+    check("после паузы из X-Ttl запросы возобновляются", call(provider, f"{stub.url}/json/10.0.6.100")[0])
+
+
+def main():
+    stub = StubUpstream()
+    try:
+        check_connection_reuse(stub)
+        check_concurrency_limit(stub)
+        check_rate_limit(stub)
+        check_shared_rate_limit(stub)
+        check_breaker_on_errors(stub)
+        check_breaker_on_timeouts(stub)
+        check_rate_limited_by_service(stub)
+    finally:
+        stub.shutdown()
+    if failures:
+        print(f"Не пройдено проверок: {len(failures)}")
+        sys.exit(1)
+    print("Все проверки пройдены")
+
+
+if __name__ == '__main__':
+    main()
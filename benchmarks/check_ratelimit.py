@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Проверка ограничения частоты (ratelimit.py) под конкурентной нагрузкой.
+
+Несколько процессов по несколько потоков одновременно списывают токены
+из одной корзины с пачкой --burst и почти нулевым пополнением: разрешено
+должно быть ровно --burst запросов, сколько бы воркеров их ни делало.
+Затем измеряется время одной проверки для разных ключей.
+
+Использование: python benchmarks/check_ratelimit.py [--processes 4] [--threads 8] [--burst 100]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from multiprocessing import Process, Queue
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ratelimit import Limit, TokenBuckets
+
+
+def worker(buckets, limit, threads, attempts, results):
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        outcomes = list(pool.map(lambda _: buckets.take(limit, 'shared-key'), range(attempts)))
+    results.put(sum(1 for retry_after in outcomes if retry_after == 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--burst', type=int, default=100)
+    parser.add_argument('--attempts', type=int, default=2000, help='попыток на процесс')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        buckets = TokenBuckets(os.path.join(tmp, 'ratelimit.bin'))
+        # Одна тысячная запроса в минуту: за время проверки корзина не пополняется
+        limit = Limit('check', 0.001, args.burst)
+        results = Queue()
+        processes = [Process(target=worker, args=(buckets, limit, args.threads, args.attempts, results))
+                     for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        allowed = sum(results.get() for _ in processes)
+        for process in processes:
+            process.join()
+        print(f"Процессов: {args.processes}, потоков: {args.threads}, попыток: {args.processes * args.attempts}")
+        print(f"Разрешено: {allowed}, ожидалось: {args.burst}")
+
+        count = 100000
+        started = time.perf_counter()
+        for n in range(count):
+            buckets.take(limit, f"client-{n}")
+        print(f"Проверка лимита: {(time.perf_counter() - started) / count * 1e6:.1f} мкс")
+
+    if allowed != args.burst:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Нагрузочная проверка регистрации при медленных сервисах геолокации.
+
+Запускает заглушку ip-api.com/Nominatim, отвечающую с задержкой, и
+приложение под gunicorn, настроенное на обращение к заглушке. Затем
+отправляет регистрации с координатами вне офлайн-геозоны и адресами,
+которых нет в офлайн-базе, так что каждый запрос проверяется удалённо
+по координатам и по IP. В конце выводятся пропускная способность и
+задержки.
+
+Использование:
+    python benchmarks/load_register.py [--client async|threads] [--worker-class gthread|sync]
+        [--workers 2] [--threads 32] [--delay 1.0] [--requests 400] [--concurrency 100]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import subprocess
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from stub_upstream import StubUpstream
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1)
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError("Приложение не запустилось")
+
+
+def register(base_url, number):
+    """Одна регистрация; возвращает (успех, время ответа)"""
+    data = urllib.parse.urlencode({
+        'full_name': f"Участник {number}",
+        'phone': f"+7 (900) {number:07d}",
+        'age': '30',
+        'gender': 'male',
+        # Москва - вне офлайн-геозоны, каждая точка в своей ячейке кэша
+        'latitude': f"{55.5 + random.random():.5f}",
+        'longitude': f"{37.0 + random.random():.5f}",
+    }).encode('utf-8')
+    req = urllib.request.Request(f"{base_url}/register", data=data, headers={
+        'X-Requested-With': 'XMLHttpRequest',
+        # Уникальный адрес, чтобы не попадать в кэш геолокации по IP
+        'X-Forwarded-For': f"10.{number >> 16 & 255}.{number >> 8 & 255}.{number & 255}",
+    })
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=60) as response:
+            ok = json.load(response).get('success', False)
+    except Exception:
+        ok = False
+    return ok, time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--client', choices=('async', 'threads'), default='async')
+    parser.add_argument('--worker-class', default='gthread')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--delay', type=float, default=1.0)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=100)
+    args = parser.parse_args()
+
+    stub = StubUpstream(delay=args.delay)
+    stub_url = stub.url
+    port = free_port()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_file = os.path.join(tmp, 'participants.json')
+        with open(data_file, 'w', encoding='utf-8') as f:
+            f.write('[]')
+        env = dict(
+            os.environ,
+            DATA_FILE=data_file,
+            GEO_HTTP_CLIENT=args.client,
+            GEO_REMOTE_FALLBACK='true',
+            IP_DB_FILE=os.path.join(tmp, 'missing.bin'),
+            GEO_IP_API_URL=stub_url + '/json/{}',
+            GEO_NOMINATIM_URL=stub_url + '/reverse',
+            GEO_DEADLINE=str(args.delay + 2),
+            # Лимиты провайдеров не должны ограничивать саму нагрузочную проверку
+            GEO_PROVIDER_CONCURRENCY=str(args.threads * 2),
+            GEO_IP_RATE='0',
+            GEO_NOMINATIM_RATE='0',
+            # Все запросы идут с одного адреса и из одного блока номеров
+            RATE_LIMIT_ENABLED='false',
+        )
+        server = subprocess.Popen([
+            sys.executable, '-m', 'gunicorn', 'wsgi:app',
+            '--bind', f"127.0.0.1:{port}",
+            '--workers', str(args.workers),
+            '--worker-class', args.worker_class,
+            '--threads', str(args.threads),
+            '--timeout', '120',
+            '--log-level', 'warning',
+        ], cwd=ROOT, env=env)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            wait_ready(f"{base_url}/check-phone")
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                results = list(pool.map(lambda n: register(base_url, n), range(args.requests)))
+            elapsed = time.perf_counter() - started
+        finally:
+            server.terminate()
+            server.wait()
+    stub.shutdown()
+
+    latencies = [latency for _, latency in results]
+    succeeded = sum(1 for ok, _ in results if ok)
+    print(f"Клиент: {args.client}, воркеры: {args.workers} x {args.worker_class} ({args.threads} потоков), "
+          f"задержка сервиса: {args.delay} с")
+    print(f"Запросов: {args.requests}, успешных: {succeeded}, время: {elapsed:.2f} с, "
+          f"{args.requests / elapsed:.1f} запросов/с")
+    print(f"Задержка: p50 {percentile(latencies, 0.5):.2f} с, p99 {percentile(latencies, 0.99):.2f} с")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Нагрузочная проверка журнала участников в нескольких процессах.
+
+Каждый процесс ведёт себя как отдельный воркер gunicorn: создаёт свой бэкенд
+и своё хранилище и параллельно с остальными регистрирует участников. Часть
+телефонов общая для всех процессов - такой номер должен быть зарегистрирован
+ровно один раз. В конце журнал перечитывается заново и сверяется с ожиданием.
+
+Использование: python benchmarks/stress_multiprocess.py [--backend sqlite|shm] [--workers 4] [--per-worker 500]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import create_backend
+from storage import ParticipantLog, normalize_phone
+
+# Телефоны, за которые соревнуются все процессы
+CONTESTED_PHONES = 50
+
+
+def worker(worker_id, backend_kind, state_path, log_path, per_worker, start_event, results):
+    backend = create_backend(backend_kind, state_path)
+    store = ParticipantLog(log_path, backend=backend)
+    start_event.wait()
+
+    saved = 0
+    contested_won = 0
+    for i in range(per_worker):
+        phone = f"+7 ({worker_id:03d}) {i:07d}"
+        if store.append_unique({'full_name': f"Участник {worker_id}-{i}", 'phone': phone}) is not None:
+            saved += 1
+        # Номер из общего набора, записанный в другом формате
+        contested = f"8-900-{i % CONTESTED_PHONES:07d}"
+        if store.append_unique({'full_name': f"Общий {worker_id}-{i}", 'phone': contested}) is not None:
+            contested_won += 1
+        # Чтение между записями, как это делают /check-phone и /admin
+        store.has_phone(phone)
+        if i % 100 == 0:
+            store.count()
+    store.sync()
+    results.put((saved, contested_won))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=['sqlite', 'shm'], default='sqlite')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--per-worker', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        state_path = os.path.join(tmp, 'shared_state')
+        log_path = os.path.join(tmp, 'participants.jsonl')
+        # Инициализируем файлы заранее, чтобы процессы стартовали одновременно
+        ParticipantLog(log_path, backend=create_backend(args.backend, state_path))
+
+        start_event = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=worker,
+                args=(n, args.backend, state_path, log_path, args.per_worker, start_event, results)
+            )
+            for n in range(args.workers)
+        ]
+        for process in processes:
+            process.start()
+        started = time.perf_counter()
+        start_event.set()
+        totals = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        saved = sum(t[0] for t in totals)
+        contested = sum(t[1] for t in totals)
+        expected = args.workers * args.per_worker + min(args.per_worker, CONTESTED_PHONES)
+
+        reloaded = ParticipantLog(log_path).all()
+        phones = [normalize_phone(p['phone']) for p in reloaded]
+
+        print(f"Бэкенд: {args.backend}, процессов: {args.workers}, записей на процесс: {args.per_worker}")
+        print(f"Подтверждено записей: {saved + contested}, в журнале: {len(reloaded)}, ожидалось: {expected}")
+        print(f"Время: {elapsed:.2f} с, {len(reloaded) / elapsed:.0f} регистраций/с")
+
+        errors = []
+        if saved + contested != len(reloaded):
+            errors.append('число подтверждённых записей не совпадает с журналом (потерянные регистрации)')
+        if len(reloaded) != expected:
+            errors.append('в журнале не то количество участников')
+        if len(set(phones)) != len(phones):
+            errors.append('в журнале есть повторяющиеся телефоны')
+        for error in errors:
+            print(f"ОШИБКА: {error}")
+        return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
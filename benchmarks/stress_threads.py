@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Нагрузочная проверка хранилища участников в одном процессе с множеством потоков.
+
+Одновременно работают:
+
+- регистрации через очередь групповой записи (часть телефонов повторяется);
+- удаления случайных участников по идентификатору;
+- чтения админ-панели: страницы с сортировкой и поиском, счётчики,
+  проверка телефона, полный список и выгрузка.
+
+Для каждой операции собираются задержки; проверка не проходит, если какой-то
+поток не завершился (взаимная блокировка), если операция выполнялась дольше
+--stall секунд или если нарушены инварианты: телефоны уникальны, страницы
+упорядочены, после повторного открытия с диска данные совпадают.
+
+Использование: python benchmarks/stress_threads.py [--engine log|sqlite] [--duration 10]
+    [--registrars 16] [--deleters 2] [--readers 8] [--stall 1.0]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+import faulthandler
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import IngestQueue
+from storage import ParticipantLog, SQLiteParticipantStore, SORT_FIELDS, normalize_phone
+
+
+def open_store(engine, directory):
+    if engine == 'sqlite':
+        return SQLiteParticipantStore(os.path.join(directory, 'participants.sqlite3'))
+    return ParticipantLog(os.path.join(directory, 'participants.jsonl'))
+
+
+class Recorder:
+    """Задержки операций и найденные нарушения"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = []
+
+    def timed(self, name, function, *args):
+        started = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies[name].append(elapsed)
+        return result
+
+    def error(self, message):
+        with self._lock:
+            if len(self.errors) < 20:
+                self.errors.append(message)
+
+
+def registrar(worker_id, ingest, recorder, stop):
+    number = 0
+    while not stop.is_set():
+        # Каждая пятая регистрация повторяет телефон, общий для всех потоков
+        phone = f"+7 (999) {number % 50:07d}" if number % 5 == 4 else f"+7 ({worker_id:03d}) {number:07d}"
+        participant = {
+            'full_name': f"Участник {worker_id}-{number}",
+            'phone': phone,
+            'age': str(18 + number % 60),
+            'gender': 'male' if number % 2 else 'female',
+            'registration_time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        recorder.timed('register', lambda: ingest.submit(participant).result())
+        number += 1
+
+
+def deleter(store, recorder, stop):
+    while not stop.is_set():
+        participants, _ = store.page(offset=random.randint(0, 200), limit=1, sort='id', descending=False)
+        if participants:
+            recorder.timed('delete', store.delete, participants[0]['id'])
+        time.sleep(0.001)
+
+
+def reader(store, recorder, stop):
+    while not stop.is_set():
+        operation = random.random()
+        if operation < 0.4:
+            sort = random.choice(SORT_FIELDS)
+            query = random.choice([None, None, 'Участник 1', '999'])
+            items, found = recorder.timed('page', store.page, random.randint(0, 100), 50, sort, True, query)
+            ids = [item['id'] for item in items]
+            if len(set(ids)) != len(ids):
+                recorder.error(f"повторяющиеся id на странице: {ids}")
+            if sort == 'id' and ids != sorted(ids, reverse=True):
+                recorder.error(f"страница не упорядочена: {ids}")
+            if len(items) > found:
+                recorder.error(f"на странице {len(items)} записей, найдено {found}")
+        elif operation < 0.6:
+            recorder.timed('count', store.count)
+            recorder.timed('gender_counts', store.gender_counts)
+        elif operation < 0.9:
+            recorder.timed('has_phone', store.has_phone, f"+7 (999) {random.randint(0, 49):07d}")
+        elif operation < 0.97:
+            participants = recorder.timed('all', store.all)
+            phones = [normalize_phone(p.get('phone')) for p in participants]
+            if len(set(phones)) != len(phones):
+                recorder.error("в списке участников повторяются телефоны")
+        else:
+            recorder.timed('iter_all', lambda: sum(1 for _ in store.iter_all()))
+        # Админ-панель не опрашивает хранилище в бесконечном цикле
+        time.sleep(0.001)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--engine', choices=('log', 'sqlite'), default='log')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--registrars', type=int, default=16)
+    parser.add_argument('--deleters', type=int, default=2)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--stall', type=float, default=1.0)
+    args = parser.parse_args()
+
+    recorder = Recorder()
+    stop = threading.Event()
+    with tempfile.TemporaryDirectory() as tmp:
+        store = open_store(args.engine, tmp)
+        ingest = IngestQueue(store)
+        threads = (
+            [threading.Thread(target=registrar, args=(n, ingest, recorder, stop)) for n in range(args.registrars)]
+            + [threading.Thread(target=deleter, args=(store, recorder, stop)) for _ in range(args.deleters)]
+            + [threading.Thread(target=reader, args=(store, recorder, stop)) for _ in range(args.readers)]
+        )
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+
+        deadline = time.monotonic() + 30
+        for thread in threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        stuck = [thread for thread in threads if thread.is_alive()]
+        if stuck:
+            recorder.error(f"не завершились потоки: {len(stuck)} (взаимная блокировка?)")
+            faulthandler.dump_traceback()
+
+        participants = store.all()
+        reopened = open_store(args.engine, tmp).all()
+        if [p.get('phone') for p in participants] != [p.get('phone') for p in reopened]:
+            recorder.error("данные в памяти не совпадают с данными на диске")
+        phones = [normalize_phone(p.get('phone')) for p in reopened]
+        if len(set(phones)) != len(phones):
+            recorder.error("на диске повторяются телефоны")
+
+    print(f"Хранилище: {args.engine}, {args.duration:.0f} с, потоков: регистрация {args.registrars}, "
+          f"удаление {args.deleters}, чтение {args.readers}; участников в конце: {len(participants)}")
+    print(f"{'операция':>14} {'число':>8} {'p50, мс':>9} {'p99, мс':>9} {'макс, мс':>9}")
+    for name, values in sorted(recorder.latencies.items()):
+        print(f"{name:>14} {len(values):>8} {percentile(values, 0.5) * 1000:>9.2f} "
+              f"{percentile(values, 0.99) * 1000:>9.2f} {max(values) * 1000:>9.2f}")
+        if max(values) > args.stall:
+            recorder.error(f"операция {name} выполнялась {max(values):.2f} с")
+
+    if recorder.errors:
+        print("Нарушения:")
+        for message in recorder.errors:
+            print(f"  - {message}")
+        sys.exit(1)
+    print("Взаимных блокировок, зависаний и нарушений не обнаружено")
+
+
+if __name__ == '__main__':
+    main()
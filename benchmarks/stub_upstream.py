@@ -0,0 +1,105 @@
+"""
+Локальная заглушка сервисов геолокации (ip-api.com и Nominatim) для нагрузочных проверок.
+
+Отвечает по путям /json/<ip> и /reverse с настраиваемой задержкой; режим
+ответа можно менять на ходу, чтобы имитировать сбои сервиса:
+
+    'ok'    - обычный ответ с городом Махачкала;
+    'error' - ответ 503;
+    '429'   - превышение лимита запросов (с заголовком X-Ttl).
+
+Заглушка считает запросы, новые TCP-соединения и максимальное число
+одновременных запросов.
+"""
+
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubUpstream:
+    """Заглушка сервисов геолокации в фоновом потоке"""
+
+    def __init__(self, delay=0.0, mode='ok', rate_limit_ttl=1):
+        self.delay = delay
+        self.mode = mode
+        self.rate_limit_ttl = rate_limit_ttl
+        self.requests = 0
+        self.connections = 0
+        self.max_active = 0
+        self._active = 0
+        self._lock = threading.Lock()
+        self._server = self._create_server()
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests = self.connections = self.max_active = 0
+
+    def shutdown(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _create_server(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                    stub._active += 1
+                    stub.max_active = max(stub.max_active, stub._active)
+                try:
+                    time.sleep(stub.delay)
+                    self._respond()
+                finally:
+                    with stub._lock:
+                        stub._active -= 1
+
+            def _respond(self):
+                headers = {}
+                if stub.mode == 'error':
+                    status, body = 503, {'error': 'unavailable'}
+                elif stub.mode == '429':
+                    status, body = 429, {'status': 'fail', 'message': 'rate limited'}
+                    headers['X-Ttl'] = str(stub.rate_limit_ttl)
+                elif self.path.startswith('/reverse'):
+                    status, body = 200, {'address': {'city': 'Махачкала', 'state': 'Дагестан', 'country': 'Россия'}}
+                else:
+                    status, body = 200, {'status': 'success', 'city': 'Makhachkala',
+                                         'regionName': 'Dagestan', 'country': 'Russia'}
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 1024  # стандартной очереди из 5 соединений не хватает под нагрузкой
+
+            def handle_error(self, request, client_address):
+                # Клиент закрыл соединение, не дождавшись ответа (таймаут) - это ожидаемо
+                if not isinstance(sys.exc_info()[1], ConnectionError):
+                    super().handle_error(request, client_address)
+
+        return Server(('127.0.0.1', 0), Handler)
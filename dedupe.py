@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+"""
+Поиск и объединение повторных регистраций участников.
+
+Старые записи добавлялись до проверки нормализованного телефона, поэтому
+один человек может встречаться несколько раз - с номером в другом формате
+(+7 (928) ..., 8928..., 928...) или с опечаткой в имени либо номере.
+Хранилище читается потоком, по одному участнику; ключи блокировки
+записываются во временную базу SQLite на диске:
+
+- телефон: канонический номер (для российских номеров - 11 цифр с 7 в
+  начале); записи с одинаковым номером - повторы;
+- имя: первые буквы фамилии и имени (в любом порядке) вместе с первой или
+  второй половиной номера либо с публичным IP-адресом. Внутри такого блока
+  записи сравниваются попарно: повтор - если имена похожи (не ниже
+  --threshold), возраст отличается не больше чем на год, а номера
+  отличаются одной цифрой (или перестановкой соседних цифр) либо совпадает
+  публичный IP-адрес.
+
+Блоки упорядочивает SQLite, поэтому сравниваются только записи с общим
+ключом, а не все пары; блоки имён больше --max-block пропускаются (их число
+выводится в итогах). В памяти держатся только найденные группы повторов.
+
+Отчёт (--report, JSON Lines) - по строке на группу: остающаяся запись
+(самая ранняя), повторы, причины и объединённые данные: пустые поля,
+location и coordinates без города дополняются из повторов. С ключом --apply
+группы объединяются в хранилище: у остающейся записи сохраняются номер и
+место в порядке регистрации, повторы удаляются. Журнал (.jsonl) и
+participants.json переписываются через временный файл с атомарной заменой,
+исходный файл сохраняется рядом с суффиксом .bak - приложение на это время
+нужно остановить. После замены увеличивается версия данных в общем бэкенде
+приложения (SHARED_BACKEND, SHARED_STATE_PATH - как в app.py): воркеры
+перечитывают журнал, а выгрузки, собранные до объединения, больше не
+отдаются из кэша. В базе SQLite изменения выполняются одной транзакцией,
+версию данных увеличивают её триггеры.
+
+Использование:
+    python dedupe.py participants.jsonl [--report duplicates.jsonl] [--threshold 0.85]
+        [--max-block 1000] [--no-names] [--apply]
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import textwrap
+import ipaddress
+from difflib import SequenceMatcher
+from itertools import groupby
+
+from backends import create_backend
+from storage import ParticipantLog, SQLiteParticipantStore, _encode, _fsync_dir, normalize_phone
+
+# Сколько записей вставлять во временную базу за раз
+BATCH_SIZE = 10000
+
+_WORD = re.compile(r'[^\W\d_]+')
+_LOG_ENTRY = re.compile(rb'\{"op":"(add|del)","id":(\d+)[,}]')
+
+
+# ----------------------------------------------------------------------
+# Нормализация
+# ----------------------------------------------------------------------
+
+def canonical_phone(phone):
+    """Номер для сравнения: цифры, российские номера - в виде 7XXXXXXXXXX"""
+    digits = normalize_phone(phone)
+    if len(digits) == 11 and digits[0] in '78':
+        return '7' + digits[1:]
+    if len(digits) == 10 and digits[0] == '9':
+        return '7' + digits
+    return digits
+
+
+def name_words(full_name):
+    """Фамилия и имя (первые два слова) в нижнем регистре, без знаков, ё -> е"""
+    return _WORD.findall(str(full_name or '').lower().replace('ё', 'е'))[:2]
+
+
+def public_ip(ip_address):
+    """IP-адрес, если он публичный (локальные адреса прокси общие для всех участников)"""
+    try:
+        address = ipaddress.ip_address(ip_address or '')
+    except ValueError:
+        return None
+    return str(address) if address.is_global else None
+
+
+def phones_close(a, b):
+    """Номера одной длины, отличающиеся одной цифрой или перестановкой соседних цифр"""
+    if not a or len(a) != len(b):
+        return False
+    diff = [i for i, (x, y) in enumerate(zip(a, b)) if x != y]
+    if len(diff) <= 1:
+        return True
+    return len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+
+
+def _age(value):
+    value = str(value if value is not None else '').strip()
+    return int(value) if value.isascii() and value.isdigit() else None
+
+
+def ages_close(a, b):
+    """Возраст отличается не больше чем на год (между регистрациями мог пройти день рождения)"""
+    return a is None or b is None or abs(a - b) <= 1
+
+
+def name_similarity(a, b):
+    """Сходство имён 'фамилия имя' (0-1); слова могут стоять в любом порядке"""
+    swapped = ' '.join(reversed(b.split(' ')))
+    return max(SequenceMatcher(None, a, b).ratio(), SequenceMatcher(None, a, swapped).ratio())
+
+
+def blocking_keys(record_id, participant, names=True):
+    """Строки временной базы: (ключ блока, id, имя, телефон, публичный IP, возраст)"""
+    phone = canonical_phone(participant.get('phone'))
+    rows = []
+    if phone:
+        rows.append(('p' + phone, record_id, None, None, None, None))
+    if not names:
+        return rows
+    words = name_words(participant.get('full_name'))
+    if not words:
+        return rows
+    signature = ' '.join(sorted(word[:3] for word in words))
+    name = ' '.join(words)
+    ip = public_ip(participant.get('ip_address'))
+    age = _age(participant.get('age'))
+    national = phone[-10:]
+    if len(national) == 10:
+        # Одна ошибка в номере оставляет нетронутой одну из половин
+        rows.append((f"a{signature}|{national[:5]}", record_id, name, phone, ip, age))
+        rows.append((f"b{signature}|{national[5:]}", record_id, name, phone, ip, age))
+    if ip is not None:
+        rows.append((f"i{signature}|{ip}", record_id, name, phone, ip, age))
+    return rows
+
+
+# ----------------------------------------------------------------------
+# Чтение хранилища
+# ----------------------------------------------------------------------
+
+def read_json_array(path, chunk_size=1 << 20):
+    """(номер, участник) из JSON-массива (старый participants.json) без чтения файла целиком"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = ''
+        pos = 0
+        number = 0
+        eof = False
+        while True:
+            # Пропуск пробелов, запятых и открывающей скобки массива
+            while True:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n,[':
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    break
+                buffer, pos = f.read(chunk_size), 0
+                eof = not buffer
+            if pos >= len(buffer) or buffer[pos] == ']':
+                return
+            while True:
+                try:
+                    participant, pos = decoder.raw_decode(buffer, pos)
+                    break
+                except ValueError:
+                    # Объект не поместился в прочитанный фрагмент
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        raise
+                    buffer, pos = buffer[pos:] + chunk, 0
+            number += 1
+            yield number, participant
+
+
+def _log_deleted(path):
+    """id участников, удалённых надгробиями журнала"""
+    deleted = set()
+    with open(path, 'rb') as f:
+        for line in f:
+            if b'"del"' in line and line.endswith(b'\n'):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('op') == 'del':
+                    deleted.add(entry['id'])
+    return deleted
+
+
+def read_log(path):
+    """(id, участник) из журнала ParticipantLog: два прохода, удалённые записи пропускаются"""
+    deleted = _log_deleted(path)
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break  # недописанная последняя строка
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get('op') == 'add' and entry['id'] not in deleted:
+                yield entry['id'], entry['data']
+
+
+def read_sqlite(path):
+    """(id, участник) из базы SQLiteParticipantStore"""
+    store = SQLiteParticipantStore(path)
+    for row in store._conn().execute('SELECT * FROM participants ORDER BY id'):
+        yield row[0], store._from_row(row)
+
+
+def read_participants(path):
+    if path.endswith('.jsonl'):
+        return read_log(path)
+    if path.endswith(('.sqlite3', '.sqlite', '.db')):
+        return read_sqlite(path)
+    return read_json_array(path)
+
+
+# ----------------------------------------------------------------------
+# Поиск повторов
+# ----------------------------------------------------------------------
+
+class DuplicateGroups:
+    """Объединение найденных пар в группы; корень группы - наименьший id (самая ранняя запись)"""
+
+    def __init__(self):
+        self._parent = {}
+        self._reasons = {}
+
+    def find(self, record_id):
+        parent = self._parent
+        while parent.get(record_id, record_id) != record_id:
+            parent[record_id] = parent.get(parent[record_id], parent[record_id])
+            record_id = parent[record_id]
+        return record_id
+
+    def union(self, a, b, reason):
+        a, b = self.find(a), self.find(b)
+        if a > b:
+            a, b = b, a
+        self._parent.setdefault(a, a)
+        reasons = self._reasons.setdefault(a, set())
+        reasons.add(reason)
+        if a != b:
+            self._parent[b] = a
+            reasons.update(self._reasons.pop(b, ()))
+
+    def groups(self):
+        """Группы в порядке самой ранней записи: (id записей по возрастанию, причины)"""
+        members = {}
+        for record_id in self._parent:
+            members.setdefault(self.find(record_id), []).append(record_id)
+        for root in sorted(members):
+            yield sorted(members[root]), sorted(self._reasons[root])
+
+
+def build_index(conn, participants, names=True):
+    """Временная база с данными участников и ключами блоков; возвращает число участников"""
+    conn.execute('CREATE TABLE records (id INTEGER PRIMARY KEY, data TEXT NOT NULL)')
+    conn.execute('CREATE TABLE keys (key TEXT NOT NULL, id INTEGER NOT NULL, name TEXT, phone TEXT, ip TEXT, age INTEGER)')
+    count = 0
+    records = []
+    keys = []
+    for record_id, participant in participants:
+        count += 1
+        records.append((record_id, json.dumps(participant, ensure_ascii=False)))
+        keys.extend(blocking_keys(record_id, participant, names))
+        if len(records) >= BATCH_SIZE:
+            conn.executemany('INSERT INTO records VALUES (?, ?)', records)
+            conn.executemany('INSERT INTO keys VALUES (?, ?, ?, ?, ?, ?)', keys)
+            records.clear()
+            keys.clear()
+    conn.executemany('INSERT INTO records VALUES (?, ?)', records)
+    conn.executemany('INSERT INTO keys VALUES (?, ?, ?, ?, ?, ?)', keys)
+    conn.execute('CREATE INDEX keys_key ON keys (key)')
+    return count
+
+
+def find_duplicates(conn, threshold=0.85, max_block=1000):
+    """Группы повторов по блокам временной базы; возвращает (DuplicateGroups, пропущено блоков)"""
+    groups = DuplicateGroups()
+    skipped = 0
+    cursor = conn.execute(
+        'SELECT key, id, name, phone, ip, age FROM keys '
+        'WHERE key IN (SELECT key FROM keys GROUP BY key HAVING COUNT(*) > 1) ORDER BY key, id'
+    )
+    for key, rows in groupby(cursor, key=lambda row: row[0]):
+        if key[0] == 'p':
+            first = next(rows)[1]
+            for row in rows:
+                groups.union(first, row[1], 'phone')
+            continue
+        block = []
+        for row in rows:
+            block.append(row)
+            if len(block) > max_block:
+                break
+        if len(block) > max_block:
+            skipped += 1
+            continue
+        for i, (_, a_id, a_name, a_phone, a_ip, a_age) in enumerate(block):
+            for _, b_id, b_name, b_phone, b_ip, b_age in block[i + 1:]:
+                if a_phone and a_phone == b_phone:
+                    continue  # уже в группе по телефону
+                if not ages_close(a_age, b_age):
+                    continue
+                if not ((a_ip is not None and a_ip == b_ip) or phones_close(a_phone, b_phone)):
+                    continue
+                if name_similarity(a_name, b_name) >= threshold:
+                    groups.union(a_id, b_id, 'name')
+    return groups, skipped
+
+
+# ----------------------------------------------------------------------
+# Объединение
+# ----------------------------------------------------------------------
+
+def _completeness(value):
+    """Насколько заполнено значение поля: вложенные словари - по числу непустых значений"""
+    if isinstance(value, dict):
+        return 1 + sum(1 for item in value.values() if item not in (None, ''))
+    return 0 if value in (None, '') else 1
+
+
+def merge_records(records):
+    """Объединённые данные группы: самая ранняя запись, дополненная из повторов"""
+    merged = dict(records[0])
+    for participant in records[1:]:
+        for field, value in participant.items():
+            if _completeness(value) > _completeness(merged.get(field)):
+                merged[field] = value
+    return merged
+
+
+def write_report(conn, groups, report_path):
+    """Отчёт по группам; возвращает (id -> объединённые данные, id удаляемых повторов)"""
+    merged = {}
+    dropped = []
+    with open(report_path, 'w', encoding='utf-8') as report:
+        for ids, reasons in groups.groups():
+            placeholders = ', '.join('?' * len(ids))
+            rows = conn.execute(f"SELECT id, data FROM records WHERE id IN ({placeholders}) ORDER BY id", ids)
+            records = [(record_id, json.loads(data)) for record_id, data in rows]
+            data = merge_records([participant for _, participant in records])
+            merged[ids[0]] = data
+            dropped.extend(ids[1:])
+            report.write(json.dumps({
+                'keep': ids[0],
+                'duplicates': ids[1:],
+                'reasons': reasons,
+                'records': [dict(participant, id=record_id) for record_id, participant in records],
+                'merged': data,
+            }, ensure_ascii=False) + '\n')
+    return merged, dropped
+
+
+def _replace_with_backup(path, tmp_path):
+    """Атомарная замена файла; исходный файл остаётся рядом с суффиксом .bak"""
+    backup = f"{path}.{time.strftime('%Y%m%d-%H%M%S')}.bak"
+    try:
+        os.link(path, backup)
+    except OSError:
+        shutil.copy2(path, backup)
+    os.replace(tmp_path, path)
+    _fsync_dir(path)
+    return backup
+
+
+def apply_log(path, merged, dropped):
+    """Переписывание журнала: строки add остающихся записей заменяются, повторов - удаляются"""
+    dropped = set(dropped)
+    tmp_path = path + '.dedupe'
+    with open(path, 'rb') as source, open(tmp_path, 'wb') as f:
+        for line in source:
+            if not line.endswith(b'\n'):
+                break
+            match = _LOG_ENTRY.match(line)
+            if match is not None and match.group(1) == b'add':
+                record_id = int(match.group(2))
+                if record_id in dropped:
+                    continue
+                if record_id in merged:
+                    line = _encode({'op': 'add', 'id': record_id, 'data': merged[record_id]})
+            f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+    return _replace_with_backup(path, tmp_path)
+
+
+def apply_json(path, merged, dropped):
+    """Переписывание participants.json с тем же форматированием (отступ 4)"""
+    dropped = set(dropped)
+    tmp_path = path + '.dedupe'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        first = True
+        for number, participant in read_json_array(path):
+            if number in dropped:
+                continue
+            participant = merged.get(number, participant)
+            f.write('\n' if first else ',\n')
+            f.write(textwrap.indent(json.dumps(participant, ensure_ascii=False, indent=4), '    '))
+            first = False
+        f.write('\n]' if not first else ']')
+        f.flush()
+        os.fsync(f.fileno())
+    return _replace_with_backup(path, tmp_path)
+
+
+def apply_sqlite(path, merged, dropped):
+    """Объединение в SQLite одной транзакцией; остающиеся записи вставляются заново с тем же id,
+    чтобы триггеры пересчитали счётчики статистики"""
+    store = SQLiteParticipantStore(path)
+    columns = ', '.join(('id',) + store.COLUMNS)
+    placeholders = ', '.join('?' * (len(store.COLUMNS) + 1))
+    with store._transaction() as conn:
+        conn.executemany('DELETE FROM participants WHERE id = ?', [(record_id,) for record_id in dropped])
+        conn.executemany('DELETE FROM participants WHERE id = ?', [(record_id,) for record_id in merged])
+        conn.executemany(f"INSERT INTO participants ({columns}) VALUES ({placeholders})",
+                         [(record_id,) + store._to_row(data) for record_id, data in merged.items()])
+
+
+def apply_merges(path, merged, dropped):
+    if path.endswith('.jsonl'):
+        return apply_log(path, merged, dropped)
+    if path.endswith(('.sqlite3', '.sqlite', '.db')):
+        return apply_sqlite(path, merged, dropped)
+    return apply_json(path, merged, dropped)
+
+
+def default_shared_state(source, kind):
+    """Путь к файлу общего бэкенда по умолчанию (как SHARED_STATE_PATH в app.py)"""
+    data_dir = os.path.dirname(os.path.abspath(os.environ.get('DATA_FILE', source)))
+    return os.path.join(data_dir, 'shared_state.sqlite3' if kind == 'sqlite' else 'shared_state.bin')
+
+
+def bump_shared_version(kind, path):
+    """Новая версия данных участников в общем бэкенде; None, если файла бэкенда нет"""
+    if not os.path.exists(path):
+        return None
+    return create_backend(kind, path).bump_version(ParticipantLog.VERSION_NAME)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help='participants.json, журнал .jsonl или база .sqlite3')
+    parser.add_argument('--report', help='файл отчёта (по умолчанию <source>.duplicates.jsonl)')
+    parser.add_argument('--threshold', type=float, default=0.85, help='минимальное сходство имён (0-1)')
+    parser.add_argument('--max-block', type=int, default=1000, help='наибольший сравниваемый попарно блок')
+    parser.add_argument('--no-names', action='store_true', help='искать повторы только по телефону')
+    parser.add_argument('--tmpdir', help='каталог для временной базы (по умолчанию системный)')
+    parser.add_argument('--apply', action='store_true', help='объединить найденные группы в хранилище')
+    parser.add_argument('--shared-backend', default=os.environ.get('SHARED_BACKEND', 'sqlite'),
+                        help='тип общего бэкенда приложения: sqlite или shm')
+    parser.add_argument('--shared-state', default=os.environ.get('SHARED_STATE_PATH'),
+                        help='файл общего бэкенда (по умолчанию - рядом с DATA_FILE или source)')
+    args = parser.parse_args()
+
+    report_path = args.report or os.path.splitext(args.source)[0] + '.duplicates.jsonl'
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(dir=args.tmpdir) as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'dedupe.sqlite3'), isolation_level=None)
+        conn.execute('PRAGMA journal_mode=OFF')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute('BEGIN')
+        scanned = build_index(conn, read_participants(args.source), names=not args.no_names)
+        groups, skipped = find_duplicates(conn, args.threshold, args.max_block)
+        merged, dropped = write_report(conn, groups, report_path)
+        conn.execute('COMMIT')
+        conn.close()
+
+    print(f"Участников: {scanned}, групп повторов: {len(merged)}, лишних записей: {len(dropped)}")
+    if skipped:
+        print(f"Пропущено слишком больших блоков имён: {skipped} (см. --max-block)")
+    print(f"Отчёт: {report_path} ({time.perf_counter() - started:.1f} с)")
+    if args.apply and dropped:
+        backup = apply_merges(args.source, merged, dropped)
+        print(f"Объединено групп: {len(merged)}, удалено записей: {len(dropped)}")
+        if backup:
+            print(f"Исходный файл сохранён: {backup}")
+            shared_state = args.shared_state or default_shared_state(args.source, args.shared_backend)
+            version = bump_shared_version(args.shared_backend, shared_state)
+            if version is not None:
+                print(f"Версия данных в {shared_state}: {version}")
+            else:
+                print(f"Файл общего бэкенда {shared_state} не найден: перезапустите приложение")
+
+
+if __name__ == '__main__':
+    main()
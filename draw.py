@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Розыгрыш: выбор победителей среди участников.
+
+Каждому участнику назначается ключ - первые 8 байт BLAKE2b от опубликованного
+зерна (seed) и нормализованного телефона. Победители - N участников с
+наименьшими ключами. Это вариант резервуарной выборки с приоритетами:
+участники читаются из хранилища потоком, в памяти держится только куча из
+N лучших, а результат не зависит от порядка чтения.
+
+Свойства:
+- выборка равномерна среди различных телефонов: у всех записей одного
+  телефона один и тот же ключ, поэтому повторы не увеличивают шансы;
+- по зерну результат воспроизводит кто угодно, в том числе по выгрузке
+  участников (python draw.py participants.jsonl --seed ... --winners N);
+- зерно нельзя подобрать под нужный результат: до окончания регистрации
+  публикуется его SHA-256 (обязательство, seed_commitment), а розыгрыш в
+  приложении проводится только с зерном, обязательство которого записано
+  раньше границы регистрации;
+- каждый розыгрыш сохраняется в каталоге DRAWS_DIR отдельным JSON-файлом
+  вместе с обязательством и идентификатором набора данных.
+
+Использование: python draw.py ИСТОЧНИК --seed ЗЕРНО [--winners 1] [--until 'ГГГГ-ММ-ДД ЧЧ:ММ:СС']
+ИСТОЧНИК - журнал .jsonl, база .sqlite3 или старый participants.json.
+"""
+
+import os
+import re
+import json
+import time
+import heapq
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+
+from storage import ParticipantLog, SQLiteParticipantStore, normalize_phone, participant_city
+
+# Название алгоритма записывается в результат: при его изменении старые
+# розыгрыши должны проверяться прежней версией
+DRAW_ALGORITHM = 'blake2b-bottom-k-v1'
+
+
+_SHA256_HEX = re.compile(r'[0-9a-f]{64}')
+
+
+def seed_commitment(seed):
+    """Обязательство для зерна: SHA-256 в шестнадцатеричном виде (публикуется до розыгрыша)"""
+    return hashlib.sha256(seed.encode('utf-8')).hexdigest()
+
+
+def draw_key(seed, phone):
+    """Ключ участника в розыгрыше с данным зерном (для проверки вручную)"""
+    digest = hashlib.blake2b(seed.encode('utf-8') + b'\0' + phone.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def draw_winners(participants, count, seed):
+    """Выбор count победителей из итератора участников.
+
+    Возвращает пару (победители по возрастанию ключа в виде троек
+    (ключ, нормализованный телефон, участник), число просмотренных записей
+    с телефоном). Записи без телефона в розыгрыше не участвуют.
+    """
+    base = hashlib.blake2b(seed.encode('utf-8') + b'\0', digest_size=8)
+    heap = []  # (-ключ, телефон, участник): на вершине худший из отобранных
+    chosen = set()  # телефоны в куче, чтобы повторы не заняли два места
+    entries = 0
+    for participant in participants:
+        phone = normalize_phone(participant.get('phone'))
+        if not phone:
+            continue
+        entries += 1
+        h = base.copy()
+        h.update(phone.encode('utf-8'))
+        key = int.from_bytes(h.digest(), 'big')
+        if len(heap) < count:
+            if phone not in chosen:
+                heapq.heappush(heap, (-key, phone, participant))
+                chosen.add(phone)
+        elif key < -heap[0][0] and phone not in chosen:
+            _, dropped, _ = heapq.heapreplace(heap, (-key, phone, participant))
+            chosen.discard(dropped)
+            chosen.add(phone)
+    winners = sorted(((-key, phone, participant) for key, phone, participant in heap), key=lambda w: w[:2])
+    return winners, entries
+
+
+def run_draw(participants, count, seed, until=None):
+    """Проведение розыгрыша; возвращает запись с параметрами и победителями"""
+    now = datetime.now()
+    started = time.perf_counter()
+    winners, entries = draw_winners(participants, count, seed)
+    return {
+        'id': now.strftime('%Y%m%d%H%M%S') + '-' + hashlib.sha1(seed.encode('utf-8')).hexdigest()[:8],
+        'time': now.strftime('%Y-%m-%d %H:%M:%S'),
+        'algorithm': DRAW_ALGORITHM,
+        'seed': seed,
+        'seed_sha256': seed_commitment(seed),
+        'winners_requested': count,
+        'until': until,
+        'entries': entries,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+        'winners': [
+            {
+                'place': place,
+                'key': f"{key:016x}",
+                'full_name': participant.get('full_name'),
+                'phone': participant.get('phone'),
+                'city': participant_city(participant),
+                'registration_time': participant.get('registration_time'),
+            }
+            for place, (key, _, participant) in enumerate(winners, 1)
+        ],
+    }
+
+
+class DrawRecords:
+    """Результаты розыгрышей и обязательства зёрен в каталоге на диске (общем для всех воркеров)"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.commitments_dir = os.path.join(directory, 'commitments')
+        os.makedirs(self.commitments_dir, exist_ok=True)
+
+    @staticmethod
+    def _write(path, record):
+        """Атомарная запись JSON-файла"""
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read_all(directory, limit):
+        """Последние записи каталога (по имени файла), новые первыми"""
+        names = sorted((name for name in os.listdir(directory) if name.endswith('.json')), reverse=True)
+        records = []
+        for name in names[:limit]:
+            try:
+                with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+                    records.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return records
+
+    def save(self, draw):
+        """Атомарная запись результата розыгрыша"""
+        self._write(os.path.join(self.directory, f"{draw['id']}.json"), draw)
+        return draw
+
+    def list(self, limit=20):
+        """Последние розыгрыши, новые первыми"""
+        return self._read_all(self.directory, limit)
+
+    def commit(self, seed_sha256):
+        """Запись обязательства (SHA-256 зерна) с текущим временем.
+
+        Повторная запись того же обязательства возвращает первую: время
+        обязательства не сдвигается. Возвращает None, если значение - не
+        SHA-256 в шестнадцатеричном виде.
+        """
+        seed_sha256 = seed_sha256.strip().lower()
+        if not _SHA256_HEX.fullmatch(seed_sha256):
+            return None
+        existing = self.commitment(seed_sha256)
+        if existing is not None:
+            return existing
+        record = {'seed_sha256': seed_sha256, 'committed_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        path = os.path.join(self.commitments_dir, f"{record['committed_at'].replace(' ', 'T')}-{seed_sha256}.json")
+        self._write(path, record)
+        return record
+
+    def commitment(self, seed_sha256):
+        """Обязательство с данным SHA-256 зерна или None"""
+        suffix = f"-{seed_sha256}.json"
+        for name in sorted(os.listdir(self.commitments_dir)):
+            if name.endswith(suffix):
+                try:
+                    with open(os.path.join(self.commitments_dir, name), 'r', encoding='utf-8') as f:
+                        return json.load(f)
+                except (OSError, ValueError):
+                    continue
+        return None
+
+    def commitments(self, limit=20):
+        """Последние обязательства, новые первыми"""
+        return self._read_all(self.commitments_dir, limit)
+
+
+def open_participants(path, until=None):
+    """Итератор по участникам из журнала, базы SQLite или старого JSON-файла"""
+    if path.endswith('.jsonl'):
+        return ParticipantLog(path).iter_all(until=until)
+    if path.endswith(('.sqlite3', '.db')):
+        return SQLiteParticipantStore(path).iter_all(until=until)
+    with open(path, 'r', encoding='utf-8') as f:
+        participants = json.load(f)
+    return (p for p in participants if until is None or (p.get('registration_time') or '') < until)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source')
+    parser.add_argument('--seed', required=True)
+    parser.add_argument('--winners', type=int, default=1)
+    parser.add_argument('--until', help='учитывать регистрации строго до этого времени')
+    args = parser.parse_args()
+
+    draw = run_draw(open_participants(args.source, args.until), args.winners, args.seed, args.until)
+    print(f"Зерно: {draw['seed']} (SHA-256 {draw['seed_sha256']} - должен совпасть с опубликованным обязательством)")
+    print(f"Алгоритм: {draw['algorithm']}, записей: {draw['entries']}, "
+          f"время: {draw['duration_ms']} мс")
+    for winner in draw['winners']:
+        print(f"{winner['place']:>3}. {winner['key']} {winner['full_name']} {winner['phone']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Экспорт участников в Excel и CSV/TSV.
+
+Участники читаются из хранилища по одному и сразу записываются в файл:
+Excel-файл строится в режиме constant_memory во временном файле на диске,
+CSV/TSV отдаётся клиенту потоком по мере формирования строк.
+"""
+
+import io
+import csv
+import os
+import tempfile
+
+# Заголовки столбцов
+HEADERS = [
+    'Имя', 'Телефон', 'Возраст', 'Пол', 'Город', 'Регион', 'Страна',
+    'Время регистрации', 'Координаты', 'IP-адрес'
+]
+
+# Ширина столбцов в Excel
+COLUMN_WIDTHS = [
+    ('A:A', 25),  # Имя
+    ('B:B', 20),  # Телефон
+    ('C:C', 10),  # Возраст
+    ('D:D', 15),  # Пол
+    ('E:E', 20),  # Город
+    ('F:F', 20),  # Регион
+    ('G:G', 20),  # Страна
+    ('H:H', 25),  # Время регистрации
+    ('I:I', 30),  # Координаты
+    ('J:J', 20),  # IP-адрес
+]
+
+# Сколько строк CSV собирать перед отправкой очередного блока клиенту
+CSV_CHUNK_ROWS = 500
+
+
+def participant_row(participant):
+    """Строка экспорта для одного участника"""
+    # Безопасное извлечение данных
+    full_name = str(participant.get('full_name', ''))
+    phone = str(participant.get('phone', ''))
+    age = str(participant.get('age', ''))
+    gender = 'Мужской' if str(participant.get('gender', '')) == 'male' else 'Женский'
+
+    # Безопасное извлечение данных о местоположении
+    city = ''
+    region = ''
+    country = ''
+
+    # Получение города из координат (если они есть)
+    coordinates = participant.get('coordinates', {})
+    if coordinates and isinstance(coordinates, dict):
+        city_from_coords = coordinates.get('city', '')
+        if city_from_coords:
+            city = city_from_coords
+
+    # Если город не определен из координат, пробуем получить его из location
+    if not city:
+        location = participant.get('location', {})
+        if location and isinstance(location, dict):
+            city = location.get('city', '')
+            region = location.get('region', '')
+            country = location.get('country', '')
+
+    # Форматирование координат
+    coords = ''
+    if coordinates and isinstance(coordinates, dict):
+        lat = coordinates.get('latitude', '')
+        lng = coordinates.get('longitude', '')
+        if lat and lng:
+            coords = f"{lat}, {lng}"
+
+    # IP-адрес
+    ip_address = str(participant.get('ip_address', ''))
+
+    # Время регистрации
+    reg_time = str(participant.get('registration_time', ''))
+
+    # Капитализация строк
+    if city:
+        city = city.capitalize()
+    if region:
+        region = region.capitalize()
+    if country:
+        country = country.capitalize()
+
+    return [full_name, phone, age, gender, city, region, country, reg_time, coords, ip_address]
+
+
+def export_rows(participants):
+    """Генератор строк экспорта по итератору участников"""
+    for participant in participants:
+        yield participant_row(participant)
+
+
+def write_xlsx(rows, path):
+    """Запись строк в Excel-файл; в памяти хранится только текущая строка"""
+    import xlsxwriter  # только при экспорте: воркеры не загружают модуль при запуске
+
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'tmpdir': os.path.dirname(path)})
+    worksheet = workbook.add_worksheet('Участники')
+
+    # Форматирование
+    header_format = workbook.add_format({
+        'bold': True,
+        'bg_color': '#007bff',
+        'font_color': 'white',
+        'border': 1
+    })
+
+    cell_format = workbook.add_format({
+        'border': 1
+    })
+
+    for columns, width in COLUMN_WIDTHS:
+        worksheet.set_column(columns, width)
+
+    # В режиме constant_memory строки нужно писать строго по порядку
+    worksheet.write_row(0, 0, HEADERS, header_format)
+    for row_number, row in enumerate(rows, start=1):
+        worksheet.write_row(row_number, 0, row, cell_format)
+
+    workbook.close()
+
+
+class TemporaryExportFile(io.FileIO):
+    """Файл выгрузки, который удаляется с диска после закрытия"""
+
+    def close(self):
+        if not self.closed:
+            super().close()
+            os.remove(self.name)
+
+
+def build_xlsx(rows):
+    """Создание Excel-файла во временном каталоге.
+
+    Возвращает открытый файл, который удаляется при закрытии
+    (send_file закрывает его после отправки ответа).
+    """
+    fd, path = tempfile.mkstemp(suffix='.xlsx', prefix='participants_')
+    os.close(fd)
+    try:
+        write_xlsx(rows, path)
+    except Exception:
+        os.remove(path)
+        raise
+    return TemporaryExportFile(path, 'rb')
+
+
+def stream_csv(rows, delimiter=','):
+    """Генератор блоков CSV/TSV в кодировке UTF-8 (с BOM для Excel)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter)
+
+    # Заголовок отправляется сразу, не дожидаясь чтения данных
+    buffer.write('\ufeff')
+    writer.writerow(HEADERS)
+    yield buffer.getvalue().encode('utf-8')
+
+    pending = 0
+    buffer.seek(0)
+    buffer.truncate()
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= CSV_CHUNK_ROWS:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue().encode('utf-8')
+
+
+def write_csv(rows, path, delimiter=','):
+    """Запись строк в CSV/TSV-файл"""
+    with open(path, 'wb') as f:
+        for chunk in stream_csv(rows, delimiter):
+            f.write(chunk)
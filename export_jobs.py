@@ -0,0 +1,162 @@
+"""
+Фоновые задания выгрузки участников.
+
+Большая выгрузка выполняется в пуле потоков, а не внутри запроса, поэтому
+не упирается в таймаут воркера gunicorn. Состояние заданий и готовые файлы
+хранятся в каталоге на диске, так что статус и скачивание работают через
+любой воркер.
+
+Идентификатор задания вычисляется из параметров выгрузки и идентификатора
+набора данных (data_identity хранилища: версия вместе с файлом данных): пока
+участники не менялись, повторный запуск той же выгрузки возвращает уже
+готовый файл, а после перезапуска или переписывания данных вне приложения
+старый файл не используется.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from export import export_rows, write_csv, write_xlsx
+
+logger = logging.getLogger(__name__)
+
+# Как часто (в строках) обновлять прогресс задания
+PROGRESS_EVERY = 1000
+
+
+class ExportJobs:
+    """Менеджер фоновых заданий выгрузки"""
+
+    # Задание, которое столько секунд не обновляло прогресс, считается прерванным
+    STALE_AFTER = 600
+
+    def __init__(self, directory, store, formats, max_workers=2, ttl=3600):
+        self.directory = directory
+        self.store = store
+        self.formats = formats  # формат -> (расширение, MIME-тип, разделитель CSV или None)
+        self.ttl = ttl  # сколько секунд хранить готовые файлы
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='export')
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Файлы заданий
+    # ------------------------------------------------------------------
+
+    def _meta_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def artifact_path(self, job_id, export_format):
+        """Путь к файлу выгрузки"""
+        return os.path.join(self.directory, f"{job_id}.{self.formats[export_format][0]}")
+
+    def _write_meta(self, job):
+        """Атомарная запись состояния задания"""
+        job['updated'] = time.time()
+        path = self._meta_path(job['id'])
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def status(self, job_id):
+        """Состояние задания или None, если такого задания нет"""
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._meta_path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _is_stale(self, job):
+        return job['status'] in ('pending', 'running') and time.time() - job['updated'] > self.STALE_AFTER
+
+    # ------------------------------------------------------------------
+    # Запуск и выполнение
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def job_id(export_format, since, until, identity):
+        """Идентификатор задания по параметрам выгрузки и идентификатору набора данных"""
+        key = f"{export_format}|{since or ''}|{until or ''}|{identity}"
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def start(self, export_format, since=None, until=None):
+        """Запуск выгрузки или возврат уже готового/выполняющегося задания"""
+        identity = self.store.data_identity()
+        job_id = self.job_id(export_format, since, until, identity)
+
+        with self._lock:
+            job = self.status(job_id)
+            if job is not None and job['status'] == 'done' and os.path.exists(self.artifact_path(job_id, export_format)):
+                return job
+            if job is not None and job['status'] in ('pending', 'running') and not self._is_stale(job):
+                return job
+
+            self._cleanup()
+            job = {
+                'id': job_id,
+                'format': export_format,
+                'since': since,
+                'until': until,
+                'data': identity,
+                'status': 'pending',
+                'progress': 0,
+                # Общее число строк известно только для выгрузки без фильтра по дате
+                'total': self.store.count() if since is None and until is None else None,
+                'error': None,
+                'created': time.time(),
+            }
+            self._write_meta(job)
+        snapshot = dict(job)  # задание дальше изменяется в фоновом потоке
+        self._executor.submit(self._run, job)
+        return snapshot
+
+    def _run(self, job):
+        """Выполнение задания в фоновом потоке"""
+        job['status'] = 'running'
+        self._write_meta(job)
+        path = self.artifact_path(job['id'], job['format'])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            participants = self.store.iter_all(since=job['since'], until=job['until'])
+            rows = self._with_progress(export_rows(participants), job)
+            delimiter = self.formats[job['format']][2]
+            if delimiter is None:
+                write_xlsx(rows, tmp_path)
+            else:
+                write_csv(rows, tmp_path, delimiter)
+            os.replace(tmp_path, path)
+            job['status'] = 'done'
+        except Exception as e:
+            logger.exception("Ошибка при выгрузке участников (задание %s)", job['id'])
+            job['status'] = 'error'
+            job['error'] = str(e)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._write_meta(job)
+
+    def _with_progress(self, rows, job):
+        """Обёртка над строками выгрузки, периодически сохраняющая прогресс"""
+        for row in rows:
+            yield row
+            job['progress'] += 1
+            if job['progress'] % PROGRESS_EVERY == 0:
+                self._write_meta(job)
+
+    def _cleanup(self):
+        """Удаление старых заданий и файлов выгрузки"""
+        deadline = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < deadline:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,151 @@
+"""
+Кэш результатов геолокации.
+
+Один компонент для кэширования запросов к внешним сервисам геолокации:
+
+- ограниченный размер с вытеснением давно не использованных записей (LRU);
+- время жизни записей (TTL), для отрицательных результатов - более короткое;
+- одновременные запросы одного и того же ключа объединяются в один вызов;
+- опциональный второй уровень - общий для воркеров бэкенд (см. backends.py);
+- счётчики попаданий, промахов и вытеснений для подбора размера.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+
+def quantize_coordinates(lat, lng, step):
+    """Округление координат до узла сетки, чтобы соседние точки давали один ключ"""
+    return round(round(lat / step) * step, 6), round(round(lng / step) * step, 6)
+
+
+class _Flight:
+    """Выполняющаяся загрузка, результата которой ждут другие потоки"""
+
+    __slots__ = ('event', 'value')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+
+
+class GeoCache:
+    """Потокобезопасный кэш с TTL, LRU, отрицательным кэшированием и объединением запросов"""
+
+    STAT_NAMES = ('hits', 'negative_hits', 'misses', 'shared_hits', 'loads',
+                  'coalesced', 'evictions', 'expirations')
+
+    def __init__(self, name, maxsize=10000, ttl=3600, negative_ttl=300, shared=None, wait_timeout=10):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.shared = shared
+        self.wait_timeout = wait_timeout  # сколько ждать чужую загрузку того же ключа
+        self._entries = OrderedDict()  # ключ -> (время истечения, значение)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(self.STAT_NAMES, 0)
+
+    def stats(self):
+        """Счётчики кэша и текущий размер"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        stats['maxsize'] = self.maxsize
+        return stats
+
+    def _get_local(self, key, now):
+        """Поиск в локальном кэше (вызывается под блокировкой); (найдено, значение)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires, value = entry
+        if expires <= now:
+            del self._entries[key]
+            self._stats['expirations'] += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self._stats['hits' if value is not None else 'negative_hits'] += 1
+        return True, value
+
+    def _set_local(self, key, value, ttl):
+        """Сохранение в локальный кэш с вытеснением (вызывается под блокировкой)"""
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def get_or_load(self, key, loader):
+        """Значение из кэша или результат loader(); None тоже кэшируется (на negative_ttl)"""
+        with self._lock:
+            found, value = self._get_local(key, time.monotonic())
+            if found:
+                return value
+            self._stats['misses'] += 1
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            # Тот же ключ уже загружается другим потоком - ждём его результат
+            flight.event.wait(self.wait_timeout)
+            return flight.value
+
+        value = None
+        try:
+            found, value = self._get_shared(key)
+            if not found:
+                value = loader()
+                self.put(key, value)
+            return value
+        finally:
+            flight.value = value
+            flight.event.set()
+            with self._lock:
+                del self._inflight[key]
+
+    def peek(self, key):
+        """Поиск без загрузки: (найдено, значение) из локального или общего кэша"""
+        with self._lock:
+            found, value = self._get_local(key, time.monotonic())
+            if found:
+                return True, value
+            self._stats['misses'] += 1
+        return self._get_shared(key)
+
+    def _get_shared(self, key):
+        """Поиск в общем кэше воркеров с копированием в локальный; (найдено, значение)"""
+        if self.shared is None:
+            return False, None
+        cached = self.shared.cache_get(self.name, key)
+        if cached is None:
+            return False, None
+        value = cached.get('value')
+        with self._lock:
+            self._stats['shared_hits'] += 1
+            self._set_local(key, value, self._ttl_for(value))
+        return True, value
+
+    def put(self, key, value):
+        """Сохранение загруженного значения в локальный и общий кэш"""
+        ttl = self._ttl_for(value)
+        if self.shared is not None:
+            # Значение оборачивается, чтобы отличать отрицательный результат от отсутствия записи
+            self.shared.cache_set(self.name, key, {'value': value}, ttl)
+        with self._lock:
+            self._stats['loads'] += 1
+            self._set_local(key, value, ttl)
+
+    def _ttl_for(self, value):
+        return self.ttl if value is not None else self.negative_ttl
+
+    def clear(self):
+        """Очистка локального кэша"""
+        with self._lock:
+            self._entries.clear()
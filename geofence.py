@@ -0,0 +1,140 @@
+"""
+Офлайн-геозона: определение населённого пункта по координатам без сетевых запросов.
+
+Границы населённых пунктов загружаются из файла GeoJSON (FeatureCollection
+с геометриями Polygon/MultiPolygon и свойствами name, region, country).
+Для быстрого поиска используется равномерная сетка: каждой ячейке сопоставлен
+список полигонов, чьи ограничивающие прямоугольники её пересекают, так что
+на запрос проверяется лишь несколько полигонов.
+"""
+
+import json
+import math
+
+
+def _point_in_ring(lng, lat, ring):
+    """Проверка попадания точки в замкнутый контур (метод трассировки луча)"""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i][0], ring[i][1]
+        xj, yj = ring[j][0], ring[j][1]
+        if (yi > lat) != (yj > lat) and lng < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def _point_in_polygon(lng, lat, polygon):
+    """Попадание точки в полигон GeoJSON (внешний контур и отверстия)"""
+    if not _point_in_ring(lng, lat, polygon[0]):
+        return False
+    return not any(_point_in_ring(lng, lat, hole) for hole in polygon[1:])
+
+
+class Area:
+    """Населённый пункт из файла геозоны"""
+
+    __slots__ = ('name', 'region', 'country', 'polygons', 'bbox')
+
+    def __init__(self, name, region, country, polygons):
+        self.name = name
+        self.region = region
+        self.country = country
+        self.polygons = polygons
+        lngs = [point[0] for polygon in polygons for point in polygon[0]]
+        lats = [point[1] for polygon in polygons for point in polygon[0]]
+        self.bbox = (min(lngs), min(lats), max(lngs), max(lats))
+
+    def contains(self, lng, lat):
+        min_lng, min_lat, max_lng, max_lat = self.bbox
+        if not (min_lng <= lng <= max_lng and min_lat <= lat <= max_lat):
+            return False
+        return any(_point_in_polygon(lng, lat, polygon) for polygon in self.polygons)
+
+    def location(self):
+        """Данные о местоположении в формате get_location_from_coordinates"""
+        return {'city': self.name, 'region': self.region, 'country': self.country}
+
+
+class Geofence:
+    """Набор населённых пунктов с сеточным пространственным индексом"""
+
+    def __init__(self, areas, cell_size=0.01):
+        # Более мелкие пункты проверяются первыми: посёлок внутри границ города
+        # должен определяться как посёлок
+        self.areas = sorted(areas, key=lambda a: (a.bbox[2] - a.bbox[0]) * (a.bbox[3] - a.bbox[1]))
+        self.cell_size = cell_size
+        self._grid = {}
+        if not self.areas:
+            self.bbox = None
+            return
+
+        self.bbox = (
+            min(a.bbox[0] for a in self.areas), min(a.bbox[1] for a in self.areas),
+            max(a.bbox[2] for a in self.areas), max(a.bbox[3] for a in self.areas),
+        )
+        for index, area in enumerate(self.areas):
+            min_x, min_y = self._cell(area.bbox[0], area.bbox[1])
+            max_x, max_y = self._cell(area.bbox[2], area.bbox[3])
+            for x in range(min_x, max_x + 1):
+                for y in range(min_y, max_y + 1):
+                    self._grid.setdefault((x, y), []).append(index)
+
+    @classmethod
+    def load(cls, path, cell_size=0.01):
+        """Загрузка геозоны из файла GeoJSON"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        areas = []
+        for feature in data.get('features', []):
+            geometry = feature.get('geometry') or {}
+            properties = feature.get('properties') or {}
+            if geometry.get('type') == 'Polygon':
+                polygons = [geometry['coordinates']]
+            elif geometry.get('type') == 'MultiPolygon':
+                polygons = geometry['coordinates']
+            else:
+                continue
+            areas.append(Area(
+                properties.get('name', '').lower(),
+                properties.get('region', ''),
+                properties.get('country', ''),
+                polygons
+            ))
+        return cls(areas, cell_size=cell_size)
+
+    def _cell(self, lng, lat):
+        return (math.floor((lng - self.bbox[0]) / self.cell_size),
+                math.floor((lat - self.bbox[1]) / self.cell_size))
+
+    def find(self, lat, lng):
+        """Населённый пункт, в который попадает точка, или None"""
+        if self.bbox is None:
+            return None
+        min_lng, min_lat, max_lng, max_lat = self.bbox
+        if not (min_lng <= lng <= max_lng and min_lat <= lat <= max_lat):
+            return None
+        for index in self._grid.get(self._cell(lng, lat), ()):
+            area = self.areas[index]
+            if area.contains(lng, lat):
+                return area
+        return None
+
+    def locate(self, lat, lng):
+        """Данные о местоположении по координатам или None, если точка вне геозоны"""
+        area = self.find(lat, lng)
+        return area.location() if area is not None else None
+
+
+def parse_coordinates(lat, lng):
+    """Разбор координат из строк запроса; None, если они некорректны"""
+    try:
+        lat = float(lat)
+        lng = float(lng)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
@@ -0,0 +1,247 @@
+"""
+Обращения к внешним сервисам геолокации (ip-api.com и Nominatim).
+
+Проверки местоположения в представлениях выполняются асинхронно: поиск по
+координатам и по IP запускаются одновременно с общим сроком ожидания, и
+используется первый результат, дающий окончательный ответ.
+
+Сами HTTP-запросы выполняют провайдеры (providers.Provider) с пулами
+соединений, лимитами и автоматическим выключателем, а ожидание организует
+один из клиентов:
+
+- AsyncGeoClient - асинхронные запросы в собственном цикле событий
+  воркера; ожидание ответа не занимает поток;
+- ThreadedGeoClient - синхронные запросы в пуле потоков
+  (для воркеров gevent, где requests и так не блокирует воркер).
+
+Оба клиента работают через кэш геолокации (geocache.GeoCache).
+"""
+
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from providers import ProviderUnavailable
+
+# Адреса сервисов (переопределяются, например, для нагрузочных проверок с заглушкой)
+IP_API_URL = os.environ.get('GEO_IP_API_URL', 'http://ip-api.com/json/{}')
+NOMINATIM_URL = os.environ.get('GEO_NOMINATIM_URL', 'https://nominatim.openstreetmap.org/reverse')
+NOMINATIM_HEADERS = {'User-Agent': 'CarRaffle/1.0'}
+
+
+def nominatim_params(lat, lng):
+    """Параметры обратного геокодирования Nominatim"""
+    return {'format': 'json', 'lat': lat, 'lon': lng, 'zoom': 18, 'addressdetails': 1}
+
+
+def parse_ip_api(data):
+    """Местоположение из ответа ip-api.com или None"""
+    if data.get('status') != 'success':
+        return None
+    return {
+        'city': data.get('city', '').lower(),
+        'region': data.get('regionName', ''),
+        'country': data.get('country', '')
+    }
+
+
+def parse_nominatim(data):
+    """Местоположение из ответа Nominatim или None"""
+    if 'address' not in data:
+        return None
+    address = data['address']
+    city = address.get('city', '').lower()
+    if not city:
+        city = address.get('town', '').lower()
+    if not city:
+        city = address.get('village', '').lower()
+    return {
+        'city': city,
+        'region': address.get('state', ''),
+        'country': address.get('country', '')
+    }
+
+
+def fetch_ip_location(provider, ip_address):
+    """Синхронный запрос местоположения по IP-адресу к ip-api.com"""
+    return parse_ip_api(provider.get_json(IP_API_URL.format(ip_address)))
+
+
+def fetch_coordinates_location(provider, lat, lng):
+    """Синхронный запрос местоположения по координатам к Nominatim"""
+    return parse_nominatim(provider.get_json(
+        NOMINATIM_URL, params=nominatim_params(lat, lng), headers=NOMINATIM_HEADERS
+    ))
+
+
+async def afetch_ip_location(provider, ip_address):
+    """Асинхронный запрос местоположения по IP-адресу к ip-api.com"""
+    return parse_ip_api(await provider.aget_json(IP_API_URL.format(ip_address)))
+
+
+async def afetch_coordinates_location(provider, lat, lng):
+    """Асинхронный запрос местоположения по координатам к Nominatim"""
+    return parse_nominatim(await provider.aget_json(
+        NOMINATIM_URL, params=nominatim_params(lat, lng), headers=NOMINATIM_HEADERS
+    ))
+
+
+class AsyncGeoClient:
+    """Асинхронный клиент сервисов геолокации.
+
+    Цикл событий работает в отдельном потоке воркера (запускается при первом
+    обращении, заново - после fork), поэтому пулы соединений провайдеров
+    переиспользуются между запросами, хотя каждое представление Flask
+    выполняется в своём цикле событий.
+    """
+
+    def __init__(self, ip_cache, coordinates_cache, ip_provider, coordinates_provider):
+        self.ip_cache = ip_cache
+        self.coordinates_cache = coordinates_cache
+        self.ip_provider = ip_provider
+        self.coordinates_provider = coordinates_provider
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop = None
+        self._inflight = {}  # (кэш, ключ) -> задача загрузки; используется только в потоке цикла
+
+    def _ensure_loop(self):
+        """Цикл событий клиента в текущем процессе"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._inflight = {}
+                threading.Thread(target=self._loop.run_forever, name='geo-client', daemon=True).start()
+                self._pid = os.getpid()
+            return self._loop
+
+    async def _call(self, coro):
+        """Выполнение сопрограммы в цикле клиента с ожиданием из текущего цикла"""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()))
+
+    async def _cached(self, cache, key, fetch):
+        """Значение из кэша или результат fetch(); одновременные запросы ключа объединяются"""
+        found, value = cache.peek(key)
+        if found:
+            return value
+        flight_key = (cache.name, key)
+        task = self._inflight.get(flight_key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(cache, key, fetch))
+            self._inflight[flight_key] = task
+            task.add_done_callback(lambda done: self._forget(flight_key, done))
+        # Загрузка продолжается и заполняет кэш, даже если ожидающий запрос отменён
+        return await asyncio.shield(task)
+
+    def _forget(self, flight_key, task):
+        """Удаление завершённой загрузки; её ошибка считается полученной, даже если все ожидавшие отменены"""
+        self._inflight.pop(flight_key, None)
+        if not task.cancelled():
+            task.exception()
+
+    async def _load(self, cache, key, fetch):
+        value = await fetch()
+        cache.put(key, value)
+        return value
+
+    async def ip_location(self, ip_address):
+        """Местоположение по IP-адресу"""
+        try:
+            return await self._call(self._cached(
+                self.ip_cache, ip_address, lambda: afetch_ip_location(self.ip_provider, ip_address)
+            ))
+        except ProviderUnavailable as e:
+            print(f"Ошибка при определении местоположения: {e}")
+            return None
+
+    async def coordinates_location(self, lat, lng):
+        """Местоположение по координатам (уже округлённым до сетки кэша)"""
+        try:
+            return await self._call(self._cached(
+                self.coordinates_cache, f"{lat},{lng}",
+                lambda: afetch_coordinates_location(self.coordinates_provider, lat, lng)
+            ))
+        except ProviderUnavailable as e:
+            print(f"Ошибка при определении местоположения по координатам: {e}")
+            return None
+
+
+class ThreadedGeoClient:
+    """Клиент с синхронными запросами в пуле потоков (тот же интерфейс, что у AsyncGeoClient)"""
+
+    def __init__(self, ip_cache, coordinates_cache, ip_provider, coordinates_provider, max_workers=32):
+        self.ip_cache = ip_cache
+        self.coordinates_cache = coordinates_cache
+        self.ip_provider = ip_provider
+        self.coordinates_provider = coordinates_provider
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+
+    def _run(self, function, *args):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='geo-client')
+                self._pid = os.getpid()
+        return asyncio.wrap_future(self._executor.submit(function, *args))
+
+    async def ip_location(self, ip_address):
+        """Местоположение по IP-адресу"""
+        try:
+            return await self._run(
+                self.ip_cache.get_or_load, ip_address,
+                lambda: fetch_ip_location(self.ip_provider, ip_address)
+            )
+        except ProviderUnavailable as e:
+            print(f"Ошибка при определении местоположения: {e}")
+            return None
+
+    async def coordinates_location(self, lat, lng):
+        """Местоположение по координатам (уже округлённым до сетки кэша)"""
+        try:
+            return await self._run(
+                self.coordinates_cache.get_or_load, f"{lat},{lng}",
+                lambda: fetch_coordinates_location(self.coordinates_provider, lat, lng)
+            )
+        except ProviderUnavailable as e:
+            print(f"Ошибка при определении местоположения по координатам: {e}")
+            return None
+
+
+async def first_conclusive(lookups, is_conclusive, timeout):
+    """Одновременный запуск проверок и первый окончательный результат.
+
+    lookups - сопрограммы, возвращающие местоположение или None. Возвращает
+    первый результат, для которого is_conclusive() истинно; если такого нет
+    до истечения timeout секунд - первый непустой результат или None.
+    Незавершённые проверки отменяются.
+    """
+    tasks = [asyncio.ensure_future(lookup) for lookup in lookups]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    fallback = None
+    pending = set(tasks)
+    try:
+        while pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            # Порядок lookups задаёт приоритет, если несколько проверок завершились одновременно
+            for task in tasks:
+                if task not in done or task.cancelled():
+                    continue
+                if task.exception() is not None:
+                    print(f"Ошибка при определении местоположения: {task.exception()}")
+                    continue
+                result = task.result()
+                if result is not None and is_conclusive(result):
+                    return result
+                if fallback is None:
+                    fallback = result
+        return fallback
+    finally:
+        for task in pending:
+            task.cancel()
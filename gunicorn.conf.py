@@ -0,0 +1,33 @@
+"""
+Настройки gunicorn (файл читается автоматически при запуске из каталога проекта).
+
+По умолчанию используются воркеры gthread: представления проверки
+местоположения асинхронные, HTTP-запросы к сервисам геолокации выполняются
+в цикле событий воркера, а поток запроса лишь ждёт результат не дольше
+GEO_DEADLINE секунд. Для воркеров gevent укажите GUNICORN_WORKER_CLASS=gevent
+и GEO_HTTP_CLIENT=threads.
+
+Приложение загружается в главном процессе до запуска воркеров (preload_app):
+журнал участников читается один раз, а воркеры, в том числе перезапущенные
+после --max-requests, получают готовые снимки при fork и делят их страницы
+памяти с главным процессом. GUNICORN_PRELOAD=false - загрузка в каждом
+воркере (например, чтобы gunicorn --reload подхватывал изменения кода).
+"""
+
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true') == 'true'
+
+
+def when_ready(server):
+    # Объекты, созданные при загрузке приложения, переносятся в постоянное поколение сборщика
+    # мусора: иначе полная сборка в воркере обходит их и копирует страницы снимков
+    if preload_app:
+        gc.collect()
+        gc.freeze()
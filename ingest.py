@@ -0,0 +1,126 @@
+"""
+Очередь регистраций с групповой записью (group commit).
+
+Регистрации из всех потоков воркера складываются в очередь, а отдельный
+поток забирает их пачками и записывает пачку в хранилище одной операцией
+с одним fsync (append_batch_unique). Каждая регистрация получает ответ
+только после того, как её пачка надёжно записана на диск, поэтому номер
+участника остаётся верным, а стоимость fsync делится на всю пачку.
+
+Пачка - это всё, что накопилось в очереди, пока записывалась предыдущая
+(не больше max_batch записей), поэтому чем сильнее всплеск, тем крупнее
+пачки. Если задан max_delay, поток после первой записи дополнительно ждёт
+до max_delay секунд, пока пачка не наберётся: на медленных дисках это
+увеличивает пачки ценой задержки.
+
+Проверка телефона выполняется хранилищем при записи пачки - и среди уже
+зарегистрированных, и среди участников той же пачки.
+"""
+
+import os
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class IngestQueue:
+    """Очередь регистраций с фоновой групповой записью в хранилище"""
+
+    def __init__(self, store, max_batch=64, max_delay=0, window=1024):
+        self.store = store
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        # Последние значения задержек для перцентилей (в секундах)
+        self._commit_latencies = deque(maxlen=window)
+        self._wait_latencies = deque(maxlen=window)
+        self._batch_sizes = deque(maxlen=window)
+        self._stats = {'batches': 0, 'records': 0, 'duplicates': 0, 'errors': 0, 'max_batch': 0}
+
+    def _ensure_worker(self):
+        """Поток записи в текущем процессе (запускается заново после fork)"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                threading.Thread(target=self._run, args=(self._queue,), name='ingest', daemon=True).start()
+                self._pid = os.getpid()
+            return self._queue
+
+    def submit(self, participant):
+        """Постановка регистрации в очередь.
+
+        Возвращает Future с номером участника (None, если телефон уже
+        зарегистрирован); результат появляется после записи пачки на диск.
+        """
+        future = Future()
+        self._ensure_worker().put((participant, future, time.monotonic()))
+        return future
+
+    def depth(self):
+        """Число регистраций, ожидающих записи"""
+        q = self._queue
+        return q.qsize() if q is not None and self._pid == os.getpid() else 0
+
+    def _run(self, q):
+        while True:
+            batch = [q.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(q.get(timeout=remaining) if remaining > 0 else q.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch):
+        """Запись пачки и ответ всем ожидающим"""
+        started = time.monotonic()
+        try:
+            numbers = self.store.append_batch_unique([participant for participant, _, _ in batch])
+        except Exception as e:
+            print(f"Ошибка при записи пачки регистраций: {e}")
+            with self._lock:
+                self._stats['errors'] += 1
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        finished = time.monotonic()
+
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['records'] += len(batch)
+            self._stats['duplicates'] += sum(1 for number in numbers if number is None)
+            self._stats['max_batch'] = max(self._stats['max_batch'], len(batch))
+            self._commit_latencies.append(finished - started)
+            self._batch_sizes.append(len(batch))
+            for _, _, queued in batch:
+                self._wait_latencies.append(finished - queued)
+        for (_, future, _), number in zip(batch, numbers):
+            future.set_result(number)
+
+    def stats(self):
+        """Глубина очереди, размеры пачек и задержки записи (мс) по последним пачкам"""
+        with self._lock:
+            stats = dict(self._stats)
+            commit = list(self._commit_latencies)
+            wait = list(self._wait_latencies)
+            sizes = list(self._batch_sizes)
+        stats['depth'] = self.depth()
+        stats['avg_batch'] = round(sum(sizes) / len(sizes), 1) if sizes else None
+        for name, values in (('commit', commit), ('wait', wait)):
+            for label, fraction in (('p50', 0.5), ('p99', 0.99)):
+                value = _percentile(values, fraction)
+                stats[f"{name}_{label}_ms"] = round(value * 1000, 2) if value is not None else None
+        return stats
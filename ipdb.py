@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Офлайн-база диапазонов IP-адресов для определения города без запросов к ip-api.com.
+
+Исходные данные - CSV-файл со строками вида:
+
+    5.8.0.0/16,махачкала,Дагестан,Россия
+    5.9.0.0-5.9.127.255,каспийск,Дагестан,Россия
+
+Из него собирается компактный двоичный файл:
+
+    заголовок | начала диапазонов (uint32) | концы диапазонов (uint32) |
+    номера мест (uint32) | таблица мест (UTF-8, JSON)
+
+Файл отображается в память (mmap) при запуске, поиск - бинарный по массиву
+начал диапазонов, поэтому загрузка почти мгновенная, а поиск - O(log N).
+Поддерживаются только IPv4-адреса.
+
+Сборка: python ipdb.py build ranges.csv data/ip_ranges.bin
+"""
+
+import os
+import sys
+import csv
+import json
+import mmap
+import array
+import struct
+import bisect
+import ipaddress
+
+MAGIC = b'CGIP'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sIII')  # сигнатура, версия, число диапазонов, размер таблицы мест
+
+
+def _parse_range(value):
+    """Начало и конец диапазона (целые числа) из CIDR или записи 'начало-конец'"""
+    if '-' in value:
+        start, end = value.split('-', 1)
+        return int(ipaddress.IPv4Address(start.strip())), int(ipaddress.IPv4Address(end.strip()))
+    network = ipaddress.IPv4Network(value.strip(), strict=False)
+    return int(network.network_address), int(network.broadcast_address)
+
+
+def build(csv_path, output_path):
+    """Сборка двоичного файла из CSV; возвращает число диапазонов"""
+    places = {}
+    ranges = []
+    with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith('#'):
+                continue
+            start, end = _parse_range(row[0])
+            place = (row[1].strip().lower(), row[2].strip() if len(row) > 2 else '',
+                     row[3].strip() if len(row) > 3 else '')
+            ranges.append((start, end, places.setdefault(place, len(places))))
+
+    ranges.sort()
+    for previous, current in zip(ranges, ranges[1:]):
+        if current[0] <= previous[1]:
+            raise ValueError(
+                f"Диапазоны пересекаются: {ipaddress.IPv4Address(previous[0])} - "
+                f"{ipaddress.IPv4Address(previous[1])} и {ipaddress.IPv4Address(current[0])}"
+            )
+
+    table = json.dumps([list(place) for place in places], ensure_ascii=False).encode('utf-8')
+    columns = [array.array('I', (r[i] for r in ranges)) for i in range(3)]
+    if sys.byteorder != 'little':
+        for column in columns:
+            column.byteswap()
+
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(ranges), len(table)))
+        for column in columns:
+            column.tofile(f)
+        f.write(table)
+    os.replace(tmp_path, output_path)
+    return len(ranges)
+
+
+class IPDatabase:
+    """Поиск места по IPv4-адресу в файле, отображённом в память"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, table_size = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"Неверный формат файла базы IP-адресов: {path}")
+
+        self.count = count
+        offset = HEADER.size
+        size = count * 4
+        if sys.byteorder == 'little' and array.array('I').itemsize == 4:
+            # Массивы читаются прямо из отображённого файла, без копирования
+            view = memoryview(self._mm)
+            self._starts = view[offset:offset + size].cast('I')
+            self._ends = view[offset + size:offset + 2 * size].cast('I')
+            self._places = view[offset + 2 * size:offset + 3 * size].cast('I')
+        else:
+            self._starts, self._ends, self._places = [
+                self._load_column(offset + i * size, count) for i in range(3)
+            ]
+        table_offset = offset + 3 * size
+        self._table = [
+            {'city': city, 'region': region, 'country': country}
+            for city, region, country in json.loads(self._mm[table_offset:table_offset + table_size])
+        ]
+
+    def _load_column(self, offset, count):
+        column = array.array('I')
+        column.frombytes(self._mm[offset:offset + count * 4])
+        if sys.byteorder != 'little':
+            column.byteswap()
+        return column
+
+    def lookup(self, ip_address):
+        """Данные о местоположении для IP-адреса или None, если адрес не найден"""
+        try:
+            address = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return None
+        if address.version != 4:
+            return None
+        value = int(address)
+        index = bisect.bisect_right(self._starts, value) - 1
+        if index < 0 or value > self._ends[index]:
+            return None
+        # Возвращаем копию, чтобы вызывающий код не изменил общую таблицу
+        return dict(self._table[self._places[index]])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'build':
+        print(__doc__)
+        sys.exit(1)
+    count = build(sys.argv[2], sys.argv[3])
+    print(f"Записано диапазонов: {count}")
@@ -65,7 +65,7 @@ def deploy_to_render(github_url, api_key):
         "name": "car-giveaway",
         "repo": github_url,
         "branch": "main",
-        "buildCommand": "pip install -r requirements.txt",
+        "buildCommand": "pip install -r requirements.txt && python assets.py",
         "startCommand": "gunicorn wsgi:app",
         "envVars": [
             {
@@ -0,0 +1,247 @@
+"""
+Метрики запросов в формате Prometheus.
+
+Каждый воркер gunicorn считает метрики в памяти (счётчики и гистограммы
+с фиксированными границами), а фоновый поток раз в flush_interval секунд
+атомарно сохраняет их в свой файл metrics-<pid>.json в общем каталоге.
+Эндпоинт /metrics суммирует файлы всех воркеров, поэтому ответ не зависит
+от того, какой воркер его обслужил.
+
+Файлы завершившихся воркеров (например, после --max-requests) переносятся
+в metrics-retired.json: счётчики Prometheus не должны уменьшаться.
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Границы корзин гистограмм времени, секунды
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Описания метрик для # HELP
+DESCRIPTIONS = {
+    'app_requests_total': 'Обработанные запросы',
+    'app_request_exceptions_total': 'Запросы, завершившиеся исключением',
+    'app_request_duration_seconds': 'Время обработки запроса',
+    'app_stage_duration_seconds': 'Время этапа обработки запроса (хранилище, поиск телефона, геолокация, шаблон)',
+    'app_slow_requests_profiled_total': 'Медленные запросы, для которых сохранён профиль',
+    'app_rate_limited_total': 'Запросы, отклонённые ограничением частоты (limit - какой лимит превышен)',
+    'app_page_cache_total': 'Ответы страниц из кэша отрисовки: hit, miss (отрисовка) и not_modified (304)',
+}
+
+RETIRED = 'retired'
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Metrics:
+    """Счётчики и гистограммы процесса с агрегацией по всем воркерам через каталог"""
+
+    def __init__(self, directory, backend=None, flush_interval=2.0):
+        self.directory = directory
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._collect_thread_lock = threading.Lock()
+        self._pid = None
+        self._counters = {}  # (имя, метки) -> значение
+        self._histograms = {}  # (имя, метки) -> [счётчики корзин..., сумма, количество]
+        self._dirty = False
+        os.makedirs(directory, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Запись
+    # ------------------------------------------------------------------
+
+    def _ensure_flusher(self):
+        """Поток сохранения метрик в текущем процессе (запускается заново после fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Метрики родительского процесса воркеру не принадлежат
+                self._counters = {}
+                self._histograms = {}
+                self._pid = os.getpid()
+                threading.Thread(target=self._run_flusher, name='metrics', daemon=True).start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Ошибка при сохранении метрик: {e}")
+
+    def inc(self, name, amount=1, **labels):
+        """Увеличение счётчика"""
+        self._ensure_flusher()
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self._dirty = True
+
+    def observe(self, name, value, **labels):
+        """Добавление значения в гистограмму"""
+        self._ensure_flusher()
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(DURATION_BUCKETS) + 2)
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-2] += value
+            histogram[-1] += 1
+            self._dirty = True
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Замер времени блока кода в гистограмму"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    # ------------------------------------------------------------------
+    # Сохранение и агрегация
+    # ------------------------------------------------------------------
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"metrics-{name}.json")
+
+    def _state(self):
+        with self._lock:
+            self._dirty = False
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(labels), list(values)] for (name, labels), values in self._histograms.items()],
+            }
+
+    @staticmethod
+    def _write(path, state):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def flush(self):
+        """Сохранение метрик процесса в его файл (если они менялись)"""
+        if self._pid != os.getpid() or not self._dirty:
+            return
+        self._write(self._path(os.getpid()), self._state())
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _merge(total, state):
+        """Сложение метрик state с накопленными в total (словари с ключами (имя, метки))"""
+        counters, histograms = total
+        for name, labels, value in state.get('counters', ()):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in state.get('histograms', ()):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            current = histograms.get(key)
+            histograms[key] = values if current is None else [a + b for a, b in zip(current, values)]
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _retire_dead(self):
+        """Перенос метрик завершившихся процессов в общий файл (вызывается под блокировкой сбора)"""
+        dead = []
+        for filename in os.listdir(self.directory):
+            pid = filename[len('metrics-'):-len('.json')]
+            if filename.startswith('metrics-') and filename.endswith('.json') and pid.isdigit():
+                if int(pid) != os.getpid() and not self._alive(int(pid)):
+                    dead.append(filename)
+        if not dead:
+            return
+        total = ({}, {})
+        for filename in [f"metrics-{RETIRED}.json"] + dead:
+            state = self._read(os.path.join(self.directory, filename))
+            if state is not None:
+                self._merge(total, state)
+        counters, histograms = total
+        self._write(self._path(RETIRED), {
+            'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+            'histograms': [[name, list(labels), values] for (name, labels), values in histograms.items()],
+        })
+        for filename in dead:
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except FileNotFoundError:
+                pass
+
+    def _collect_lock(self):
+        """Блокировка сбора: перенос файлов и чтение не должны пересекаться между воркерами"""
+        if self.backend is None:
+            return self._collect_thread_lock
+        return self.backend.lock('metrics')
+
+    def collect(self):
+        """Сумма метрик всех воркеров: пара словарей (счётчики, гистограммы)"""
+        self.flush()
+        total = ({}, {})
+        with self._collect_lock():
+            self._retire_dead()
+            for filename in os.listdir(self.directory):
+                if filename.startswith('metrics-') and filename.endswith('.json'):
+                    state = self._read(os.path.join(self.directory, filename))
+                    if state is not None:
+                        self._merge(total, state)
+        return total
+
+    def render(self):
+        """Метрики всех воркеров в текстовом формате Prometheus"""
+        counters, histograms = self.collect()
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# HELP {name} {DESCRIPTIONS.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# HELP {name} {DESCRIPTIONS.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS, values):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', bound))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {values[-1]}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {values[-2]:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {values[-1]}")
+        return '\n'.join(lines) + '\n'
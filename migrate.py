@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+"""
+Однократный перенос участников в базу SQLite.
+Использование: python migrate.py participants.json participants.sqlite3
+
+Источником может быть старый participants.json или журнал participants.jsonl.
+После переноса запустите приложение с переменной окружения STORAGE_ENGINE=sqlite.
+"""
+
+import sys
+
+from storage import SQLiteParticipantStore, migrate_to_sqlite
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(__doc__)
+        sys.exit(1)
+    migrated, skipped = migrate_to_sqlite(sys.argv[1], SQLiteParticipantStore(sys.argv[2]))
+    print(f"Перенесено участников: {migrated}, пропущено повторов: {skipped}")
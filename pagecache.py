@@ -0,0 +1,71 @@
+"""
+Кэш отрисованных публичных страниц.
+
+Страница без данных конкретного пользователя (главная, страница успешной
+регистрации) отрисуется один раз на ключ (шаблон и его параметры) в каждом
+воркере. Вместе с HTML хранятся его сжатые варианты (gzip, Brotli - если
+установлен модуль) и строгие ETag для каждого варианта, поэтому ответ из
+кэша - это выбор готовых байтов, а повторный запрос с If-None-Match
+завершается ответом 304 без тела.
+
+Flash-сообщения в такие страницы не попадают: страница загружает их
+отдельным запросом (см. /flash-messages в app.py).
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from assets import ENCODINGS, accepts, compress
+
+
+class CachedPage:
+    """Отрисованная страница: тело и сжатые варианты со своими ETag"""
+
+    __slots__ = ('variants',)
+
+    def __init__(self, html):
+        body = html.encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        # Content-Encoding -> (байты, ETag); у разных кодировок - разные строгие ETag
+        self.variants = {None: (body, digest)}
+        for encoding, data in compress(body).items():
+            self.variants[encoding] = (data, f"{digest}-{encoding}")
+
+    def select(self, accept_encoding):
+        """(байты, ETag, Content-Encoding или None) для заголовка Accept-Encoding"""
+        for encoding, _ in ENCODINGS:
+            if encoding in self.variants and accepts(accept_encoding, encoding):
+                data, etag = self.variants[encoding]
+                return data, etag, encoding
+        data, etag = self.variants[None]
+        return data, etag, None
+
+
+class PageCache:
+    """Потокобезопасный LRU-кэш отрисованных страниц"""
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, render):
+        """Страница по ключу; при промахе - render() (строка HTML). Возвращает (страница, попадание)"""
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+                return page, True
+        # Отрисовка вне блокировки: одновременные промахи одного ключа дают одинаковый результат
+        page = CachedPage(render())
+        with self._lock:
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.maxsize:
+                self._pages.popitem(last=False)
+        return page, False
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
@@ -0,0 +1,96 @@
+"""
+Выборочный профилировщик медленных запросов (включается настройкой).
+
+Пока запрос выполняется, фоновый поток раз в interval секунд снимает стек
+потока запроса (sys._current_frames) и считает одинаковые стеки. Если
+запрос длился дольше threshold секунд, профиль сохраняется в каталог в
+«свёрнутом» формате (строка - стек через ';' и число выборок), который
+понимают flamegraph.pl и speedscope.
+
+Асинхронные представления выполняются в цикле событий asgiref в другом
+потоке, поэтому их ожидание видно в профиле как ожидание в asgiref;
+время обращений к геосервисам показывают метрики этапов (см. metrics.py).
+"""
+
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+
+class SlowRequestProfiler:
+    """Профилировщик запросов дольше threshold секунд"""
+
+    def __init__(self, directory, threshold, interval=0.005, keep=200):
+        self.directory = directory
+        self.threshold = threshold
+        self.interval = interval
+        self.keep = keep  # сколько последних профилей хранить
+        self._lock = threading.Lock()
+        self._active = {}  # идентификатор потока -> счётчик стеков
+        self._pid = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _ensure_sampler(self):
+        """Поток выборки в текущем процессе (запускается заново после fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._active = {}
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name='profiler', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, stacks in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[self._stack(frame)] += 1
+
+    @staticmethod
+    def _stack(frame):
+        """Стек в свёрнутом формате: от внешнего вызова к внутреннему"""
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def start(self):
+        """Начало профилирования запроса в текущем потоке"""
+        self._ensure_sampler()
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+
+    def stop(self, route, elapsed):
+        """Конец запроса; возвращает путь к сохранённому профилю или None"""
+        with self._lock:
+            stacks = self._active.pop(threading.get_ident(), None)
+        if not stacks or elapsed < self.threshold:
+            return None
+        path = os.path.join(
+            self.directory,
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{route}-{int(elapsed * 1000)}ms-{os.getpid()}.folded"
+        )
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self._prune()
+        return path
+
+    def _prune(self):
+        """Удаление старых профилей сверх keep"""
+        try:
+            names = sorted(name for name in os.listdir(self.directory) if name.endswith('.folded'))
+            for name in names[:-self.keep]:
+                os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
@@ -0,0 +1,258 @@
+"""
+Клиенты внешних сервисов геолокации (провайдеров).
+
+Для каждого провайдера:
+
+- постоянный пул соединений: requests.Session для синхронных запросов и
+  httpx.AsyncClient для асинхронных, без нового TCP/TLS-соединения на запрос;
+- ограничение числа одновременных запросов (в каждом воркере) и их частоты:
+  маркерная корзина в процессе или общая для всех воркеров корзина в файле,
+  отображённом в память (SharedRateLimiter), - тогда лимит сервиса
+  соблюдается при любом числе воркеров gunicorn;
+- автоматический выключатель: после нескольких ошибок подряд или ответа
+  429 провайдер считается недоступным и запросы к нему сразу отклоняются,
+  пока не истечёт пауза; затем пропускается один пробный запрос.
+
+Отклонённый или неудавшийся запрос завершается исключением
+ProviderUnavailable - такой результат не попадает в кэш геолокации.
+
+Библиотеки HTTP-клиентов (requests, httpx) импортируются при первом
+запросе к провайдеру, то есть при первом промахе кэша геолокации, а не
+при запуске воркера.
+"""
+
+import os
+import time
+import asyncio
+import threading
+
+from ratelimit import Limit
+
+
+class ProviderUnavailable(Exception):
+    """Запрос к провайдеру не выполнен: выключатель разомкнут, превышен лимит или ошибка сервиса"""
+
+
+class CircuitBreaker:
+    """Автоматический выключатель: closed -> open (после ошибок) -> half-open (пробный запрос)"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_until = None
+        self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_until is None:
+                return 'closed'
+            if self._probing or time.monotonic() >= self._opened_until:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        """Можно ли выполнить запрос; в состоянии half-open пропускается один запрос"""
+        with self._lock:
+            if self._opened_until is None:
+                return True
+            if not self._probing and time.monotonic() >= self._opened_until:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_until = None
+            self._probing = False
+
+    def record_failure(self, pause=None):
+        """Ошибка запроса; pause - пауза, запрошенная самим сервисом (например, при 429)"""
+        with self._lock:
+            self._failures += 1
+            if self._probing or pause is not None or self._failures >= self.failure_threshold:
+                self._opened_until = time.monotonic() + (pause if pause is not None else self.reset_timeout)
+                self._probing = False
+
+
+class RateLimiter:
+    """Маркерная корзина: rate запросов в секунду, не более burst подряд"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class SharedRateLimiter:
+    """Маркерная корзина провайдера, общая для всех воркеров (ratelimit.TokenBuckets)"""
+
+    def __init__(self, buckets, name, rate, burst=None):
+        self.buckets = buckets
+        self.limit = Limit(f"provider:{name}", rate * 60, burst if burst is not None else max(1, int(rate)))
+
+    def try_acquire(self):
+        return self.buckets.take(self.limit, '') == 0
+
+
+def _retry_after(headers):
+    """Пауза в секундах из ответа 429 (Retry-After или X-Ttl у ip-api.com)"""
+    for name in ('Retry-After', 'X-Ttl'):
+        value = headers.get(name)
+        if value and value.isdigit():
+            return int(value)
+    return None
+
+
+def _json(name, response):
+    try:
+        return response.json()
+    except ValueError:
+        raise ProviderUnavailable(f"{name}: некорректный ответ сервиса ({response.status_code})")
+
+
+class Provider:
+    """Клиент одного провайдера с пулом соединений, лимитами и выключателем"""
+
+    STAT_NAMES = ('requests', 'failures', 'rejected_open', 'rejected_rate', 'rejected_busy')
+
+    def __init__(self, name, max_concurrency=10, rate=None, burst=None, timeout=3,
+                 failure_threshold=5, reset_timeout=30, acquire_timeout=0.5, limiter=None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout  # сколько ждать свободного слота
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        # limiter - готовый ограничитель частоты (например, SharedRateLimiter) вместо корзины процесса
+        self.limiter = limiter if limiter is not None else (RateLimiter(rate, burst) if rate else None)
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(self.STAT_NAMES, 0)
+        self._pid = None
+        self._session = None
+        self._slots = None
+        self._async_client = None
+        self._async_slots = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['state'] = self.breaker.state
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _ensure_process(self):
+        """Пулы соединений создаются заново в каждом процессе (после fork)"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._session = None
+                self._slots = threading.BoundedSemaphore(self.max_concurrency)
+                self._async_client = None
+                self._async_slots = None
+                self._pid = os.getpid()
+
+    def _sync_session(self):
+        """requests.Session процесса; создаётся при первом синхронном запросе"""
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    def _admit(self):
+        """Проверка частоты запросов и выключателя перед запросом"""
+        if self.limiter is not None and not self.limiter.try_acquire():
+            self._count('rejected_rate')
+            raise ProviderUnavailable(f"{self.name}: превышен лимит частоты запросов")
+        if not self.breaker.allow():
+            self._count('rejected_open')
+            raise ProviderUnavailable(f"{self.name}: сервис временно недоступен")
+        self._count('requests')
+
+    def _finish(self, status_code, headers):
+        """Учёт ответа в выключателе; ошибка сервиса завершается исключением"""
+        if status_code == 429:
+            self._count('failures')
+            self.breaker.record_failure(pause=_retry_after(headers) or self.breaker.reset_timeout)
+            raise ProviderUnavailable(f"{self.name}: превышен лимит запросов (429)")
+        if status_code >= 500:
+            self._count('failures')
+            self.breaker.record_failure()
+            raise ProviderUnavailable(f"{self.name}: ошибка сервиса ({status_code})")
+        self.breaker.record_success()
+
+    def _failed(self, error):
+        self._count('failures')
+        self.breaker.record_failure()
+        return ProviderUnavailable(f"{self.name}: {error}")
+
+    def get_json(self, url, params=None, headers=None):
+        """Синхронный GET-запрос с разбором JSON"""
+        import requests
+
+        self._ensure_process()
+        session = self._sync_session()
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            self._count('rejected_busy')
+            raise ProviderUnavailable(f"{self.name}: слишком много одновременных запросов")
+        try:
+            self._admit()
+            try:
+                response = session.get(url, params=params, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                raise self._failed(e)
+            self._finish(response.status_code, response.headers)
+            return _json(self.name, response)
+        finally:
+            self._slots.release()
+
+    async def aget_json(self, url, params=None, headers=None):
+        """Асинхронный GET-запрос с разбором JSON (всегда в одном цикле событий процесса)"""
+        import httpx
+
+        self._ensure_process()
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency)
+            )
+            self._async_slots = asyncio.Semaphore(self.max_concurrency)
+        try:
+            await asyncio.wait_for(self._async_slots.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self._count('rejected_busy')
+            raise ProviderUnavailable(f"{self.name}: слишком много одновременных запросов")
+        try:
+            self._admit()
+            try:
+                response = await self._async_client.get(url, params=params, headers=headers)
+            except httpx.HTTPError as e:
+                raise self._failed(e)
+            self._finish(response.status_code, response.headers)
+            return _json(self.name, response)
+        finally:
+            self._async_slots.release()
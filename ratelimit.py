@@ -0,0 +1,173 @@
+"""
+Ограничение частоты запросов (token bucket) в общей для воркеров памяти.
+
+Состояние корзин хранится в файле, отображённом в память (mmap), поэтому
+все воркеры gunicorn применяют одни и те же лимиты. Файл - таблица слотов
+(хэш ключа, число токенов, время обновления), разбитая на полосы; каждая
+полоса защищена своей блокировкой потоков и блокировкой диапазона байтов
+файла (fcntl.lockf), так что запросы к разным ключам почти не ждут друг
+друга. Ключ ищется среди PROBES слотов своей полосы; если все заняты,
+вытесняется слот, который дольше всех не обновлялся (корзина такого
+ключа, скорее всего, уже снова полна).
+
+Проверка - это несколько обращений к памяти под блокировкой, без запросов
+к хранилищу и сервисам геолокации.
+"""
+
+import os
+import math
+import time
+import struct
+import hashlib
+import threading
+import ipaddress
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: остаётся только блокировка внутри процесса
+    fcntl = None
+
+import mmap
+
+
+class Limit:
+    """Лимит: rate токенов в секунду, не больше burst подряд"""
+
+    __slots__ = ('name', 'rate', 'burst')
+
+    def __init__(self, name, per_minute, burst):
+        self.name = name
+        self.rate = per_minute / 60
+        self.burst = burst
+
+    @classmethod
+    def parse(cls, name, spec):
+        """Лимит из строки настройки 'запросов в минуту/пачка', например '60/30' ('0' - без ограничения)"""
+        per_minute, _, burst = spec.partition('/')
+        per_minute = float(per_minute)
+        return cls(name, per_minute, float(burst) if burst else max(per_minute, 1))
+
+    @property
+    def enabled(self):
+        return self.rate > 0 and self.burst > 0
+
+
+def client_key(ip_address):
+    """Ключ клиента для лимита по IP: адрес IPv4 или сеть /64 для IPv6"""
+    try:
+        address = ipaddress.ip_address(ip_address or '')
+    except ValueError:
+        return ip_address or ''
+    if address.version == 6:
+        return str(ipaddress.IPv6Network((address, 64), strict=False))
+    return str(address)
+
+
+def phone_prefix(phone, digits):
+    """Префикс национального номера (последние 10 цифр): блок соседних номеров, который перебирают боты"""
+    number = ''.join(filter(str.isdigit, phone or ''))[-10:]
+    return number[:digits] or None
+
+
+class TokenBuckets:
+    """Корзины токенов в файле общей памяти"""
+
+    MAGIC = b'CGRL'
+    HEADER = struct.Struct('<4sII')  # сигнатура, число полос, слотов в полосе
+    SLOT = struct.Struct('<Qdd')  # хэш ключа, токены, время обновления
+    PROBES = 8
+    CLOCK_JUMP = 60  # на сколько секунд часы должны уйти назад, чтобы корзина считалась полной
+
+    def __init__(self, path, stripes=64, slots_per_stripe=1024):
+        self.path = path
+        self.stripes = stripes
+        self.slots_per_stripe = slots_per_stripe
+        self._stripe_size = slots_per_stripe * self.SLOT.size
+        self._size = self.HEADER.size + stripes * self._stripe_size
+        self._open()
+        if hasattr(os, 'register_at_fork'):
+            # Блокировки потоков могли быть захвачены в момент fork
+            os.register_at_fork(after_in_child=self._reset_locks)
+
+    def _open(self):
+        self._file = open(self.path, 'a+b')
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        try:
+            self._file.seek(0)
+            header = self._file.read(self.HEADER.size)
+            if os.path.getsize(self.path) != self._size or \
+                    header != self.HEADER.pack(self.MAGIC, self.stripes, self.slots_per_stripe):
+                self._file.truncate(0)
+                self._file.truncate(self._size)
+                self._file.seek(0)
+                self._file.write(self.HEADER.pack(self.MAGIC, self.stripes, self.slots_per_stripe))
+                self._file.flush()
+            self._mm = mmap.mmap(self._file.fileno(), self._size)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._reset_locks()
+
+    def _reset_locks(self):
+        self._locks = [threading.Lock() for _ in range(self.stripes)]
+
+    @contextmanager
+    def _stripe(self, stripe):
+        """Блокировка полосы: потоки процесса - threading.Lock, процессы - lockf на её байтах"""
+        start = self.HEADER.size + stripe * self._stripe_size
+        with self._locks[stripe]:
+            if fcntl is not None:
+                fcntl.lockf(self._file.fileno(), fcntl.LOCK_EX, self._stripe_size, start)
+            try:
+                yield start
+            finally:
+                if fcntl is not None:
+                    fcntl.lockf(self._file.fileno(), fcntl.LOCK_UN, self._stripe_size, start)
+
+    @staticmethod
+    def _hash(name, key):
+        """Стабильный между процессами 64-битный хэш (0 - пустой слот)"""
+        digest = hashlib.blake2b(f"{name}\0{key}".encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') or 1
+
+    def take(self, limit, key, now=None):
+        """Списание токена; возвращает 0, если запрос разрешён, иначе через сколько секунд повторить"""
+        if not limit.enabled:
+            return 0
+        key_hash = self._hash(limit.name, key)
+        stripe = key_hash % self.stripes
+        start_slot = (key_hash // self.stripes) % self.slots_per_stripe
+        mm = self._mm
+        with self._stripe(stripe) as base:
+            # Время - под блокировкой: иначе запрос, ждавший блокировку, увидел бы время в прошлом
+            now = time.time() if now is None else now
+            target = None
+            oldest = None
+            tokens = limit.burst
+            for i in range(self.PROBES):
+                offset = base + ((start_slot + i) % self.slots_per_stripe) * self.SLOT.size
+                slot_hash, slot_tokens, updated = self.SLOT.unpack_from(mm, offset)
+                if slot_hash == key_hash:
+                    target = offset
+                    elapsed = now - updated
+                    if elapsed < -self.CLOCK_JUMP:
+                        # Часы переведены назад - считаем корзину полной
+                        tokens = limit.burst
+                    else:
+                        tokens = min(limit.burst, slot_tokens + max(elapsed, 0) * limit.rate)
+                        now = max(now, updated)
+                    break
+                if slot_hash == 0:
+                    target = offset
+                    break
+                if oldest is None or updated < oldest[0]:
+                    oldest = (updated, offset)
+            if target is None:
+                target = oldest[1]
+            if tokens < 1:
+                self.SLOT.pack_into(mm, target, key_hash, tokens, now)
+                return math.ceil((1 - tokens) / limit.rate)
+            self.SLOT.pack_into(mm, target, key_hash, tokens - 1, now)
+            return 0
@@ -0,0 +1,259 @@
+"""
+Компактное представление участника в памяти (для ParticipantLog).
+
+Вместо словаря строк с вложенными словарями location и coordinates каждый
+участник хранится объектом Participant со __slots__:
+
+- телефон - целое число из его цифр и общий (интернированный) шаблон
+  форматирования, например '+\\0 (\\0\\0\\0) \\0\\0\\0-\\0\\0-\\0\\0';
+- возраст - целое число, IPv4-адрес - целое число, время регистрации -
+  целое ГГГГММДДЧЧММСС;
+- location - общий для всех участников кортеж (город, регион, страна):
+  одинаковые местоположения хранятся один раз;
+- coordinates - кортеж (широта, долгота, город) с широтой и долготой в float;
+- пол, город, регион и страна интернированы.
+
+Значение преобразуется, только если обратное преобразование даёт ровно
+исходную строку, иначе оно хранится как есть: данные в журнале не меняются.
+
+Participant ведёт себя как словарь только для чтения (Mapping): get(),
+[], keys(), dict(participant) возвращают исходную схему с вложенными
+словарями, поэтому шаблоны, выгрузка и статистика работают без изменений.
+"""
+
+import re
+import sys
+from collections.abc import Mapping
+
+# Поля участника в порядке сериализации
+FIELDS = ('full_name', 'phone', 'age', 'gender', 'ip_address', 'location', 'coordinates', 'registration_time')
+
+_FIELD_SET = frozenset(FIELDS)
+
+# Значение слота для поля, которого нет в исходном словаре
+_MISSING = object()
+
+# Таблицы bytes.translate для телефона: цифры -> 0 (шаблон) и удаление всего, кроме цифр (ключ).
+# Работают в несколько раз быстрее регулярных выражений, а телефон кодируется при открытии журнала для каждой записи
+_DIGITS_TO_TEMPLATE = bytes.maketrans(b'0123456789', b'\0' * 10)
+_NON_DIGITS = bytes(code for code in range(256) if not 48 <= code <= 57)
+_OCTET = r'(25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])'
+_IPV4 = re.compile(r'\.'.join([_OCTET] * 4))
+_TIME = re.compile(r'([0-9]{4})-([0-9]{2})-([0-9]{2}) ([0-9]{2}):([0-9]{2}):([0-9]{2})')
+
+# Общие кортежи местоположений: (город, регион, страна) -> тот же кортеж
+_locations = {}
+
+
+class _Raw:
+    """Исходное значение числового типа, которое иначе спуталось бы с закодированным"""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+
+def _keep(value):
+    """Значение, которое не кодируется: числа оборачиваются в _Raw"""
+    return _Raw(value) if type(value) in (int, float) else value
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def phone_key(digits):
+    """Целочисленный ключ телефона по его цифрам (ведущие нули сохраняются за счёт префикса 1)
+
+    Цифры других алфавитов (str.isdigit) оставляют ключ строкой.
+    """
+    return int('1' + digits) if digits.isascii() else digits
+
+
+def _encode_phone(phone):
+    """(ключ, шаблон) для телефона или (исходное значение, None)"""
+    if not isinstance(phone, str):
+        return phone, None
+    if not phone.isascii() or '\0' in phone:
+        return phone, None
+    raw = phone.encode('ascii')
+    return int(b'1' + raw.translate(None, _NON_DIGITS)), sys.intern(raw.translate(_DIGITS_TO_TEMPLATE).decode('ascii'))
+
+
+def _decode_phone(key, template):
+    if template is None:
+        return key
+    digits = iter(str(key)[1:])
+    return ''.join(next(digits) if c == '\0' else c for c in template)
+
+
+def _encode_int(value):
+    """Целое число, если строка - его точная запись"""
+    if isinstance(value, str) and value.isascii() and value.isdigit() and str(int(value)) == value:
+        return int(value)
+    return _keep(value)
+
+
+def _decode_int(value):
+    if type(value) is int:
+        return str(value)
+    return value.value if type(value) is _Raw else value
+
+
+def _encode_ip(value):
+    """IPv4-адрес в записи без ведущих нулей -> целое число"""
+    match = _IPV4.fullmatch(value) if isinstance(value, str) else None
+    if match is None:
+        return _keep(value)
+    a, b, c, d = map(int, match.groups())
+    return a << 24 | b << 16 | c << 8 | d
+
+
+def _decode_ip(value):
+    if type(value) is int:
+        return f"{value >> 24}.{value >> 16 & 255}.{value >> 8 & 255}.{value & 255}"
+    return value.value if type(value) is _Raw else value
+
+
+def _encode_time(value):
+    """ГГГГ-ММ-ДД ЧЧ:ММ:СС -> целое ГГГГММДДЧЧММСС (поля фиксированной ширины, запись восстанавливается точно)"""
+    match = _TIME.fullmatch(value) if isinstance(value, str) else None
+    if match is None:
+        return _keep(value)
+    return int(''.join(match.groups()))
+
+
+def _decode_time(value):
+    if type(value) is not int:
+        return value.value if type(value) is _Raw else value
+    text = f"{value:014d}"
+    return f"{text[0:4]}-{text[4:6]}-{text[6:8]} {text[8:10]}:{text[10:12]}:{text[12:14]}"
+
+
+def _encode_location(location):
+    """Общий кортеж (город, регион, страна) или исходное значение"""
+    if isinstance(location, dict) and len(location) == 3 and list(location) == ['city', 'region', 'country']:
+        key = (_intern(location['city']), _intern(location['region']), _intern(location['country']))
+        return _locations.setdefault(key, key)
+    return location
+
+
+def _decode_location(value):
+    if type(value) is tuple:
+        return {'city': value[0], 'region': value[1], 'country': value[2]}
+    return value
+
+
+def _encode_float(value):
+    if isinstance(value, str):
+        try:
+            number = float(value)
+        except ValueError:
+            return value
+        if repr(number) == value:
+            return number
+    return _keep(value)
+
+
+def _decode_float(value):
+    if type(value) is float:
+        return repr(value)
+    return value.value if type(value) is _Raw else value
+
+
+def _encode_coordinates(coordinates):
+    """Кортеж (широта, долгота, город) или исходное значение"""
+    if isinstance(coordinates, dict) and len(coordinates) == 3 \
+            and list(coordinates) == ['latitude', 'longitude', 'city']:
+        return (_encode_float(coordinates['latitude']), _encode_float(coordinates['longitude']),
+                _intern(coordinates['city']))
+    return coordinates
+
+
+def _decode_coordinates(value):
+    if type(value) is tuple:
+        return {'latitude': _decode_float(value[0]), 'longitude': _decode_float(value[1]), 'city': value[2]}
+    return value
+
+
+class Participant(Mapping):
+    """Участник в компактном виде с интерфейсом словаря только для чтения"""
+
+    __slots__ = ('full_name', '_phone', '_phone_template', '_age', '_gender', '_ip',
+                 '_location', '_coordinates', '_time', '_extra')
+
+    def __init__(self, data):
+        get = data.get
+        self.full_name = get('full_name', _MISSING)
+        self._phone, self._phone_template = _encode_phone(get('phone', _MISSING))
+        self._age = _encode_int(get('age', _MISSING))
+        self._gender = _intern(get('gender', _MISSING))
+        self._ip = _encode_ip(get('ip_address', _MISSING))
+        self._location = _encode_location(get('location', _MISSING))
+        self._coordinates = _encode_coordinates(get('coordinates', _MISSING))
+        self._time = _encode_time(get('registration_time', _MISSING))
+        # Поля вне основной схемы (старые записи) хранятся как есть
+        if data.keys() <= _FIELD_SET:
+            self._extra = None
+        else:
+            self._extra = {key: value for key, value in data.items() if key not in _FIELD_SET}
+
+    @classmethod
+    def of(cls, data):
+        """Компактный участник из словаря (или тот же объект, если он уже компактный)"""
+        return data if isinstance(data, cls) else cls(data)
+
+    def phone_key(self):
+        """Ключ нормализованного телефона для индекса (см. phone_key)"""
+        if self._phone_template is not None:
+            return self._phone
+        return phone_key(''.join(filter(str.isdigit, self._phone if isinstance(self._phone, str) else '')))
+
+    def _field(self, key):
+        if key == 'full_name':
+            return self.full_name
+        if key == 'phone':
+            return _decode_phone(self._phone, self._phone_template)
+        if key == 'age':
+            return _decode_int(self._age)
+        if key == 'gender':
+            return self._gender
+        if key == 'ip_address':
+            return _decode_ip(self._ip)
+        if key == 'location':
+            return _decode_location(self._location)
+        if key == 'coordinates':
+            return _decode_coordinates(self._coordinates)
+        if key == 'registration_time':
+            return _decode_time(self._time)
+        if self._extra is not None:
+            return self._extra.get(key, _MISSING)
+        return _MISSING
+
+    def __getitem__(self, key):
+        value = self._field(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._field(key)
+        return default if value is _MISSING else value
+
+    def __iter__(self):
+        for key in FIELDS:
+            if self._field(key) is not _MISSING:
+                yield key
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self):
+        """Исходный словарь участника (для записи в журнал и JSON)"""
+        return {key: self[key] for key in self}
+
+    def __repr__(self):
+        return f"Participant({self.to_dict()!r})"
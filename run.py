@@ -2,9 +2,9 @@
 # Файл для запуска приложения на локальном сервере
 
 import os
-from app import app
+from app import create_app
 
 if __name__ == "__main__":
     # Получение порта из переменных окружения для совместимости с облачными платформами
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, threaded=True, debug=True) 
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=port, threaded=True, debug=True) 
\ No newline at end of file
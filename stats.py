@@ -0,0 +1,104 @@
+"""
+Статистика участников для админ-панели и дашборда.
+
+Счётчики (по часу регистрации, городу и возрастной группе) обновляются при
+каждом добавлении и удалении участника, поэтому чтение статистики не
+зависит от числа участников. ParticipantLog держит счётчики в памяти и
+восстанавливает их при воспроизведении журнала, SQLiteParticipantStore -
+в таблице counters с помощью триггеров (см. STATS_COUNTERS).
+"""
+
+
+# Возрастные группы: подпись и полуинтервал [от, до); None - без границы
+AGE_BUCKETS = (
+    ('до 18', None, 18),
+    ('18-24', 18, 25),
+    ('25-34', 25, 35),
+    ('35-44', 35, 45),
+    ('45-54', 45, 55),
+    ('55+', 55, None),
+)
+
+# Ключ для участников без возраста, города или времени регистрации
+UNKNOWN = ''
+
+
+def age_bucket(age):
+    """Возрастная группа участника (UNKNOWN, если возраст не число)"""
+    age = str(age if age is not None else '').strip()
+    if not (age.isascii() and age.isdigit()):
+        return UNKNOWN
+    age = int(age)
+    for label, low, high in AGE_BUCKETS:
+        if (low is None or age >= low) and (high is None or age < high):
+            return label
+    return UNKNOWN
+
+
+def registration_hour(participant):
+    """Час регистрации в виде 'ГГГГ-ММ-ДД ЧЧ'"""
+    return (participant.get('registration_time') or '')[:13]
+
+
+def _age_bucket_sql(column):
+    """Выражение SQL, которое вычисляет age_bucket() для столбца с возрастом"""
+    value = f"TRIM(IFNULL({column}, ''))"
+    cases = []
+    for label, low, high in AGE_BUCKETS:
+        conditions = []
+        if low is not None:
+            conditions.append(f"CAST({value} AS INTEGER) >= {low}")
+        if high is not None:
+            conditions.append(f"CAST({value} AS INTEGER) < {high}")
+        cases.append(f"WHEN {' AND '.join(conditions)} THEN '{label}'")
+    return (f"CASE WHEN {value} = '' OR {value} GLOB '*[^0-9]*' THEN '{UNKNOWN}' "
+            f"{' '.join(cases)} ELSE '{UNKNOWN}' END")
+
+
+# Счётчики статистики в SQLite: префикс имени в таблице counters и выражение
+# над строкой таблицы participants ({row} - NEW, OLD или имя таблицы)
+STATS_COUNTERS = (
+    ('hour', "substr(IFNULL({row}.registration_time, ''), 1, 13)"),
+    ('city', "IFNULL({row}.city, '')"),
+    ('age', _age_bucket_sql('{row}.age')),
+)
+
+
+def summary(total, genders, hours, cities, ages):
+    """Статистика в виде для JSON-ответа: группы упорядочены, нулевые отброшены"""
+    order = {label: position for position, (label, _, _) in enumerate(AGE_BUCKETS)}
+    return {
+        'total': total,
+        'genders': {gender: n for gender, n in genders.items() if n > 0},
+        'hours': sorted([hour, n] for hour, n in hours.items() if n > 0),
+        'cities': sorted(([city, n] for city, n in cities.items() if n > 0), key=lambda item: (-item[1], item[0])),
+        'ages': sorted(([label, n] for label, n in ages.items() if n > 0), key=lambda item: order.get(item[0], len(order))),
+    }
+
+
+class ParticipantStats:
+    """Счётчики статистики в памяти (для ParticipantLog).
+
+    Изменяется только писателем под блокировкой хранилища; city_of -
+    функция, которая возвращает город участника для отображения.
+    """
+
+    def __init__(self, city_of):
+        self._city_of = city_of
+        self.hours = {}
+        self.cities = {}
+        self.ages = {}
+
+    def _count(self, participant, delta):
+        for counters, key in ((self.hours, registration_hour(participant)),
+                              (self.cities, self._city_of(participant) or UNKNOWN),
+                              (self.ages, age_bucket(participant.get('age')))):
+            counters[key] = counters.get(key, 0) + delta
+
+    def add(self, participant):
+        """Учёт добавленного участника"""
+        self._count(participant, 1)
+
+    def remove(self, participant):
+        """Учёт удалённого участника"""
+        self._count(participant, -1)
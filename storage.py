@@ -0,0 +1,1085 @@
+"""
+Хранилище участников розыгрыша.
+
+Данные хранятся в журнале с дозаписью (JSON Lines): каждая регистрация
+добавляет одну строку, удаление записывается как «надгробие» (tombstone).
+Время от времени журнал сжимается - переписывается только с живыми записями.
+
+Если передан общий бэкенд (см. backends.py), журнал безопасно используется
+несколькими процессами: запись идёт под межпроцессной блокировкой, а каждый
+процесс догоняет чужие изменения, когда меняется счётчик версий.
+
+Альтернативный движок - SQLiteParticipantStore: участники хранятся в таблице
+SQLite с индексами по телефону, времени регистрации, городу и полу.
+"""
+
+import os
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+from records import Participant, phone_key
+from stats import STATS_COUNTERS, ParticipantStats, summary
+
+
+# Поля, по которым можно сортировать список участников в админ-панели
+SORT_FIELDS = ('id', 'registration_time', 'full_name', 'age', 'city')
+
+
+def normalize_phone(phone):
+    """Нормализация телефона для сравнения (остаются только цифры)"""
+    return ''.join(filter(str.isdigit, phone or ''))
+
+
+def _phone_key(phone):
+    """Ключ телефона в индексе журнала (целое число из цифр, см. records.phone_key)"""
+    return phone_key(normalize_phone(phone))
+
+
+def participant_city(participant):
+    """Город участника для отображения: из координат, иначе из данных по IP"""
+    coordinates = participant.get('coordinates')
+    if isinstance(coordinates, dict) and coordinates.get('city'):
+        return coordinates['city']
+    location = participant.get('location')
+    if isinstance(location, dict) and location.get('city'):
+        return location['city']
+    return None
+
+
+def _age_number(participant):
+    """Возраст числом (для сортировки)"""
+    try:
+        return int(participant.get('age'))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _sort_key(sort):
+    """Функция ключа сортировки участников по полю (при равенстве - по id)"""
+    if sort == 'age':
+        return lambda item: (_age_number(item[1]), item[0])
+    if sort == 'city':
+        return lambda item: (participant_city(item[1]) or '', item[0])
+    if sort == 'id':
+        return lambda item: item[0]
+    return lambda item: (str(item[1].get(sort) or '').lower(), item[0])
+
+
+def _in_range(registration_time, since, until):
+    """Попадает ли время регистрации в полуинтервал [since, until)"""
+    if since is not None and registration_time < since:
+        return False
+    if until is not None and registration_time >= until:
+        return False
+    return True
+
+
+def _matches(participant, needle, digits):
+    """Совпадение участника с поисковым запросом по имени, телефону или городу"""
+    if needle in str(participant.get('full_name') or '').lower():
+        return True
+    if needle in str(participant.get('phone') or '').lower():
+        return True
+    if needle in (participant_city(participant) or '').lower():
+        return True
+    return bool(digits) and digits in normalize_phone(participant.get('phone'))
+
+
+def _fsync_dir(path):
+    """fsync каталога, чтобы переименование файла пережило сбой питания"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _encode(entry):
+    """Строка журнала в байтах"""
+    return (json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+class _Snapshot:
+    """Неизменяемый снимок данных журнала, который читатели используют без блокировок.
+
+    Список entries общий для нескольких снимков: писатель только дописывает в
+    него новые записи, поэтому снимок видит ровно первые size элементов.
+    """
+
+    __slots__ = ('entries', 'size', 'deleted', 'live', 'genders', 'version')
+
+    def __init__(self, entries, deleted, live, genders, version):
+        self.entries = entries
+        self.size = len(entries)
+        self.deleted = deleted
+        self.live = live
+        self.genders = genders
+        self.version = version
+
+    def items(self, reverse=False):
+        """Пары (id, участник) в порядке регистрации (или в обратном)"""
+        entries = self.entries
+        deleted = self.deleted
+        for index in (range(self.size - 1, -1, -1) if reverse else range(self.size)):
+            record_id, participant = entries[index]
+            if record_id not in deleted:
+                yield record_id, participant
+
+
+class ParticipantLog:
+    """Журнал участников с дозаписью, пакетным fsync и периодическим сжатием.
+
+    Все изменения выполняет единственный писатель под блокировкой, после
+    каждого изменения публикуется новый неизменяемый снимок. Читатели берут
+    текущий снимок и блокировок не ждут.
+    """
+
+    # Имя счётчика версий и блокировки в общем бэкенде
+    VERSION_NAME = 'participants'
+
+    def __init__(self, log_path, legacy_path=None, backend=None, fsync_batch=32, fsync_interval=1.0,
+                 compact_min_garbage=1000, compact_ratio=0.5):
+        self.log_path = log_path
+        self.legacy_path = legacy_path
+        self.backend = backend
+        # fsync выполняется не на каждую запись, а пачкой: по количеству или по времени
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        # Сжатие запускается, когда мусорных строк достаточно много
+        self.compact_min_garbage = compact_min_garbage
+        self.compact_ratio = compact_ratio
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._pending_sync = 0
+        self._last_sync = time.monotonic()
+        self._sync_timer = None
+        self._compacting = False  # идёт фоновое сжатие в этом процессе
+        self._reset()
+
+        with self._lock, self._shared_lock():
+            self._open()
+            self._version = self._get_version()
+            self._publish()
+
+    def _reset(self):
+        """Сброс состояния в памяти"""
+        self._records = {}  # id -> участник в компактном виде (порядок вставки сохраняется)
+        self._entries = []  # пары (id, участник) для снимков; только дописывается
+        self._deleted = set()  # удалённые id, которые ещё остаются в _entries
+        self._deleted_frozen = frozenset()  # неизменяемая копия _deleted для снимков (None - устарела)
+        self._phones = {}  # ключ нормализованного телефона -> количество записей с ним
+        self._genders = {}  # пол -> количество участников
+        self._stats = ParticipantStats(participant_city)  # счётчики по часам, городам и возрасту
+        self._stats_view = None  # (версия, статистика) - последняя выданная статистика
+        self._next_id = 1
+        self._garbage = 0  # строки журнала, которые не соответствуют живым записям
+        self._offset = 0  # сколько байт журнала уже применено
+        self._inode = None
+
+    # ------------------------------------------------------------------
+    # Координация между процессами
+    # ------------------------------------------------------------------
+
+    def _shared_lock(self):
+        """Межпроцессная блокировка записи (или пустой контекст без бэкенда)"""
+        if self.backend is None:
+            return _no_lock()
+        return self.backend.lock(self.VERSION_NAME)
+
+    def _get_version(self):
+        return self.backend.get_version(self.VERSION_NAME) if self.backend is not None else 0
+
+    def _bump_version(self):
+        """Увеличение версии после изменения и публикация нового снимка"""
+        if self.backend is not None:
+            self._version = self.backend.bump_version(self.VERSION_NAME)
+        else:
+            self._version += 1
+        self._publish()
+
+    def _publish(self):
+        """Публикация снимка текущего состояния (вызывается под блокировкой)"""
+        if len(self._deleted) > max(1024, len(self._records) // 4):
+            # Удалённых записей много - собираем новый список без них
+            self._entries = list(self._records.items())
+            self._deleted = set()
+            self._deleted_frozen = None
+        if self._deleted_frozen is None:
+            # Копия строится только после удалений; добавления используют копию предыдущего снимка
+            self._deleted_frozen = frozenset(self._deleted)
+        self._snapshot = _Snapshot(
+            self._entries, self._deleted_frozen, len(self._records), dict(self._genders), self._version
+        )
+
+    def _refresh(self):
+        """Применение изменений других процессов, если счётчик версий изменился.
+
+        Читатель не ждёт блокировку: если она занята, изменения применит
+        писатель, а пока используется текущий снимок.
+        """
+        if self.backend is None:
+            return
+        version = self._get_version()
+        if version != self._version and self._lock.acquire(blocking=False):
+            try:
+                self._catch_up_locked()
+                self._version = version
+                self._publish()
+            finally:
+                self._lock.release()
+
+    def _current(self):
+        """Актуальный снимок данных (без блокировок)"""
+        self._refresh()
+        return self._snapshot
+
+    def _catch_up_locked(self):
+        """Дочитывание журнала с последней применённой позиции"""
+        try:
+            st = os.stat(self.log_path)
+        except FileNotFoundError:
+            return
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            # Журнал был сжат другим процессом - перечитываем его целиком
+            self._reset()
+            self._replay(truncate=False)
+            self._reopen()
+        elif st.st_size > self._offset:
+            self._replay(truncate=False)
+
+    # ------------------------------------------------------------------
+    # Загрузка
+    # ------------------------------------------------------------------
+
+    def _open(self):
+        """Открытие журнала: импорт старого JSON-файла или воспроизведение журнала"""
+        if not os.path.exists(self.log_path):
+            participants = self._read_legacy()
+            for participant in participants:
+                self._insert(self._next_id, participant)
+                self._next_id += 1
+            self._rewrite()
+        else:
+            self._replay(truncate=True)
+        self._reopen()
+
+    def _reopen(self):
+        """Открытие файла журнала на дозапись"""
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.log_path, 'ab')
+        self._inode = os.fstat(self._file.fileno()).st_ino
+
+    def _read_legacy(self):
+        """Чтение участников из старого формата (participants.json)"""
+        if not self.legacy_path or not os.path.exists(self.legacy_path):
+            return []
+        try:
+            with open(self.legacy_path, 'r', encoding='utf-8') as f:
+                participants = json.load(f)
+            return participants if isinstance(participants, list) else []
+        except Exception as e:
+            print(f"Ошибка при импорте {self.legacy_path}: {e}")
+            return []
+
+    def _replay(self, truncate):
+        """Применение журнала начиная с текущей позиции.
+
+        Недописанная последняя строка (сбой во время записи) обрезается,
+        если это разрешено; иначе она будет дочитана позже.
+        """
+        with open(self.log_path, 'rb') as f:
+            f.seek(self._offset)
+            for raw_line in f:
+                if not raw_line.endswith(b'\n'):
+                    break
+                try:
+                    self._apply(json.loads(raw_line))
+                except ValueError:
+                    print(f"Пропущена повреждённая строка журнала в {self.log_path}")
+                    self._garbage += 1
+                self._offset += len(raw_line)
+
+        if truncate and self._offset != os.path.getsize(self.log_path):
+            with open(self.log_path, 'r+b') as f:
+                f.truncate(self._offset)
+
+    def _apply(self, entry):
+        """Применение одной записи журнала к состоянию в памяти"""
+        op = entry.get('op')
+        if op == 'add':
+            record_id = entry['id']
+            self._insert(record_id, entry['data'])
+            self._next_id = max(self._next_id, record_id + 1)
+        elif op == 'del':
+            if self._remove(entry['id']):
+                # Удалённая запись add и само надгробие становятся мусором
+                self._garbage += 2
+            else:
+                self._garbage += 1
+
+    def _insert(self, record_id, participant):
+        """Добавление записи в память (в компактном виде) с обновлением индекса телефонов"""
+        # Пол и статистика считаются по исходному словарю: чтение компактной записи декодирует поля,
+        # а при открытии журнала это заметная часть времени
+        data = participant
+        participant = Participant.of(data)
+        self._records[record_id] = participant
+        self._entries.append((record_id, participant))
+        phone = participant.phone_key()
+        self._phones[phone] = self._phones.get(phone, 0) + 1
+        gender = data.get('gender')
+        self._genders[gender] = self._genders.get(gender, 0) + 1
+        self._stats.add(data)
+
+    def _remove(self, record_id):
+        """Удаление записи из памяти с обновлением индекса телефонов"""
+        participant = self._records.pop(record_id, None)
+        if participant is None:
+            return False
+        self._deleted.add(record_id)
+        self._deleted_frozen = None
+        phone = participant.phone_key()
+        remaining = self._phones.get(phone, 0) - 1
+        if remaining > 0:
+            self._phones[phone] = remaining
+        else:
+            self._phones.pop(phone, None)
+        gender = participant.get('gender')
+        self._genders[gender] = self._genders.get(gender, 0) - 1
+        self._stats.remove(participant)
+        return True
+
+    # ------------------------------------------------------------------
+    # Запись
+    # ------------------------------------------------------------------
+
+    def _write_entry(self, entry):
+        """Дозапись строки в журнал; fsync выполняется пачками"""
+        line = _encode(entry)
+        self._file.write(line)
+        self._file.flush()
+        self._offset += len(line)
+        self._pending_sync += 1
+        if (self._pending_sync >= self.fsync_batch
+                or time.monotonic() - self._last_sync >= self.fsync_interval):
+            self._sync_locked()
+        elif self._sync_timer is None:
+            # Гарантируем, что последние записи попадут на диск даже без новых регистраций
+            self._sync_timer = threading.Timer(self.fsync_interval, self.sync)
+            self._sync_timer.daemon = True
+            self._sync_timer.start()
+
+    def _sync_locked(self):
+        """fsync журнала (вызывается под блокировкой)"""
+        if self._pending_sync and self._file is not None:
+            os.fsync(self._file.fileno())
+        self._pending_sync = 0
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        """Принудительный сброс накопленных записей на диск"""
+        with self._lock:
+            self._sync_timer = None
+            self._sync_locked()
+
+    def close_connections(self):
+        """Для совместимости с SQLiteParticipantStore: журнал не держит соединений с базой"""
+
+    def _rewrite(self):
+        """Запись только живых данных во временный файл и атомарная замена журнала"""
+        tmp_path = self.log_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for record_id, participant in self._records.items():
+                f.write(_encode({'op': 'add', 'id': record_id, 'data': participant.to_dict()}))
+            f.flush()
+            os.fsync(f.fileno())
+            self._offset = f.tell()
+        os.replace(tmp_path, self.log_path)
+        _fsync_dir(self.log_path)
+        self._garbage = 0
+
+    def _maybe_compact(self):
+        """Запуск фонового сжатия журнала, если мусора стало слишком много"""
+        if self._compacting or self._garbage < self.compact_min_garbage:
+            return
+        if self._garbage < self.compact_ratio * (self._garbage + len(self._records)):
+            return
+        self._compacting = True
+        thread = threading.Thread(target=self._compact_in_background, name='participants-compact', daemon=True)
+        thread.start()
+
+    def _compact_in_background(self):
+        """Сжатие журнала без долгой блокировки записи.
+
+        Живые записи копируются во временный файл вне блокировки; затем под
+        блокировкой в него дописывается хвост журнала, появившийся за это
+        время, и файл атомарно заменяет журнал (fsync файла и каталога).
+        """
+        tmp_path = f"{self.log_path}.{os.getpid()}.compact"
+        try:
+            with self._lock, self._shared_lock():
+                self._catch_up_locked()
+                records = list(self._records.items())
+                offset = self._offset
+                inode = self._inode
+                garbage = self._garbage
+
+            with open(tmp_path, 'wb') as f:
+                for record_id, participant in records:
+                    f.write(_encode({'op': 'add', 'id': record_id, 'data': participant.to_dict()}))
+
+                with self._lock, self._shared_lock():
+                    self._catch_up_locked()
+                    if self._inode != inode:
+                        # Журнал уже переписан (clear, compact или другой процесс)
+                        os.remove(tmp_path)
+                        return
+                    with open(self.log_path, 'rb') as log:
+                        log.seek(offset)
+                        f.write(log.read(self._offset - offset))
+                    f.flush()
+                    os.fsync(f.fileno())
+                    size = f.tell()
+                    os.replace(tmp_path, self.log_path)
+                    _fsync_dir(self.log_path)
+                    self._offset = size
+                    # Мусором остаются только надгробия из дописанного хвоста
+                    self._garbage -= garbage
+                    self._pending_sync = 0
+                    self._reopen()
+                    self._bump_version()
+        except Exception as e:
+            print(f"Ошибка при сжатии журнала {self.log_path}: {e}")
+        finally:
+            self._compacting = False
+
+    def compact_locked(self):
+        """Сжатие журнала (вызывается под блокировками)"""
+        self._rewrite()
+        self._pending_sync = 0
+        self._reopen()
+
+    def compact(self):
+        """Принудительное сжатие журнала"""
+        with self._lock, self._shared_lock():
+            self._catch_up_locked()
+            self.compact_locked()
+            self._bump_version()
+
+    # ------------------------------------------------------------------
+    # Публичный интерфейс
+    # ------------------------------------------------------------------
+
+    def all(self):
+        """Список всех участников в порядке регистрации"""
+        return [participant for _, participant in self._current().items()]
+
+    def iter_all(self, since=None, until=None):
+        """Итератор по участникам в порядке регистрации.
+
+        since/until ограничивают время регистрации (строки 'ГГГГ-ММ-ДД ...',
+        since включительно, until - не включительно).
+        """
+        # Итерация по одному снимку: последующие изменения на неё не влияют
+        participants = (participant for _, participant in self._current().items())
+        if since is None and until is None:
+            return participants
+        return (p for p in participants if _in_range(p.get('registration_time') or '', since, until))
+
+    def count(self):
+        """Количество участников"""
+        return self._current().live
+
+    def data_version(self):
+        """Версия данных: меняется при каждом добавлении или удалении участников"""
+        return self._current().version
+
+    def data_identity(self):
+        """Идентификатор набора данных для кэша выгрузок.
+
+        Без общего хранилища версия начинается с 0 при каждом запуске, а
+        переписывание журнала вне приложения (dedupe.py --apply) её не
+        меняет; поэтому вместе с версией учитываются файл журнала (inode)
+        и применённая длина.
+        """
+        snapshot = self._current()
+        with self._lock:
+            return f"log:{self._inode}:{self._offset}:{snapshot.version}"
+
+    def gender_counts(self):
+        """Количество участников по полу"""
+        return {gender: n for gender, n in self._current().genders.items() if n > 0}
+
+    def statistics(self):
+        """Статистика участников: всего, по полу, по часам регистрации, городам и возрасту.
+
+        Счётчики поддерживаются при каждом изменении; копия для ответа
+        собирается один раз на версию данных.
+        """
+        snapshot = self._current()
+        view = self._stats_view
+        if view is not None and view[0] == snapshot.version:
+            return view[1]
+        with self._lock:
+            snapshot = self._snapshot
+            stats = self._stats
+            view = (snapshot.version, summary(snapshot.live, snapshot.genders, stats.hours, stats.cities, stats.ages))
+        self._stats_view = view
+        return view[1]
+
+    def page(self, offset=0, limit=50, sort='id', descending=True, query=None):
+        """Страница участников с сортировкой и поиском.
+
+        Возвращает пару (список участников с полем id, число найденных).
+        """
+        snapshot = self._current()
+        if not query and sort == 'id':
+            # Снимок уже упорядочен по времени регистрации - сортировка не нужна
+            selected = list(islice(snapshot.items(reverse=descending), offset, offset + limit))
+            return [dict(participant, id=record_id) for record_id, participant in selected], snapshot.live
+        items = list(snapshot.items())
+
+        if query:
+            needle = query.lower()
+            digits = normalize_phone(query)
+            items = [item for item in items if _matches(item[1], needle, digits)]
+        items.sort(key=_sort_key(sort), reverse=descending)
+        selected = items[offset:offset + limit]
+        return [dict(participant, id=record_id) for record_id, participant in selected], len(items)
+
+    def has_phone(self, phone):
+        """Проверка, зарегистрирован ли телефон (поиск по индексу, O(1), без блокировок)"""
+        self._refresh()
+        return _phone_key(phone) in self._phones
+
+    def append(self, participant):
+        """Добавление участника; возвращает его порядковый номер"""
+        with self._lock, self._shared_lock():
+            self._catch_up_locked()
+            return self._append_locked(participant)
+
+    def append_unique(self, participant):
+        """Атомарная проверка телефона и добавление; None, если телефон уже есть"""
+        with self._lock, self._shared_lock():
+            self._catch_up_locked()
+            if _phone_key(participant.get('phone')) in self._phones:
+                return None
+            return self._append_locked(participant)
+
+    def append_batch_unique(self, participants):
+        """Групповая запись пачки участников с проверкой телефонов (в том числе внутри пачки).
+
+        Все записи пачки дописываются одним блоком и сбрасываются на диск одним
+        fsync до возврата. Возвращает список номеров участников в порядке пачки
+        (None для уже зарегистрированных телефонов).
+        """
+        with self._lock, self._shared_lock():
+            self._catch_up_locked()
+            numbers = []
+            accepted = []
+            seen = set()
+            for participant in participants:
+                phone = _phone_key(participant.get('phone'))
+                if phone in self._phones or phone in seen:
+                    numbers.append(None)
+                    continue
+                seen.add(phone)
+                accepted.append((self._next_id, participant))
+                self._next_id += 1
+                numbers.append(len(self._records) + len(accepted))
+            if not accepted:
+                return numbers
+
+            data = b''.join(_encode({'op': 'add', 'id': record_id, 'data': participant})
+                            for record_id, participant in accepted)
+            self._file.write(data)
+            self._file.flush()
+            self._offset += len(data)
+            self._pending_sync += len(accepted)
+            self._sync_locked()
+            for record_id, participant in accepted:
+                self._insert(record_id, participant)
+            self._bump_version()
+            return numbers
+
+    def _append_locked(self, participant):
+        """Добавление участника (вызывается под блокировками)"""
+        record_id = self._next_id
+        self._next_id += 1
+        self._write_entry({'op': 'add', 'id': record_id, 'data': participant})
+        self._insert(record_id, participant)
+        self._bump_version()
+        return len(self._records)
+
+    def delete(self, record_id):
+        """Удаление участника по идентификатору; False, если его нет.
+
+        В журнал дописывается одно надгробие (O(1)), которое сразу
+        сбрасывается на диск; сжатие журнала выполняется в фоне.
+        """
+        with self._lock, self._shared_lock():
+            self._catch_up_locked()
+            if record_id not in self._records:
+                return False
+            self._write_entry({'op': 'del', 'id': record_id})
+            self._sync_locked()
+            self._remove(record_id)
+            self._garbage += 2
+            self._bump_version()
+            self._maybe_compact()
+            return True
+
+    def clear(self):
+        """Удаление всех участников"""
+        with self._lock, self._shared_lock():
+            # Новые объекты вместо очистки: старые ещё могут читаться из снимков
+            self._records = {}
+            self._entries = []
+            self._deleted = set()
+            self._deleted_frozen = None
+            self._phones = {}
+            self._genders = {}
+            self._stats = ParticipantStats(participant_city)
+            self.compact_locked()
+            self._bump_version()
+
+
+@contextmanager
+def _no_lock():
+    yield
+
+
+class SQLiteParticipantStore:
+    """Хранилище участников в SQLite с индексами для проверок и админ-панели"""
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS participants ('
+        'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+        'full_name TEXT, phone TEXT, phone_normalized TEXT NOT NULL, age TEXT, gender TEXT, '
+        'ip_address TEXT, registration_time TEXT, '
+        'city TEXT, '  # город для отображения: из координат, иначе из location
+        'location_city TEXT, location_region TEXT, location_country TEXT, has_location INTEGER NOT NULL, '
+        'latitude TEXT, longitude TEXT, coordinates_city TEXT, has_coordinates INTEGER NOT NULL, '
+        'geo_original TEXT)',  # исходные location и coordinates нестандартного вида (JSON), иначе NULL
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_participants_phone ON participants (phone_normalized)',
+        'CREATE INDEX IF NOT EXISTS idx_participants_registration_time ON participants (registration_time)',
+        'CREATE INDEX IF NOT EXISTS idx_participants_city ON participants (city)',
+        'CREATE INDEX IF NOT EXISTS idx_participants_gender ON participants (gender)',
+        # Счётчики участников (всего и по полу) поддерживаются триггерами, чтобы не выполнять COUNT(*)
+        'CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)',
+        "INSERT OR IGNORE INTO counters (name, value) VALUES ('total', 0)",
+        "CREATE TRIGGER IF NOT EXISTS participants_count_insert AFTER INSERT ON participants "
+        "BEGIN UPDATE counters SET value = value + 1 WHERE name = 'total'; END",
+        "CREATE TRIGGER IF NOT EXISTS participants_count_delete AFTER DELETE ON participants "
+        "BEGIN UPDATE counters SET value = value - 1 WHERE name = 'total'; END",
+        "CREATE TRIGGER IF NOT EXISTS participants_gender_insert AFTER INSERT ON participants "
+        "BEGIN INSERT INTO counters (name, value) VALUES ('gender:' || IFNULL(NEW.gender, ''), 1) "
+        "ON CONFLICT(name) DO UPDATE SET value = value + 1; END",
+        "CREATE TRIGGER IF NOT EXISTS participants_gender_delete AFTER DELETE ON participants "
+        "BEGIN UPDATE counters SET value = value - 1 WHERE name = 'gender:' || IFNULL(OLD.gender, ''); END",
+        # Версия данных для кэширования выгрузок
+        "INSERT OR IGNORE INTO counters (name, value) VALUES ('version', 0)",
+        "CREATE TRIGGER IF NOT EXISTS participants_version_insert AFTER INSERT ON participants "
+        "BEGIN UPDATE counters SET value = value + 1 WHERE name = 'version'; END",
+        "CREATE TRIGGER IF NOT EXISTS participants_version_delete AFTER DELETE ON participants "
+        "BEGIN UPDATE counters SET value = value + 1 WHERE name = 'version'; END",
+    ) + tuple(
+        # Счётчики статистики по часам регистрации, городам и возрастным группам
+        statement
+        for prefix, expression in STATS_COUNTERS
+        for statement in (
+            f"CREATE TRIGGER IF NOT EXISTS participants_{prefix}_insert AFTER INSERT ON participants "
+            f"BEGIN INSERT INTO counters (name, value) VALUES ('{prefix}:' || {expression.format(row='NEW')}, 1) "
+            f"ON CONFLICT(name) DO UPDATE SET value = value + 1; END",
+            f"CREATE TRIGGER IF NOT EXISTS participants_{prefix}_delete AFTER DELETE ON participants "
+            f"BEGIN UPDATE counters SET value = value - 1 "
+            f"WHERE name = '{prefix}:' || {expression.format(row='OLD')}; END",
+        )
+    )
+
+    # Выражения сортировки для полей из SORT_FIELDS
+    SORT_EXPRESSIONS = {
+        'id': 'id',
+        'registration_time': 'registration_time',
+        'full_name': 'casefold(full_name)',
+        'age': 'CAST(age AS INTEGER)',
+        'city': "IFNULL(city, '')",
+    }
+
+    COLUMNS = (
+        'full_name', 'phone', 'phone_normalized', 'age', 'gender', 'ip_address', 'registration_time',
+        'city', 'location_city', 'location_region', 'location_country', 'has_location',
+        'latitude', 'longitude', 'coordinates_city', 'has_coordinates', 'geo_original',
+    )
+
+    # Стандартный вид вложенных словарей; значения другого вида сохраняются в geo_original как есть
+    GEO_KEYS = {'location': ['city', 'region', 'country'], 'coordinates': ['latitude', 'longitude', 'city']}
+
+    def __init__(self, db_path, legacy_path=None):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connections = []
+        self._inherited = []
+        self._connections_lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            # Соединения SQLite нельзя использовать после fork
+            os.register_at_fork(after_in_child=self._after_fork)
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            if 'geo_original' not in [column[1] for column in conn.execute('PRAGMA table_info(participants)')]:
+                # База создана до появления столбца: у старых строк исходный вид не сохранён
+                conn.execute('ALTER TABLE participants ADD COLUMN geo_original TEXT')
+            if conn.execute("SELECT 1 FROM counters WHERE name LIKE 'gender:%'").fetchone() is None:
+                # База создана до появления счётчиков по полу - заполняем их один раз
+                conn.execute(
+                    "INSERT INTO counters (name, value) "
+                    "SELECT 'gender:' || IFNULL(gender, ''), COUNT(*) FROM participants GROUP BY gender"
+                )
+            if conn.execute("SELECT 1 FROM counters WHERE name = 'stats'").fetchone() is None:
+                # База создана до появления счётчиков статистики - заполняем их один раз
+                for prefix, expression in STATS_COUNTERS:
+                    key = expression.format(row='participants')
+                    conn.execute(
+                        f"INSERT INTO counters (name, value) SELECT '{prefix}:' || {key}, COUNT(*) "
+                        f"FROM participants GROUP BY {key} "
+                        f"ON CONFLICT(name) DO UPDATE SET value = excluded.value"
+                    )
+                conn.execute("INSERT INTO counters (name, value) VALUES ('stats', 1)")
+            empty = conn.execute("SELECT value FROM counters WHERE name = 'total'").fetchone()[0] == 0
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if empty and legacy_path and os.path.exists(legacy_path):
+            migrate_to_sqlite(legacy_path, self)
+
+    def _after_fork(self):
+        # Унаследованные соединения не закрываются в дочернем процессе (см. SQLiteBackend._after_fork)
+        self._inherited.extend(self._connections)
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _conn(self):
+        """Соединение с базой для текущего потока (открывается при первом обращении)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            # Встроенный lower() в SQLite работает только с латиницей
+            conn.create_function('casefold', 1, lambda value: value.lower() if value else value, deterministic=True)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close_connections(self):
+        """Закрытие соединений процесса (см. SharedBackend.close_connections)"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        self._local = threading.local()
+        for conn in connections:
+            conn.close()
+
+    @contextmanager
+    def _read_transaction(self):
+        """Согласованное чтение: в режиме WAL запросы видят один снимок и не мешают записи"""
+        conn = self._conn()
+        conn.execute('BEGIN')
+        try:
+            yield conn
+        finally:
+            conn.execute('COMMIT')
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    # ------------------------------------------------------------------
+    # Преобразование записей
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _to_row(cls, participant):
+        """Плоская строка таблицы из словаря участника"""
+        location = participant.get('location')
+        coordinates = participant.get('coordinates')
+        # Значения, которые столбцы не восстановят в точности (например, coordinates без city)
+        original = {key: value for key, value in (('location', location), ('coordinates', coordinates))
+                    if value is not None and not (isinstance(value, dict) and list(value) == cls.GEO_KEYS[key])}
+        location = location if isinstance(location, dict) else None
+        coordinates = coordinates if isinstance(coordinates, dict) else None
+        city = participant_city(participant)
+        return (
+            participant.get('full_name'),
+            participant.get('phone'),
+            normalize_phone(participant.get('phone')),
+            participant.get('age'),
+            participant.get('gender'),
+            participant.get('ip_address'),
+            participant.get('registration_time'),
+            city,
+            location.get('city') if location else None,
+            location.get('region') if location else None,
+            location.get('country') if location else None,
+            1 if location else 0,
+            coordinates.get('latitude') if coordinates else None,
+            coordinates.get('longitude') if coordinates else None,
+            coordinates.get('city') if coordinates else None,
+            1 if coordinates else 0,
+            json.dumps(original, ensure_ascii=False) if original else None,
+        )
+
+    @staticmethod
+    def _from_row(row):
+        """Словарь участника в исходной схеме (с вложенными location и coordinates)"""
+        (_id, full_name, phone, _normalized, age, gender, ip_address, registration_time, _city,
+         location_city, location_region, location_country, has_location,
+         latitude, longitude, coordinates_city, has_coordinates, geo_original) = row
+        participant = {
+            'full_name': full_name,
+            'phone': phone,
+            'age': age,
+            'gender': gender,
+            'ip_address': ip_address,
+            'location': {
+                'city': location_city,
+                'region': location_region,
+                'country': location_country
+            } if has_location else None,
+            'coordinates': {
+                'latitude': latitude,
+                'longitude': longitude,
+                'city': coordinates_city
+            } if has_coordinates else None,
+            'registration_time': registration_time
+        }
+        if geo_original is not None:
+            participant.update(json.loads(geo_original))
+        return participant
+
+    # ------------------------------------------------------------------
+    # Публичный интерфейс (совместим с ParticipantLog)
+    # ------------------------------------------------------------------
+
+    def all(self):
+        """Список всех участников в порядке регистрации"""
+        return list(self.iter_all())
+
+    def iter_all(self, since=None, until=None):
+        """Итератор по участникам в порядке регистрации (без загрузки всей таблицы).
+
+        since/until ограничивают время регистрации (since включительно,
+        until - не включительно); выборка идёт по индексу registration_time.
+        """
+        if since is None and until is None:
+            cursor = self._conn().execute('SELECT * FROM participants ORDER BY id')
+        else:
+            cursor = self._conn().execute(
+                'SELECT * FROM participants WHERE registration_time >= ? AND registration_time < ? '
+                'ORDER BY registration_time, id',
+                (since or '', until or '\uffff')
+            )
+        for row in cursor:
+            yield self._from_row(row)
+
+    def count(self):
+        """Количество участников"""
+        return self._conn().execute("SELECT value FROM counters WHERE name = 'total'").fetchone()[0]
+
+    def data_version(self):
+        """Версия данных: меняется при каждом добавлении или удалении участников"""
+        return self._conn().execute("SELECT value FROM counters WHERE name = 'version'").fetchone()[0]
+
+    def data_identity(self):
+        """Идентификатор набора данных для кэша выгрузок: файл базы, версия, число участников и последний id.
+
+        Файл и счётчики вместе отличают базу, заменённую другой (например,
+        заново перенесённую migrate.py), у которой версия может совпасть.
+        """
+        version, total, last_id = self._conn().execute(
+            "SELECT (SELECT value FROM counters WHERE name = 'version'), "
+            "(SELECT value FROM counters WHERE name = 'total'), (SELECT max(id) FROM participants)"
+        ).fetchone()
+        return f"sqlite:{os.stat(self.db_path).st_ino}:{version}:{total}:{last_id or 0}"
+
+    def gender_counts(self):
+        """Количество участников по полу (из счётчиков)"""
+        rows = self._conn().execute("SELECT name, value FROM counters WHERE name LIKE 'gender:%' AND value > 0")
+        return {name[len('gender:'):]: value for name, value in rows}
+
+    def statistics(self):
+        """Статистика участников: всего, по полу, по часам регистрации, городам и возрасту (из счётчиков)"""
+        groups = {'gender': {}, 'hour': {}, 'city': {}, 'age': {}}
+        total = 0
+        with self._read_transaction() as conn:
+            for name, value in conn.execute("SELECT name, value FROM counters WHERE value > 0"):
+                prefix, _, key = name.partition(':')
+                if prefix == 'total':
+                    total = value
+                elif prefix in groups:
+                    groups[prefix][key] = value
+        return summary(total, groups['gender'], groups['hour'], groups['city'], groups['age'])
+
+    def page(self, offset=0, limit=50, sort='id', descending=True, query=None):
+        """Страница участников с сортировкой и поиском.
+
+        Возвращает пару (список участников с полем id, число найденных).
+        Счётчик и страница читаются из одного снимка базы.
+        """
+        with self._read_transaction() as conn:
+            return self._page(conn, offset, limit, sort, descending, query)
+
+    def _page(self, conn, offset, limit, sort, descending, query):
+        where = ''
+        params = []
+        if query:
+            pattern = '%' + query.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            conditions = ["casefold(full_name) LIKE ? ESCAPE '\\'", "casefold(city) LIKE ? ESCAPE '\\'",
+                          "phone LIKE ? ESCAPE '\\'"]
+            params = [pattern, pattern, pattern]
+            digits = normalize_phone(query)
+            if digits:
+                conditions.append('phone_normalized LIKE ?')
+                params.append(f"%{digits}%")
+            where = 'WHERE ' + ' OR '.join(conditions)
+            total = conn.execute(f"SELECT COUNT(*) FROM participants {where}", params).fetchone()[0]
+        else:
+            total = conn.execute("SELECT value FROM counters WHERE name = 'total'").fetchone()[0]
+
+        direction = 'DESC' if descending else 'ASC'
+        order = f"{self.SORT_EXPRESSIONS[sort]} {direction}, id {direction}"
+        rows = conn.execute(
+            f"SELECT * FROM participants {where} ORDER BY {order} LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        )
+        return [dict(self._from_row(row), id=row[0]) for row in rows], total
+
+    def has_phone(self, phone):
+        """Проверка, зарегистрирован ли телефон (по уникальному индексу)"""
+        row = self._conn().execute(
+            'SELECT 1 FROM participants WHERE phone_normalized = ?', (normalize_phone(phone),)
+        ).fetchone()
+        return row is not None
+
+    def append(self, participant):
+        """Добавление участника; возвращает его порядковый номер"""
+        number = self.append_unique(participant)
+        if number is None:
+            raise ValueError('Этот номер телефона уже зарегистрирован')
+        return number
+
+    def append_unique(self, participant):
+        """Атомарная проверка телефона и добавление; None, если телефон уже есть"""
+        placeholders = ', '.join('?' * len(self.COLUMNS))
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    f"INSERT INTO participants ({', '.join(self.COLUMNS)}) VALUES ({placeholders})",
+                    self._to_row(participant)
+                )
+                return conn.execute("SELECT value FROM counters WHERE name = 'total'").fetchone()[0]
+        except sqlite3.IntegrityError:
+            return None
+
+    def append_batch_unique(self, participants):
+        """Групповая запись пачки участников одной транзакцией с проверкой телефонов.
+
+        Транзакция фиксируется с synchronous=FULL, то есть попадает на диск
+        до возврата. Возвращает список номеров участников в порядке пачки
+        (None для уже зарегистрированных телефонов, в том числе внутри пачки).
+        """
+        columns = ', '.join(self.COLUMNS)
+        placeholders = ', '.join('?' * len(self.COLUMNS))
+        numbers = []
+        conn = self._conn()
+        conn.execute('PRAGMA synchronous=FULL')
+        try:
+            with self._transaction() as conn:
+                total = conn.execute("SELECT value FROM counters WHERE name = 'total'").fetchone()[0]
+                for participant in participants:
+                    cursor = conn.execute(
+                        f"INSERT OR IGNORE INTO participants ({columns}) VALUES ({placeholders})",
+                        self._to_row(participant)
+                    )
+                    if cursor.rowcount:
+                        total += 1
+                        numbers.append(total)
+                    else:
+                        numbers.append(None)
+        finally:
+            conn.execute('PRAGMA synchronous=NORMAL')
+        return numbers
+
+    def delete(self, record_id):
+        """Удаление участника по идентификатору; False, если его нет"""
+        with self._transaction() as conn:
+            return conn.execute('DELETE FROM participants WHERE id = ?', (record_id,)).rowcount > 0
+
+    def clear(self):
+        """Удаление всех участников"""
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM participants')
+
+    def sync(self):
+        """Для совместимости с ParticipantLog: SQLite сам фиксирует транзакции"""
+
+
+def migrate_to_sqlite(source_path, store):
+    """Перенос участников из participants.json или журнала .jsonl в SQLite.
+
+    Записи с уже существующим (после нормализации) телефоном пропускаются.
+    Возвращает пару (перенесено, пропущено).
+    """
+    if source_path.endswith('.jsonl'):
+        participants = ParticipantLog(source_path).iter_all()
+    else:
+        with open(source_path, 'r', encoding='utf-8') as f:
+            participants = json.load(f)
+
+    columns = ', '.join(store.COLUMNS)
+    placeholders = ', '.join('?' * len(store.COLUMNS))
+    migrated = 0
+    skipped = 0
+    with store._transaction() as conn:
+        for participant in participants:
+            cursor = conn.execute(
+                f"INSERT OR IGNORE INTO participants ({columns}) VALUES ({placeholders})",
+                store._to_row(participant)
+            )
+            if cursor.rowcount:
+                migrated += 1
+            else:
+                skipped += 1
+                print(f"Пропущен участник с повторяющимся телефоном: {participant.get('phone')}")
+    return migrated, skipped
+
+
+def create_store(engine, data_file, log_path, db_path, backend=None):
+    """Создание хранилища участников по названию движка ('log' или 'sqlite')"""
+    if engine == 'log':
+        return ParticipantLog(log_path, legacy_path=data_file, backend=backend)
+    if engine == 'sqlite':
+        # Пустая база заполняется из журнала: после перехода на журнал participants.json не обновляется
+        legacy_path = log_path if os.path.exists(log_path) else data_file
+        return SQLiteParticipantStore(db_path, legacy_path=legacy_path)
+    raise ValueError(f"Неизвестный движок хранилища: {engine}")
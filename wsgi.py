@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 """
 WSGI-файл для запуска приложения на продакшн-сервере
-Используйте с gunicorn: gunicorn -w 4 -k gevent wsgi:app
+Используйте с gunicorn: gunicorn wsgi:app (настройки воркеров - в gunicorn.conf.py)
 """
 
-from app import app
+from app import create_app
+
+app = create_app()
 
 if __name__ == "__main__":
     app.run() 
\ No newline at end of file